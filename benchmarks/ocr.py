@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""Benchmark of the OCR preprocessing against reading the raw grayscale image.
+
+Run from the repository root with ``python -m benchmarks.ocr``. Needs tesseract to be installed.
+
+Every sample has known text, the accuracy is the similarity of what was read to it, from 0 to 1.
+"""
+import argparse
+import difflib
+import re
+import statistics
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+import pytesseract
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+from charbot import query
+
+
+MEDIA = Path(__file__).parent.parent / "tests" / "charbot" / "media"
+FONT = Path(__file__).parent.parent / "charbot" / "media" / "pools" / "font.ttf"
+LINES = [
+    "Please no backseat gaming, we get enough of it on YouTube comments",
+    "Feel free to use pictures in the chats, but nothing too crude",
+    "Please respect the Mods here, they are good people",
+    "Some language will be deleted, find a way to say it another way",
+]
+
+
+def screenshot(width: int, height: int, size: int, dark: bool = False) -> tuple[bytes, str]:
+    """Draw a screenshot like image with known text.
+
+    Parameters
+    ----------
+    width : int
+        The width of the image.
+    height : int
+        The height of the image, the lines are repeated to fill it.
+    size : int
+        The font size.
+    dark : bool
+        Whether to use light text on a dark background, like discord's dark theme.
+
+    Returns
+    -------
+    tuple[bytes, str]
+        The PNG image and the text in it.
+    """
+    img = Image.new("RGB", (width, height), (54, 57, 63) if dark else (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.truetype(str(FONT), size)
+    lines = []
+    y = size * 2
+    while y + size * 2 < height:
+        line = LINES[len(lines) % len(LINES)]
+        draw.text((size * 2, y), line, fill=(220, 221, 222) if dark else (0, 0, 0), font=font)
+        lines.append(line)
+        y += size * 2
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue(), "\n".join(lines)
+
+
+def samples() -> dict[str, tuple[bytes, str]]:
+    """Get the benchmark images and their text."""
+    return {
+        "pool card": (
+            (MEDIA / "card_test_35_rep.PNG").read_bytes(),
+            "LOREM IPSUM\nPool Level 1\ndolor sit amet, consectetur adipiscing elit, sed\nRep 35/100",
+        ),
+        "small": screenshot(700, 300, 16),
+        "phone screenshot": screenshot(1440, 3200, 48),
+        "dark 4k screenshot": screenshot(3840, 2160, 36, dark=True),
+        "tall chat log": screenshot(1200, 9000, 28),
+    }
+
+
+def baseline(image: BytesIO) -> str:
+    """Read the image the way Query.get_text did before preprocessing, grayscale only."""
+    img = Image.open(image)
+    if getattr(img, "is_animated", False):
+        img.seek(0)
+    return re.sub(r"\n[\n ]*", "\n", pytesseract.image_to_string(ImageOps.grayscale(img)))
+
+
+def accuracy(read: str, expected: str) -> float:
+    """Get how similar the read text is to the expected text, ignoring whitespace differences."""
+    return difflib.SequenceMatcher(None, " ".join(read.split()), " ".join(expected.split())).ratio()
+
+
+def run(reader: Callable[[BytesIO], str], data: bytes, expected: str, repeat: int) -> tuple[float, float]:
+    """Time a reader on a sample, returning the median latency in seconds and the accuracy."""
+    timings = []
+    text = ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = reader(BytesIO(data))
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), accuracy(text, expected)
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per sample, the median latency is reported")
+    parser.add_argument("--workers", type=int, default=2, help="worker processes for the parallel strips reader")
+    args = parser.parse_args()
+    with ProcessPoolExecutor(args.workers) as pool:
+        list(pool.map(int, range(args.workers)))  # start the workers before timing anything
+
+        def parallel(image: BytesIO) -> str:
+            """Read the strips in parallel, like the OCR service does."""
+            return query.join_strips(list(pool.map(query._read_strip, query._prepare_job(image.getvalue()))))
+
+        readers: dict[str, Callable[[BytesIO], str]] = {
+            "baseline": baseline,
+            "preprocessed": query.get_text,
+            "no binarise": lambda image: query.get_text(image, binarise=False),
+            "parallel": parallel,
+        }
+        print(f"{'sample':<20}{'reader':<14}{'latency':>10}{'accuracy':>10}")
+        for name, (data, expected) in samples().items():
+            for reader_name, reader in readers.items():
+                latency, score = run(reader, data, expected, args.repeat)
+                print(f"{name:<20}{reader_name:<14}{latency * 1000:>8.0f}ms{score:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
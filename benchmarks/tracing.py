@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""Benchmark of the Sentry tracing overhead on a message handler, with and without the trace sampler.
+
+Run from the repository root with ``python -m benchmarks.tracing``. Nothing is sent anywhere, the transport drops
+every envelope.
+
+Each message runs in its own transaction, like the bot's event listeners, and does a few awaits and spawns a couple
+of tasks, which the asyncio integration wraps in spans, like the xp path and the listeners it dispatches to.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any
+
+import sentry_sdk
+from sentry_sdk.integrations import asyncio as sentry_asyncio
+from sentry_sdk.transport import Transport
+
+from charbot.tracing import TraceSampler
+
+
+class NullTransport(Transport):
+    """Drops everything."""
+
+    def capture_envelope(self, envelope: Any) -> None:
+        """Drop the envelope."""
+
+    def capture_event(self, event: Any) -> None:  # pragma: no cover
+        """Drop the event."""
+
+
+async def child() -> None:
+    """Stand in for the work a handler hands off, like giving xp."""
+    await asyncio.sleep(0)
+
+
+async def handle_message() -> None:
+    """Stand in for the message listeners, as run by the bot."""
+    with sentry_sdk.start_transaction(op="event", name="event:message"):
+        for _ in range(3):
+            await asyncio.sleep(0)
+        await asyncio.gather(asyncio.create_task(child()), asyncio.create_task(child()))
+
+
+async def messages(count: int) -> float:
+    """Handle messages one after another, returning the mean seconds per message."""
+    start = time.perf_counter()
+    for _ in range(count):
+        await asyncio.create_task(handle_message())
+    return (time.perf_counter() - start) / count
+
+
+def run(options: dict[str, Any], count: int, repeat: int) -> float:
+    """Time the handler under a sentry config, returning the median of the means."""
+    sentry_sdk.init(
+        dsn="https://public@sentry.invalid/1",
+        transport=NullTransport,
+        integrations=[sentry_asyncio.AsyncioIntegration()],
+        **options,
+    )
+    try:
+        return statistics.median(asyncio.run(messages(count)) for _ in range(repeat))
+    finally:
+        sentry_sdk.flush()
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000, help="messages per run")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per config, the median is reported")
+    args = parser.parse_args()
+    configs: dict[str, dict[str, Any]] = {
+        "no tracing": {},
+        "sample all": {"traces_sample_rate": 1.0},
+        "sampler": {"traces_sampler": TraceSampler()},
+    }
+    results = {name: run(options, args.messages, args.repeat) for name, options in configs.items()}
+    baseline = results["no tracing"]
+    print(f"{'config':<14}{'per message':>13}{'overhead':>12}")
+    for name, seconds in results.items():
+        print(f"{name:<14}{seconds * 1e6:>11.1f}us{(seconds - baseline) * 1e6:>10.1f}us")
+
+
+if __name__ == "__main__":
+    main()
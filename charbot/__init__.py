@@ -21,7 +21,32 @@ __all__ = (
     "ComponentInteraction",
     "GuildComponentInteraction",
 )
-__blacklist__ = [f"{__package__}.{item}" for item in ("__main__", "bot", "card", "errors", "types", "translator")]
+__blacklist__ = [
+    f"{__package__}.{item}"
+    for item in (
+        "__main__",
+        "avatars",
+        "bot",
+        "cache",
+        "card",
+        "error_stats",
+        "errors",
+        "import_profile",
+        "logs",
+        "metrics",
+        "render",
+        "scheduler",
+        "sql",
+        "sql_stats",
+        "stacks",
+        "startup",
+        "tracing",
+        "types",
+        "translator",
+        "watchdog",
+        "webhooks",
+    )
+]
 
 EXTENSIONS = [module.name for module in iter_modules(__path__, f"{__package__}.") if module.name not in __blacklist__]
 T = TypeVar("T", bound="CBot")
@@ -42,6 +67,10 @@ class _Config:
 
     Both of these will return the value of the key in the config _file, or raise the appropriate error as if trying to
         access a nonexistent key in a dict, or incorrect slicing of a str/int.
+
+    Optional sections can be checked for first with:
+
+    "section" in Config
     """
 
     __instance__: "_Config"
@@ -64,6 +93,10 @@ class _Config:
     def __getitem__(self, item: str) -> dict[str, Any]:
         return self.get(item)  # pyright: ignore[reportGeneralTypeIssues]
 
+    def __contains__(self, item: str) -> bool:
+        """Check if the config file has a section, without logging an error when it doesn't like getting it would."""
+        return item in self.get()  # pyright: ignore[reportGeneralTypeIssues]
+
     @_functools.cache
     def get(self, *args: str) -> str | int | dict[str, Any]:
         """Get a config key"""
@@ -93,7 +126,7 @@ class _Config:
             )
             raise
         finally:
-            self.logger.info("Got key %s from config file.", ":".join(args))
+            self.logger.debug("Got key %s from config file.", ":".join(args))
 
 
 class Interaction(discord.Interaction, Generic[T]):  # skipcq: PY-D0002
@@ -2,18 +2,18 @@
 # SPDX-FileCopyrightText: 2021 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
 # SPDX-License-Identifier: MIT
 """Charbot discord bot."""
+import argparse
 import asyncio
-import logging.config
 import os
 
 import aiohttp
-import asyncpg
 import discord
 import sentry_sdk
 from sentry_sdk.integrations import asyncio as sentry_asyncio
 from discord.ext import commands
 
-from . import CBot, Config, Tree
+from . import CBot, Config, Tree, logs, sql
+from .tracing import TraceSampler
 
 
 # noinspection PyBroadException
@@ -21,15 +21,23 @@ async def main():
     """Run charbot."""
     # set up logging because i'm using `client.start()`, not `client.run()`
     # so i don't get the sane loging defaults set by discord.py
-    logging.config.dictConfig(Config["logging"])  # skipcq: PY-A6006
+    # the configured handlers are written to from a thread, so logging never blocks the loop
+    logging_pipeline = logs.setup(Config["logging"])
+    try:
+        await run()
+    finally:
+        logging_pipeline.stop()
+
+
+async def run():
+    """Run the bot, once logging is set up."""
 
     # Setup sentry.io integration so that exceptions are logged to sentry.io as well.
     sentry_sdk.init(
         dsn=Config["sentry"]["dsn"],
-        # Set traces_sample_rate to 1.0 to capture 100%
-        # of transactions for performance monitoring.
-        # We recommend adjusting this value in production.
-        traces_sample_rate=1.0,
+        # every error is sent, transactions are sampled by what they're for, see charbot.tracing
+        sample_rate=1.0,
+        traces_sampler=TraceSampler.from_config(Config["sentry"].get("traces", {})),
         environment=Config["sentry"]["environment"],
         release=Config["sentry"]["release"],
         send_default_pii=True,
@@ -53,20 +61,41 @@ async def main():
         intents=discord.Intents.all(),
         help_command=None,
         activity=discord.Activity(type=discord.ActivityType.watching, name="over the server"),
-    ) as bot, asyncpg.create_pool(
-        min_size=50,
-        max_size=100,
-        host=Config["postgres"]["host"],
-        user=Config["postgres"]["user"],
-        password=Config["postgres"]["password"],
-        database=Config["postgres"]["database"],
+    ) as bot, sql.create_pool(
+        sql.GENERAL, init=bot.query_stats.installer(sql.GENERAL.name)
     ) as pool, aiohttp.ClientSession() as session:
-        bot.pool = pool
-        bot.session = session
-        await bot.start(Config["discord"]["token"])
+        # the per-message xp path gets its own lane, so it never queues behind commands and admin work
+        async with sql.create_pool(sql.XP, init=bot.query_stats.installer(sql.XP.name)) as xp_pool:
+            bot.pool = pool
+            bot.xp_pool = xp_pool
+            bot.query_stats.explain_pool = pool
+            bot.session = session
+            await bot.start(Config["discord"]["token"])
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m charbot", description="Run charbot.")
+    parser.add_argument(
+        "--import-profile",
+        action="store_true",
+        help="print how long the bot and each extension take to import, then exit",
+    )
+    parser.add_argument(
+        "--render-benchmark",
+        action="store_true",
+        help="print the size and encode time of each kind of image in each encoding, then exit",
+    )
+    args = parser.parse_args()
+    if args.import_profile:
+        from .import_profile import main as import_profile
+
+        import_profile()
+        raise SystemExit(0)
+    if args.render_benchmark:
+        from .render import benchmark, format_benchmark, sample_jobs
+
+        print(format_benchmark(benchmark(sample_jobs())))
+        raise SystemExit(0)
     print("Starting charbot...")
     if os.name != "nt":
         import uvloop
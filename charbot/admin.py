@@ -76,6 +76,59 @@ class Admin(commands.Cog):
             f"{database * 1000:.2f}ms\nWebsocket: {self.bot.latency * 1000:.2f}ms"
         )
 
+    @commands.command()
+    async def sqlstats(self, ctx: commands.Context, limit: int = 10):
+        """Show the statements that took the most database time since startup.
+
+        Parameters
+        ----------
+        self : Admin
+            The Admin cog object.
+        ctx : Context
+            The context of the command.
+        limit : int
+            How many statements to show.
+        """
+        report = self.bot.query_stats.format(limit)
+        await ctx.send(f"```\n{report[:1980]}\n```")
+
+    @commands.command()
+    async def stalls(self, ctx: commands.Context, limit: int = 5):
+        """Show the event loop lag, and the code that blocked the loop for longest since startup.
+
+        Parameters
+        ----------
+        self : Admin
+            The Admin cog object.
+        ctx : Context
+            The context of the command.
+        limit : int
+            How many places to show.
+        """
+        report = self.bot.watchdog.format(limit)
+        await ctx.send(f"```\n{report[:1980]}\n```")
+
+    @commands.command()
+    async def errorstats(self, ctx: commands.Context, fingerprint: str | None = None):
+        """Show the errors that happened most since startup, or the latest kept example of one.
+
+        Parameters
+        ----------
+        self : Admin
+            The Admin cog object.
+        ctx : Context
+            The context of the command.
+        fingerprint : str | None
+            The fingerprint of the error to show an example of, None for the report.
+        """
+        if fingerprint is None:
+            report = self.bot.error_stats.format()
+        elif (example := self.bot.error_stats.example(fingerprint)) is not None:
+            report = example.format()[-1980:]
+        else:
+            report = f"No recent example of {fingerprint} kept."
+        await ctx.send(f"```\n{report[:1980]}\n```")
+
     @commands.hybrid_group(name="sensitive")
     @app_commands.guild_only()
     async def sensitive(self, ctx: commands.Context):
@@ -218,6 +271,7 @@ class Admin(commands.Cog):
                 member.id,
             )
             wins = await conn.fetchrow("SELECT wins FROM winners WHERE id = $1", member.id)
+        self.bot.invalidate_user_stats(member.id)
         await interaction.response.send_message(
             f"Confirmed {member.name}#{member.discriminator} (ID: {member.id}) as having won a giveaway,"
             f" ({wins}/3 this month for them)",
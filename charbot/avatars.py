@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""Avatar cache shared by the image renderers."""
+import asyncio
+import logging
+import pathlib
+import time
+from io import BytesIO
+
+import aiohttp
+import discord
+from PIL import Image
+
+from .cache import LRUCache
+
+
+__all__ = ("AvatarCache",)
+_LOGGER = logging.getLogger("charbot.avatars")
+
+
+def _cdn_size(size: int) -> int:
+    """Get the smallest size discord's CDN serves that is at least `size`, they have to be powers of 2."""
+    cdn = 16
+    while cdn < size and cdn < 4096:
+        cdn *= 2
+    return cdn
+
+
+def _decode(data: bytes, size: int) -> Image.Image:
+    """Decode an avatar and resize it, in a thread."""
+    img = Image.open(BytesIO(data))
+    if getattr(img, "is_animated", False):
+        img.seek(0)
+    img = img.convert("RGBA")
+    if img.size != (size, size):
+        img = img.resize((size, size), Image.Resampling.LANCZOS)
+    return img
+
+
+class AvatarCache:
+    """Downloads avatars once and hands out decoded, already resized images.
+
+    Avatars are keyed by their hash and the size they're wanted at, so a changed avatar is a new key, and nothing has
+    to be invalidated. Recently used images are kept decoded in memory, and the downloaded files are optionally kept
+    on disk, so a restart doesn't need to download them all again.
+
+    The images handed out are shared, renderers must copy them before drawing on them.
+
+    Parameters
+    ----------
+    session : aiohttp.ClientSession
+        The session to download avatars with.
+    maxsize : int
+        The most decoded avatars to keep in memory.
+    disk_path : pathlib.Path | None
+        The directory to keep downloaded avatars in, None to not keep them on disk.
+
+    Attributes
+    ----------
+    memory : LRUCache[tuple[str, int], Image.Image]
+        The decoded avatars, by avatar key and size.
+    disk_path : pathlib.Path | None
+        The directory downloaded avatars are kept in.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, maxsize: int = 256, disk_path: pathlib.Path | None = None):
+        self.session = session
+        self.memory: LRUCache[tuple[str, int], Image.Image] = LRUCache(maxsize)
+        self.disk_path = disk_path
+        self._in_flight: dict[tuple[str, int], asyncio.Future[Image.Image]] = {}
+        if disk_path is not None:
+            disk_path.mkdir(parents=True, exist_ok=True)
+
+    def _disk_file(self, key: str, cdn_size: int) -> pathlib.Path | None:
+        return None if self.disk_path is None else self.disk_path / f"{key}_{cdn_size}.png"
+
+    async def _load(self, asset: discord.Asset, size: int) -> Image.Image:
+        cdn_size = _cdn_size(size)
+        file = self._disk_file(asset.key, cdn_size)
+        data: bytes | None = None
+        if file is not None:
+            try:
+                data = await asyncio.to_thread(file.read_bytes)
+            except FileNotFoundError:
+                data = None
+        if data is None:
+            url = asset.replace(size=cdn_size, format="png", static_format="png").url
+            async with self.session.get(url) as response:
+                response.raise_for_status()
+                data = await response.read()
+            if file is not None:
+                try:
+                    await asyncio.to_thread(file.write_bytes, data)
+                except OSError:  # pragma: no cover
+                    _LOGGER.warning("Couldn't write avatar %s to the disk cache", asset.key, exc_info=True)
+        return await asyncio.to_thread(_decode, data, size)
+
+    async def get(self, asset: discord.Asset, size: int) -> Image.Image:
+        """Get an avatar, decoded and resized.
+
+        Parameters
+        ----------
+        asset : discord.Asset
+            The avatar, usually a member's display_avatar.
+        size : int
+            The width and height to resize it to.
+
+        Returns
+        -------
+        Image.Image
+            The avatar, as an RGBA image. Shared, so copy it before drawing on it.
+        """
+        key = (asset.key, size)
+        if (cached := self.memory.get(key)) is not None:
+            return cached
+        if (future := self._in_flight.get(key)) is not None:
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            img = await self._load(asset, size)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception()  # retrieved by whoever else was waiting, if anyone
+            raise
+        else:
+            self.memory[key] = img
+            future.set_result(img)
+            return img
+        finally:
+            del self._in_flight[key]
+
+    def prune_disk(self, max_age: float = 60 * 60 * 24 * 30) -> int:
+        """Delete avatars that haven't been downloaded or used from disk in a while.
+
+        Parameters
+        ----------
+        max_age : float
+            How many seconds old a file has to be to be deleted, by its last access time.
+
+        Returns
+        -------
+        int
+            How many files were deleted.
+        """
+        if self.disk_path is None:
+            return 0
+        cutoff = time.time() - max_age
+        deleted = 0
+        for file in self.disk_path.glob("*.png"):
+            stat = file.stat()
+            if max(stat.st_atime, stat.st_mtime) < cutoff:
+                file.unlink(missing_ok=True)
+                deleted += 1
+        return deleted
@@ -5,7 +5,7 @@
 # SPDX-License-Identifier: MIT
 
 """Banner code."""
-import asyncio
+import functools
 from collections.abc import Iterable
 from io import BytesIO
 from pathlib import Path
@@ -17,12 +17,19 @@ from discord import Color
 from PIL import Image, ImageDraw, ImageFont
 
 from ._types import BannerStatus
+from ..avatars import AvatarCache
+from ..cache import LRUCache
+from ..render import BannerJob, RenderService, filename
 
 
 FONT: Final = ImageFont.truetype("charbot/media/pools/font.ttf", 30)
 FONT_QUOTE: Final = ImageFont.truetype("charbot/media/pools/font.ttf", 20)
 BASE_PATH: Final[Path] = Path(__file__).parent / "user_assets"
 STAR_COLOR: Final[tuple[int, int, int]] = (69, 79, 191)
+SIZE: Final[tuple[int, int]] = (1000, 250)
+BANNER_FILENAME: Final[str] = filename(BannerJob, "banner")
+# Rendered banners, by (user id, quote, color, avatar key, display name, prestige)
+BANNER_CACHE: Final[LRUCache[tuple[int, str, str | None, str, str, int], bytes]] = LRUCache(128)
 
 
 def interpolate(f_co: tuple[int, int, int], t_co: tuple[int, int, int], interval: int) -> Iterable[list[int]]:
@@ -58,6 +65,43 @@ def interpolate(f_co: tuple[int, int, int], t_co: tuple[int, int, int], interval
         yield [round(f + det * i) for f, det in zip(f_co, det_co)]
 
 
+def gradient(start: Color, end: Color, size: tuple[int, int] = SIZE) -> Image.Image:
+    """Draw a diagonal gradient, running from the top left corner.
+
+    Every pixel takes the color at `x + y` of a 2000 step interpolation between the colors, the same as drawing each
+    of the 2000 anti diagonals as a line, but done as a single lookup into the interpolated colors.
+
+    Parameters
+    ----------
+    start : Color
+        The color in the top left corner.
+    end : Color
+        The color the gradient runs towards.
+    size : tuple[int, int]
+        The width and height of the image.
+
+    Returns
+    -------
+    Image.Image
+        The gradient, as an RGBA image.
+    """
+    import numpy as np  # only needed for gradient backgrounds, so it's imported the first time one is drawn
+
+    width, height = size
+    lut = np.array(list(interpolate(start.to_rgb(), end.to_rgb(), 2000)), dtype=np.uint8)
+    lut = np.concatenate((lut, np.full((len(lut), 1), 255, dtype=np.uint8)), axis=1)
+    diagonals = np.add.outer(np.arange(height), np.arange(width))
+    return Image.fromarray(lut[np.minimum(diagonals, len(lut) - 1)], "RGBA")
+
+
+@functools.cache
+def _profile_mask(size: tuple[int, int] = SIZE) -> Image.Image:
+    """The mask cutting the profile picture to a circle, built once."""
+    mask = Image.new("RGBA", size, 0)
+    ImageDraw.Draw(mask).ellipse((65, 65, 193, 193), fill=(255, 25, 255, 255))
+    return mask
+
+
 def prestige_positions(prestige: int) -> Iterable[tuple[int, int, int]]:
     """Get the positions for the prestige stars
 
@@ -78,9 +122,27 @@ def prestige_positions(prestige: int) -> Iterable[tuple[int, int, int]]:
 
 
 def banner(
-    base: Path | Color | tuple[Color, Color], username: str, profile: BytesIO, quote: str, prestige: int
+    base: Path | Color | tuple[Color, Color], username: str, profile: BytesIO | Image.Image, quote: str, prestige: int
 ) -> BytesIO:
-    """Create a banner image.
+    """Create a banner image, as a PNG.
+
+    See :func:`draw_banner` for the parameters.
+
+    Returns
+    -------
+    BytesIO
+        The banner image.
+    """
+    res = BytesIO()
+    draw_banner(base, username, profile, quote, prestige).save(res, format="PNG")
+    res.seek(0)
+    return res
+
+
+def draw_banner(
+    base: Path | Color | tuple[Color, Color], username: str, profile: BytesIO | Image.Image, quote: str, prestige: int
+) -> Image.Image:
+    """Draw a banner.
 
     Parameters
     ----------
@@ -88,8 +150,8 @@ def banner(
         The file, color, or gradient to use as the base.
     username : str
         The username of the member who owns the banner.
-    profile : BytesIO
-        The profile of the member who owns the banner.
+    profile : BytesIO | Image.Image
+        The profile picture of the member who owns the banner, 128x128.
     quote : str
         The quote to display.
     prestige : int
@@ -97,8 +159,8 @@ def banner(
 
     Returns
     -------
-    BytesIO
-        The banner image.
+    Image.Image
+        The banner.
 
     Raises
     ------
@@ -111,15 +173,12 @@ def banner(
         except (OSError, ValueError, TypeError) as e:  # pragma: no cover
             raise ValueError("Invalid base image") from e
         else:
-            if img.size != (1000, 250):
-                img = img.resize((1000, 250))
+            if img.size != SIZE:  # bases saved before they were resized on upload
+                img = img.resize(SIZE)
     elif isinstance(base, Color):
-        img = Image.new("RGBA", (1000, 250), base.to_rgb())
+        img = Image.new("RGBA", SIZE, base.to_rgb())
     else:
-        img = Image.new("RGBA", (1000, 250), 0)
-        draw = ImageDraw.Draw(img)
-        for i, color in enumerate(interpolate(base[0].to_rgb(), base[1].to_rgb(), 2000)):
-            draw.line([(i, 0), (0, i)], tuple(color), width=1)
+        img = gradient(*base)
     draw = ImageDraw.Draw(img)
     for pos in prestige_positions(prestige):
         draw.regular_polygon(pos, 3, rotation=0, fill=STAR_COLOR, outline=STAR_COLOR)
@@ -134,33 +193,53 @@ def banner(
     )
     draw.text((20, 15), username, fill=(255, 255, 255), font=FONT, anchor="la", align="left")
     profile_pic_holder = Image.new("RGBA", img.size, (255, 255, 255, 0))  # Is used for a blank image so that I can mask
-    mask = Image.new("RGBA", img.size, 0)
-    mask_draw = ImageDraw.Draw(mask)
-    mask_draw.ellipse((65, 65, 193, 193), fill=(255, 25, 255, 255))  # The part need to be cropped
-    profile_pic_holder.paste(Image.open(profile), (65, 65, 193, 193))
-    img.paste(profile_pic_holder, None, mask)
-    res = BytesIO()
-    img.save(res, format="PNG")
-    res.seek(0)
-    return res
+    profile_pic_holder.paste(Image.open(profile) if isinstance(profile, BytesIO) else profile, (65, 65, 193, 193))
+    img.paste(profile_pic_holder, None, _profile_mask(img.size))
+    return img
 
 
-async def generate_banner(payload: BannerStatus, member: discord.Member) -> BytesIO:  # pragma: no cover
+def invalidate_banner(user_id: int) -> None:
+    """Drop the cached banners of a user, for when they change their banner.
+
+    Parameters
+    ----------
+    user_id : int
+        The user whose banners to drop.
+    """
+    for key in [key for key in BANNER_CACHE if key[0] == user_id]:
+        del BANNER_CACHE[key]
+
+
+async def generate_banner(
+    payload: BannerStatus, member: discord.Member, avatars: AvatarCache, renderer: RenderService
+) -> BytesIO:  # pragma: no cover
     """Generate a banner image.
 
+    Banners are cached, and only rendered again when the banner, or the member's avatar or name, changes.
+
     Parameters
     ----------
     payload : BannerStatus
         The infor about the banner being generated
     member : discord.Member
         The member who owns the banner.
+    avatars : AvatarCache
+        The cache to get the member's avatar from.
+    renderer : RenderService
+        The workers to render the banner in.
     """
-    with BytesIO(await member.display_avatar.replace(size=128, format="png", static_format="png").read()) as profile:
-        return await asyncio.to_thread(
-            banner,
+    avatar = member.display_avatar
+    key = (member.id, payload["quote"], payload["color"], avatar.key, member.display_name, 0)
+    if (cached := BANNER_CACHE.get(key)) is not None:
+        return BytesIO(cached)
+    res = await renderer.render(
+        BannerJob(
             Color.from_str(payload["color"]) if payload["color"] is not None else BASE_PATH / f"{member.id}.png",
             member.display_name,
-            profile,
+            await avatars.get(avatar, 128),
             payload["quote"],
             0,
         )
+    )
+    BANNER_CACHE[key] = res.getvalue()
+    return res
@@ -19,7 +19,7 @@ from discord import app_commands, utils
 from discord.ext import commands
 
 from . import ColorOpts, views
-from .banner import generate_banner
+from .banner import BANNER_CACHE, BANNER_FILENAME, SIZE, generate_banner, invalidate_banner
 from ._types import BannerStatus, BannerStatusPoints
 from .. import GuildInteraction as Interaction, CBot
 
@@ -32,6 +32,7 @@ class Betas(commands.Cog):
 
     def __init__(self, bot: CBot):  # pragma: no cover
         self.bot = bot
+        bot.metrics.caches["banner"] = BANNER_CACHE
 
     beta = app_commands.Group(
         name="beta",
@@ -59,8 +60,8 @@ class Betas(commands.Cog):
                     and banner_rec["approved"]
                     and banner_rec["points"] > 50
                 ):
-                    banner_bytes = await generate_banner(banner_rec, member)
-                    banner_file = discord.File(banner_bytes, filename="banner.png")
+                    banner_bytes = await generate_banner(banner_rec, member, self.bot.avatars, self.bot.renderer)
+                    banner_file = discord.File(banner_bytes, filename=BANNER_FILENAME)
                     await message.reply(file=banner_file)
                     await conn.execute(
                         "UPDATE banners SET cooldown = $1 WHERE user_id = $2",
@@ -119,6 +120,8 @@ class Betas(commands.Cog):
                     def sync_code(img: bytes, path: Path):
                         """Blocking code to run in an executor"""
                         image = Image.open(BytesIO(img))
+                        if image.size != SIZE:  # stored at banner size, so renders don't resize it every time
+                            image = image.resize(SIZE)
                         image.save(path, format="PNG")
 
                     await asyncio.to_thread(
@@ -149,6 +152,9 @@ class Betas(commands.Cog):
                 "UPDATE users SET points = points - 350 WHERE id = $1 RETURNING points", interaction.user.id
             )
             await interaction.followup.send(f"You now have {remaining} rep remaining.\nYou have requested a banner!")
+        # once committed, so a render or read in between can't cache the old banner or stats
+        invalidate_banner(interaction.user.id)
+        self.bot.invalidate_user_stats(interaction.user.id)
 
     @banner.command()  # pyright: ignore[reportGeneralTypeIssues]
     async def status(self, interaction: Interaction[CBot]) -> None:
@@ -171,8 +177,10 @@ class Betas(commands.Cog):
         if banner_rec["approved"] is False:
             await interaction.followup.send("Your banner_rec is still pending approval!")
             return
-        banner_bytes = await generate_banner(banner_rec, interaction.user)
-        banner_file = discord.File(banner_bytes, filename="banner.png")
+        banner_bytes = await generate_banner(
+            banner_rec, interaction.user, interaction.client.avatars, interaction.client.renderer
+        )
+        banner_file = discord.File(banner_bytes, filename=BANNER_FILENAME)
         await interaction.followup.send(
             f"Your banner has been approved and is as follows! Cooldown until: "
             f"{utils.format_dt(banner_rec['cooldown'], 'R')}",
@@ -196,10 +204,10 @@ class Betas(commands.Cog):
             return
         guild = cast(discord.Guild, ctx.guild)
         requester = guild.get_member(banner_rec["user_id"]) or await guild.fetch_member(banner_rec["user_id"])
-        banner_bytes = await generate_banner(banner_rec, requester)
+        banner_bytes = await generate_banner(banner_rec, requester, ctx.bot.avatars, ctx.bot.renderer)
         await ctx.reply(
             "Approve, deny, or cancel?",
-            file=discord.File(banner_bytes, filename="banner.png"),
+            file=discord.File(banner_bytes, filename=BANNER_FILENAME),
             view=views.banner.ApprovalView(banner_rec, member.id),
         )
         banner_bytes.close()
@@ -2,8 +2,13 @@
 # SPDX-FileCopyrightText: 2021 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
 # SPDX-License-Identifier: MIT
 """Charbot discord bot."""
+import asyncio
 import datetime
 import logging
+import pathlib
+import sys
+import time
+from collections.abc import Callable, Coroutine, Iterator
 from typing import Any, ClassVar, Final, TypeVar
 from typing_extensions import Self
 from zoneinfo import ZoneInfo
@@ -11,19 +16,38 @@ from zoneinfo import ZoneInfo
 import aiohttp
 import asyncpg
 import discord
+import sentry_sdk
 from discord import app_commands, Locale
 from discord.app_commands import locale_str, TranslationContext, TranslationContextLocation
 from discord.ext import commands
 from discord.utils import MISSING
 from fluent.runtime import FluentResourceLoader
 
-from . import Config, EXTENSIONS, errors
+from . import Config, EXTENSIONS, errors, sql
+from .avatars import AvatarCache
+from .cache import TTLCache
+from .error_stats import ErrorAggregator
+from .metrics import BotMetrics, Family, MetricsServer
+from .render import RenderQueueFull, RenderService
+from .scheduler import Scheduler
+from .sql_stats import QUERY_TAG, QueryStats
+from .startup import StartupReport
 from .translator import Translator
+from .watchdog import Watchdog
+from .webhooks import WebhookSink
 
 
 _VT = TypeVar("_VT")
 
 
+def _app_command_name(command: app_commands.Command[Any, ..., Any] | app_commands.ContextMenu | None) -> str:
+    """Name an application command by its cog and qualified name, like ``Admin.sensitive add``."""
+    if command is None:
+        return "unknown"
+    binding = getattr(command, "binding", None)  # context menus can't be in a cog
+    return f"{binding.qualified_name if isinstance(binding, commands.Cog) else 'bot'}.{command.qualified_name}"
+
+
 class Holder(dict[str, Any]):
     """Holder for data."""
 
@@ -149,37 +173,239 @@ class CBot(commands.Bot):
     def __init__(self, *args: Any, strip_after_prefix: bool = True, tree_cls: type["Tree"], **kwargs: Any) -> None:
         super().__init__(*args, strip_after_prefix=strip_after_prefix, tree_cls=tree_cls, **kwargs)
         self.pool: asyncpg.Pool[Any] = MISSING
+        self.xp_pool: asyncpg.Pool[Any] = MISSING
         self.session: aiohttp.ClientSession = MISSING
+        self.avatars: AvatarCache = MISSING
+        self.scheduler: Scheduler = MISSING
+        self.renderer: RenderService = MISSING
         self.program_logs: discord.Webhook = MISSING
         self.error_logs: discord.Webhook = MISSING
         self.giveaway_webhook: discord.Webhook = MISSING
+        self.program_log_sink: WebhookSink = MISSING
+        self.error_log_sink: WebhookSink = MISSING
         self.holder: Holder = Holder()
         self.localizer_loader = FluentResourceLoader("i18n/{locale}")
         self.no_dms: set[int] = set()
+        self.user_stats_cache: TTLCache[int, asyncpg.Record | None] = TTLCache(10)
+        self.startup: StartupReport = StartupReport()
+        self.query_stats: QueryStats = QueryStats()
+        self.metrics: BotMetrics = BotMetrics()
+        self.metrics.register(self._collect_metrics)
+        self.metrics_server: MetricsServer | None = None
+        self.watchdog: Watchdog = Watchdog()
+        self.error_stats: ErrorAggregator = ErrorAggregator()
 
     async def setup_hook(self):
         """Initialize hook for the bot.
 
         This is called when the bot is logged in but before connecting to the websocket.
         It provides an opportunity to perform some initialisation before the websocket is connected.
-        Also loads the cogs, and prints who the bot is logged in as
+        Also loads the cogs, and prints who the bot is logged in as.
+
+        The independent setup steps run concurrently, and so do the extensions, as none of them need another loaded
+        first. Each is timed in the startup report, which is logged once the bot is ready.
         """
         print("Setup started")
-        await self.tree.set_translator(Translator())
-        print("Loaded translator")
-        webhooks = Config["discord"]["webhooks"]
-        self.program_logs = await self.fetch_webhook(webhooks["program_logs"])
-        self.error_logs = await self.fetch_webhook(webhooks["error"])
-        self.giveaway_webhook = await self.fetch_webhook(webhooks["giveaway"])
-        print("Webhooks Fetched")
-        await self.load_extension("jishaku")
-        for extension in EXTENSIONS:
-            await self.load_extension(extension)
+        self.watchdog.start()
+        self.avatars = AvatarCache(self.session, disk_path=pathlib.Path(__file__).parent / "avatar_cache")
+        self.metrics.caches["avatars"] = self.avatars.memory
+        self.scheduler = Scheduler(self.pool)
+        self.scheduler.start(self.wait_until_ready)
+        self.renderer = RenderService()
+        await asyncio.gather(
+            self._set_translator(),
+            self._prune_avatars(),
+            self._fetch_webhooks(),
+            self._start_renderer(),
+            self._start_metrics(),
+        )
+        print("Translator loaded, webhooks fetched, render workers and metrics started")
+        with self.startup.phase("extensions"):
+            results = await asyncio.gather(
+                self._load_extension("jishaku"),
+                *(self._load_extension(extension) for extension in EXTENSIONS),
+                return_exceptions=True,
+            )
+        if failures := [result for result in results if isinstance(result, BaseException)]:
+            raise failures[0]
         print("Extensions loaded")
         user = self.user
         assert isinstance(user, discord.ClientUser)  # skipcq: BAN-B101
         print(f"Logged in: {user.name}#{user.discriminator}")
 
+    async def _set_translator(self) -> None:
+        with self.startup.phase("translator"):
+            await self.tree.set_translator(Translator())
+
+    async def _prune_avatars(self) -> None:
+        with self.startup.phase("avatar cache prune"):
+            await asyncio.to_thread(self.avatars.prune_disk)
+
+    async def _start_renderer(self) -> None:
+        with self.startup.phase("render workers"):
+            await self.renderer.start()
+
+    async def _start_metrics(self) -> None:
+        with self.startup.phase("metrics endpoint"):
+            if "metrics" not in Config:
+                logging.getLogger("charbot.metrics").info("No [metrics] section in the config, not serving metrics")
+                return
+            settings = Config["metrics"]
+            self.metrics_server = MetricsServer(self.metrics, settings.get("host", "127.0.0.1"), settings["port"])
+            await self.metrics_server.start()
+
+    async def _fetch_webhooks(self) -> None:
+        with self.startup.phase("webhooks"):
+            webhooks = Config["discord"]["webhooks"]
+            self.program_logs, self.error_logs, self.giveaway_webhook = await asyncio.gather(
+                self.fetch_webhook(webhooks["program_logs"]),
+                self.fetch_webhook(webhooks["error"]),
+                self.fetch_webhook(webhooks["giveaway"]),
+            )
+            self.program_log_sink = WebhookSink(self.program_logs)
+            self.error_log_sink = WebhookSink(self.error_logs)
+            self.program_log_sink.start()
+            self.error_log_sink.start()
+
+    async def _load_extension(self, name: str) -> None:
+        with self.startup.extension(name):
+            await self.load_extension(name)
+
+    def dispatch(self, event_name: str, /, *args: Any, **kwargs: Any) -> None:
+        """Dispatch an event, tagging the queries its listeners run with the event."""
+        token = QUERY_TAG.set(f"event:{event_name}")
+        try:
+            super().dispatch(event_name, *args, **kwargs)
+        finally:
+            QUERY_TAG.reset(token)
+
+    async def _run_event(
+        self, coro: Callable[..., Coroutine[Any, Any, Any]], event_name: str, *args: Any, **kwargs: Any
+    ) -> None:
+        # every listener, the cogs' included, is run through here, so this times and traces them all
+        event = event_name.removeprefix("on_")
+        start = time.perf_counter()
+        try:
+            with sentry_sdk.start_transaction(op="event", name=f"event:{event}"):
+                await super()._run_event(coro, event_name, *args, **kwargs)
+        finally:
+            self.metrics.events.labels(event).observe(time.perf_counter() - start)
+
+    def _collect_metrics(self) -> Iterator[Family[Any]]:
+        """Read the metrics the bot's services keep themselves, when they're scraped."""
+        if self.renderer is not MISSING:
+            pending: Family[Any] = Family("charbot_render_pending", "Images waiting for or being rendered.", "gauge")
+            pending.labels().set(self.renderer.pending)
+            renders: Family[Any] = Family(
+                "charbot_render_seconds",
+                "How long images took to render, once a worker was free.",
+                "histogram",
+                ("kind",),
+            )
+            renders.children = {(kind,): timing for kind, timing in self.renderer.timings.items()}
+            yield pending
+            yield renders
+        connections: Family[Any] = Family(
+            "charbot_db_connections",
+            "Open database connections, by pool and whether they're in use.",
+            "gauge",
+            ("lane", "state"),
+        )
+        for lane, pool in ((sql.GENERAL.name, self.pool), (sql.XP.name, self.xp_pool)):
+            if pool is not MISSING:
+                idle = pool.get_idle_size()
+                connections.labels(lane, "idle").set(idle)
+                connections.labels(lane, "busy").set(pool.get_size() - idle)
+        yield connections
+        queries: Family[Any] = Family(
+            "charbot_query_seconds",
+            "How long database statements took, by pool and what ran them.",
+            "histogram",
+            ("lane", "tag"),
+        )
+        for key, histogram in self.query_stats.histograms.items():
+            queries.labels(key.lane, key.tag).merge(histogram)
+        yield queries
+        lag: Family[Any] = Family("charbot_loop_lag_seconds", "How late the event loop heartbeat ran.", "histogram")
+        lag.children[()] = self.watchdog.lag
+        stalls: Family[Any] = Family(
+            "charbot_loop_stalls_total",
+            "Event loop stalls, by where the bot's code was stuck.",
+            "counter",
+            ("location",),
+        )
+        for location, offender in self.watchdog.offenders.items():
+            stalls.labels(location).inc(offender.stalls)
+        yield lag
+        yield stalls
+        logs: Family[Any] = Family(
+            "charbot_webhook_logs_total",
+            "Messages posted to the log webhooks, by webhook and whether they were sent or dropped.",
+            "counter",
+            ("webhook", "outcome"),
+        )
+        for name, sink in (("program", self.program_log_sink), ("error", self.error_log_sink)):
+            if sink is not MISSING:
+                logs.labels(name, "sent").inc(sink.sent)
+                logs.labels(name, "dropped").inc(sink.dropped)
+        yield logs
+        errors_: Family[Any] = Family(
+            "charbot_errors_total", "Errors raised by handlers, by type and where.", "counter", ("error", "location")
+        )
+        for group in self.error_stats.groups.values():
+            errors_.labels(group.error.partition(":")[0], group.location).inc(group.count)
+        yield errors_
+        if self.scheduler is not MISSING:
+            runs: Family[Any] = Family(
+                "charbot_job_runs_total", "Scheduled job runs, by outcome.", "counter", ("job", "outcome")
+            )
+            duration: Family[Any] = Family(
+                "charbot_job_last_seconds", "How long each job's last run took.", "gauge", ("job",)
+            )
+            for name, job in self.scheduler.jobs.items():
+                runs.labels(name, "ok").inc(job.stats.runs - job.stats.failures)
+                runs.labels(name, "failed").inc(job.stats.failures)
+                runs.labels(name, "skipped").inc(job.stats.skipped)
+                runs.labels(name, "misfired").inc(job.stats.misfires)
+                duration.labels(name).set(job.stats.last_duration)
+            yield runs
+            yield duration
+
+    async def invoke(self, ctx: commands.Context[Self], /) -> None:
+        """Invoke a prefix or hybrid command, in its own transaction and tagging the queries it runs with it."""
+        if ctx.command is None:
+            await super().invoke(ctx)
+            return
+        name = f"command:{ctx.command.cog_name or 'bot'}.{ctx.command.qualified_name}"
+        QUERY_TAG.set(name)
+        with sentry_sdk.start_transaction(op="command", name=name):
+            await super().invoke(ctx)
+
+    async def on_ready(self) -> None:
+        """Log the startup report the first time the bot is ready."""
+        if self.startup.ready():
+            self.startup.log()
+
+    async def on_app_command_completion(
+        self, interaction: discord.Interaction, command: app_commands.Command[Any, ..., Any] | app_commands.ContextMenu
+    ) -> None:
+        """Record how long an application command that succeeded took."""
+        self.metrics.command_finished(interaction, "ok")
+
+    async def close(self) -> None:
+        """Stop the jobs, render workers, metrics endpoint and watchdog, send the queued webhook logs, then close."""
+        self.watchdog.stop()
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+        if self.scheduler is not MISSING:
+            await self.scheduler.close()
+        if self.renderer is not MISSING:
+            await self.renderer.close()
+        for sink in (self.program_log_sink, self.error_log_sink):
+            if sink is not MISSING:
+                await sink.close()
+        await super().close()
+
     async def giveaway_user(self, user: int) -> None | asyncpg.Record:
         """Return an asyncpg entry for the user, joined on all 3 tables for the giveaway.
 
@@ -200,6 +426,45 @@ class CBot(commands.Bot):
             user,
         )
 
+    async def user_stats(self, user: int, *, cached: bool = True) -> None | asyncpg.Record:
+        """Return the user's points, bid, daily participation, last claim and wins, from the user_stats view.
+
+        Lookups are cached for a few seconds, and the cache is invalidated by the bot's own writes, so only use
+        ``cached=False`` when the result decides a write.
+
+        Parameters
+        ----------
+        user : int
+            The user id.
+        cached : bool, optional
+            Whether a cached result can be used, defaults to True.
+
+        Returns
+        -------
+        asyncpg.Record, optional
+            The user's stats, or None if the user isn't in the DB.
+        """
+        if cached and user in self.user_stats_cache:
+            return self.user_stats_cache[user]
+        if len(self.user_stats_cache) > 1000:
+            self.user_stats_cache.prune()
+        stats = await self.pool.fetchrow(sql.USER_STATS, user)
+        self.user_stats_cache[user] = stats
+        return stats
+
+    def invalidate_user_stats(self, user: int | None = None) -> None:
+        """Drop a user's cached stats after they change.
+
+        Parameters
+        ----------
+        user : int | None, optional
+            The user id, or None to drop every user's, for changes to everyone like resetting the bids.
+        """
+        if user is None:
+            self.user_stats_cache.clear()
+        else:
+            self.user_stats_cache.pop(user)
+
     async def give_game_points(
         self, member: discord.Member | discord.User, points: int, bonus: int = 0
     ) -> int:  # sourcery skip: compare-via-equals
@@ -221,51 +486,55 @@ class CBot(commands.Bot):
         """
         user_id = member.id
         user = await self.giveaway_user(user_id)
-        if user is None:
-            async with self.pool.acquire() as conn:
-                await conn.execute(
-                    "INSERT INTO users (id, points) VALUES ($1, $2)",
-                    user_id,
-                    points + bonus,
-                )
-                await conn.execute("INSERT INTO bids (id, bid) VALUES ($1, 0)", user_id)
-                await conn.execute(
-                    "INSERT INTO daily_points (id, last_claim, last_particip_dt, particip, won)"
-                    " VALUES ($1, $2, $3, $4, $5)",
-                    user_id,
-                    self.TIME() - datetime.timedelta(days=1),
-                    self.TIME(),
-                    points,
-                    bonus,
-                )
-                await conn.execute("INSERT INTO bids (id, bid) VALUES ($1, 0)", user_id)
-                return points + bonus
-        elif user["particip_dt"] < self.TIME():
-            async with self.pool.acquire() as conn:
-                await conn.execute(
-                    "UPDATE daily_points SET last_particip_dt = $1, particip = $2, won = $3 WHERE id = $4",
-                    self.TIME(),
-                    points,
-                    bonus,
-                    user_id,
-                )
-                await conn.execute("UPDATE users SET points = points + $1 WHERE id = $2", points + bonus, user_id)
-        elif user["particip_dt"] == self.TIME():
-            if user["particip"] + points > 10:
-                real_points = 10 - user["particip"]
-                bonus = -(-(real_points * bonus) // points)
-                points = real_points
-            async with self.pool.acquire() as conn:
-                await conn.execute(
-                    "UPDATE daily_points SET particip = particip + $1, won = won + $2 WHERE id = $3",
-                    points,
-                    bonus,
-                    user_id,
-                )
-                await conn.execute("UPDATE users SET points = points + $1 WHERE id = $2", points + bonus, user_id)
-        else:
-            return 0
-        return points + bonus
+        try:
+            if user is None:
+                async with self.pool.acquire() as conn:
+                    await conn.execute(
+                        "INSERT INTO users (id, points) VALUES ($1, $2)",
+                        user_id,
+                        points + bonus,
+                    )
+                    await conn.execute("INSERT INTO bids (id, bid) VALUES ($1, 0)", user_id)
+                    await conn.execute(
+                        "INSERT INTO daily_points (id, last_claim, last_particip_dt, particip, won)"
+                        " VALUES ($1, $2, $3, $4, $5)",
+                        user_id,
+                        self.TIME() - datetime.timedelta(days=1),
+                        self.TIME(),
+                        points,
+                        bonus,
+                    )
+                    await conn.execute("INSERT INTO bids (id, bid) VALUES ($1, 0)", user_id)
+                    return points + bonus
+            elif user["particip_dt"] < self.TIME():
+                async with self.pool.acquire() as conn:
+                    await conn.execute(
+                        "UPDATE daily_points SET last_particip_dt = $1, particip = $2, won = $3 WHERE id = $4",
+                        self.TIME(),
+                        points,
+                        bonus,
+                        user_id,
+                    )
+                    await conn.execute("UPDATE users SET points = points + $1 WHERE id = $2", points + bonus, user_id)
+            elif user["particip_dt"] == self.TIME():
+                if user["particip"] + points > 10:
+                    real_points = 10 - user["particip"]
+                    bonus = -(-(real_points * bonus) // points)
+                    points = real_points
+                async with self.pool.acquire() as conn:
+                    await conn.execute(
+                        "UPDATE daily_points SET particip = particip + $1, won = won + $2 WHERE id = $3",
+                        points,
+                        bonus,
+                        user_id,
+                    )
+                    await conn.execute("UPDATE users SET points = points + $1 WHERE id = $2", points + bonus, user_id)
+            else:
+                return 0
+            return points + bonus
+        finally:
+            # after the write, so a read in between can't cache the old stats again
+            self.invalidate_user_stats(user_id)
 
     async def translate(
         self, string: locale_str | str, locale: Locale, *, data: Any | None = None, fallback: str | None = None
@@ -370,8 +639,7 @@ class CBot(commands.Bot):
         else:
             await ctx.send(f"An error occurred while running {command.name}, Bluesy has been notified.")
             # All other Errors not returned come here. And we can just print the default TraceBack.
-            await self.error_logs.send(f"{command.name} raised an error: {exception}")
-            logging.getLogger("charbot.commands").error("Ignoring exception in command %s", command, exc_info=exception)
+            self.report_error(exception, f"command {command.qualified_name}", logging.getLogger("charbot.commands"))
 
     async def on_error(self, event_method: str, /, *args: Any, **kwargs: Any) -> None:
         """Event triggered when an error is raised.
@@ -385,8 +653,27 @@ class CBot(commands.Bot):
         kwargs: Any
             The keyword arguments passed to the event.
         """
-        await self.error_logs.send(f"{event_method} raised an error: {args} {kwargs}")
-        logging.getLogger("charbot").exception("Ignoring exception in %s", event_method)
+        self.report_error(sys.exc_info()[1] or RuntimeError(event_method), f"event {event_method}")
+
+    def report_error(self, error: BaseException, context: str, logger: logging.Logger | None = None) -> None:
+        """Count an error, and log it and notify the error webhook if it's new, or happening faster than before.
+
+        Repeats of an error that was already reported are only counted, see the ``errorstats`` admin command for them.
+
+        Parameters
+        ----------
+        error : BaseException
+            The error.
+        context : str
+            What it was raised from, like ``command Admin.ping``.
+        logger : logging.Logger | None
+            The logger to log it to, None for the bot's.
+        """
+        if (group := self.error_stats.record(error, context)) is None:
+            return
+        (logger or logging.getLogger("charbot")).error("Ignoring exception in %s", context, exc_info=error)
+        if self.error_log_sink is not MISSING:
+            self.error_log_sink.post(f"{context} raised {group.summary(self.error_stats.window)}")
 
 
 class Tree(app_commands.CommandTree[CBot]):
@@ -400,6 +687,31 @@ class Tree(app_commands.CommandTree[CBot]):
         self.client: CBot = bot
         self.logger = logging.getLogger("charbot.tree")
 
+    async def interaction_check(self, interaction: discord.Interaction, /) -> bool:
+        """Tag the queries an application command runs with the command, and start timing it.
+
+        Parameters
+        ----------
+        interaction: discord.Interaction
+            The interaction invoking the command.
+
+        Returns
+        -------
+        bool
+            Always True, every command can run.
+        """
+        command = interaction.command
+        if command is not None:
+            QUERY_TAG.set(f"command:{_app_command_name(command)}")
+            self.client.metrics.command_started(interaction)
+        return True
+
+    async def _call(self, interaction: discord.Interaction) -> None:
+        # every application command and autocomplete is run through here, so each gets its own transaction
+        kind = "autocomplete" if interaction.type is discord.InteractionType.autocomplete else "command"
+        with sentry_sdk.start_transaction(op=kind, name=f"{kind}:{_app_command_name(interaction.command)}"):
+            await super()._call(interaction)
+
     async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError) -> None:
         """Event triggered when an error is raised while invoking a command.
 
@@ -411,6 +723,7 @@ class Tree(app_commands.CommandTree[CBot]):
         error: discord.app_commands.AppCommandError
             The Exception raised.
         """
+        self.client.metrics.command_finished(interaction, "error")
         if not interaction.response.is_done():
             await interaction.response.defer(ephemeral=True)
         command = interaction.command
@@ -431,14 +744,20 @@ class Tree(app_commands.CommandTree[CBot]):
                 message = await self.client.translate(
                     "check-failed", interaction.locale, data=data, fallback="You can't use this command."
                 )
+            elif isinstance(error, app_commands.CommandInvokeError) and isinstance(error.original, RenderQueueFull):
+                message = await self.client.translate(
+                    "render-busy",
+                    interaction.locale,
+                    data=data,
+                    fallback="The bot is drawing too many images right now, try again in a moment.",
+                )
             elif isinstance(error, app_commands.CommandInvokeError):
                 message = await self.client.translate(
                     "bad-code", interaction.locale, data=data, fallback="An error occurred, Bluesy has been notified."
                 )
-                self.logger.error("Ignoring exception in command %r", command.name, exc_info=error)
+                self.client.report_error(error, f"command {command.qualified_name}", self.logger)
             else:
                 message = "An error occurred while executing the command."
             await interaction.followup.send(message, ephemeral=True)
         else:
-            await self.client.error_logs.send(f"Ignoring exception in command tree: {error}")
-            self.logger.error("Ignoring exception in command tree", exc_info=error)
+            self.client.report_error(error, "command tree", self.logger)
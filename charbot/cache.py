@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""Small in memory caches shared by the cogs."""
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterator
+from typing import Generic, TypeVar, overload
+
+__all__ = ("LRUCache", "TTLCache")
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+T = TypeVar("T")
+
+
+class LRUCache(Generic[K, V]):
+    """A mapping that holds at most `maxsize` items, evicting the least recently used one first.
+
+    Parameters
+    ----------
+    maxsize : int
+        The maximum amount of items to hold.
+
+    Attributes
+    ----------
+    maxsize : int
+        The maximum amount of items to hold.
+    hits : int
+        How many lookups found their key.
+    misses : int
+        How many lookups didn't find their key.
+    """
+
+    __slots__ = ("maxsize", "hits", "misses", "_data")
+
+    def __init__(self, maxsize: int):
+        self.maxsize: int = maxsize
+        self.hits: int = 0
+        self.misses: int = 0
+        self._data: OrderedDict[K, V] = OrderedDict()
+
+    def __contains__(self, key: object) -> bool:
+        """Check if a key is cached, without counting as a use."""
+        return key in self._data
+
+    def __len__(self) -> int:
+        """Get the amount of cached items."""
+        return len(self._data)
+
+    def __iter__(self) -> Iterator[K]:
+        """Iterate over the cached keys, least recently used first."""
+        return iter(self._data)
+
+    def __getitem__(self, key: K) -> V:
+        """Get a cached item, marking it as recently used."""
+        value = self._data[key]
+        self._data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: K, value: V) -> None:
+        """Cache an item, evicting the least recently used item if the cache is full."""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __delitem__(self, key: K) -> None:
+        """Remove a cached item."""
+        del self._data[key]
+
+    @overload
+    def get(self, key: K) -> V | None:
+        ...
+
+    @overload
+    def get(self, key: K, default: T) -> V | T:
+        ...
+
+    def get(self, key: K, default: T | None = None) -> V | T | None:
+        """Get a cached item, or a default if it isn't cached.
+
+        Parameters
+        ----------
+        key : K
+            The key to look up.
+        default : T | None
+            The value to return if the key isn't cached.
+
+        Returns
+        -------
+        V | T | None
+            The cached item or the default.
+        """
+        try:
+            value = self[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def pop(self, key: K, default: T | None = None) -> V | T | None:
+        """Remove a cached item and return it, or a default if it isn't cached.
+
+        Parameters
+        ----------
+        key : K
+            The key to remove.
+        default : T | None
+            The value to return if the key isn't cached.
+
+        Returns
+        -------
+        V | T | None
+            The removed item or the default.
+        """
+        return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        """Remove every cached item."""
+        self._data.clear()
+
+
+class TTLCache(Generic[K, V]):
+    """A mapping whose items expire a fixed time after they were set.
+
+    Expired items are dropped lazily on access, and in bulk by `prune`.
+
+    Parameters
+    ----------
+    ttl : float
+        How many seconds items live for.
+    timer : Callable[[], float]
+        The clock to use, defaults to time.monotonic.
+
+    Attributes
+    ----------
+    ttl : float
+        How many seconds items live for.
+    """
+
+    __slots__ = ("ttl", "_timer", "_data")
+
+    def __init__(self, ttl: float, timer: Callable[[], float] = time.monotonic):
+        self.ttl: float = ttl
+        self._timer = timer
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def __contains__(self, key: object) -> bool:
+        """Check if a key is set and hasn't expired."""
+        try:
+            expires, _ = self._data[key]  # type: ignore
+        except KeyError:
+            return False
+        if expires <= self._timer():
+            del self._data[key]  # type: ignore
+            return False
+        return True
+
+    def __len__(self) -> int:
+        """Get the amount of items, including expired ones that haven't been pruned yet."""
+        return len(self._data)
+
+    def __getitem__(self, key: K) -> V:
+        """Get an item, raising KeyError if it isn't set or has expired."""
+        if key not in self:
+            raise KeyError(key)
+        return self._data[key][1]
+
+    def __setitem__(self, key: K, value: V) -> None:
+        """Set an item, resetting its time to live."""
+        self._data[key] = (self._timer() + self.ttl, value)
+        self._data.move_to_end(key)
+
+    def __delitem__(self, key: K) -> None:
+        """Remove an item."""
+        del self._data[key]
+
+    def get(self, key: K, default: T | None = None) -> V | T | None:
+        """Get an item, or a default if it isn't set or has expired.
+
+        Parameters
+        ----------
+        key : K
+            The key to look up.
+        default : T | None
+            The value to return if the key isn't set.
+
+        Returns
+        -------
+        V | T | None
+            The item or the default.
+        """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key: K, default: T | None = None) -> V | T | None:
+        """Remove an item and return it, or a default if it isn't set or has expired.
+
+        Parameters
+        ----------
+        key : K
+            The key to remove.
+        default : T | None
+            The value to return if the key isn't set.
+
+        Returns
+        -------
+        V | T | None
+            The removed item or the default.
+        """
+        value = self.get(key, default)
+        self._data.pop(key, None)
+        return value
+
+    def prune(self) -> int:
+        """Drop every expired item.
+
+        Returns
+        -------
+        int
+            How many items were dropped.
+        """
+        now = self._timer()
+        dropped = 0
+        # items are kept in the order they were set, and they all live as long, so the expired ones are at the front
+        while self._data:
+            key, (expires, _) = next(iter(self._data.items()))
+            if expires > now:
+                break
+            del self._data[key]
+            dropped += 1
+        return dropped
+
+    def clear(self) -> None:
+        """Remove every item."""
+        self._data.clear()
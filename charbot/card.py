@@ -2,6 +2,7 @@
 # SPDX-FileCopyrightText: 2021 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
 # SPDX-License-Identifier: MIT
 """Card generator for Charbot."""
+import functools
 import math
 import pathlib
 from io import BytesIO
@@ -10,7 +11,7 @@ from typing import Callable, Final
 from discord.utils import MISSING
 from PIL import Image, ImageDraw, ImageFont
 
-__all__ = ("generate_card",)
+__all__ = ("generate_card", "draw_card", "generate_profile", "draw_profile")
 __BASE_PATH__: Final[pathlib.Path] = pathlib.Path(__file__).parent / "media/pools"
 __DEFAULT_BG__: Final[pathlib.Path] = __BASE_PATH__ / "card.png"
 __DEFAULT_PROFILE__: Final[pathlib.Path] = __BASE_PATH__ / "profile.png"
@@ -22,12 +23,20 @@ __STREAMING__: Final[pathlib.Path] = __BASE_PATH__ / "streaming.png"
 __FONT__: Final[str] = str(__BASE_PATH__ / "font2.ttf")
 __SMALL_FONT__: Final[ImageFont.FreeTypeFont] = ImageFont.truetype(str(__BASE_PATH__ / "font.ttf"), 20)
 __NORMAL_FONT__: Final[ImageFont.FreeTypeFont] = ImageFont.truetype(__FONT__, 36)
+__RANK_FONT__: Final[ImageFont.FreeTypeFont] = ImageFont.truetype(str(__BASE_PATH__ / "font.ttf"), 36)
 # noinspection PyUnusedLocal
 __SIGNA_FONT__: Final[ImageFont.FreeTypeFont] = ImageFont.truetype(__FONT__, 25)  # noqa: F841
 __WHITE__: Final[tuple[int, int, int]] = (255, 255, 255)
 __DARK__: Final[tuple[int, int, int]] = (252, 179, 63)
 # noinspection PyUnusedLocal
 __YELLOW__: Final[tuple[int, int, int]] = (255, 234, 167)  # noqa: F841
+__STATUSES__: Final[dict[str, pathlib.Path]] = {
+    "online": __ONLINE__,
+    "offline": __OFFLINE__,
+    "idle": __IDLE__,
+    "dnd": __DND__,
+    "streaming": __STREAMING__,
+}
 __XP_AS_STR__: Final[Callable[[int], str]] = (
     lambda xp: str(xp) if xp < 1000 else f"{xp / 1000:.1f}k" if xp < 1000000 else f"{xp / 1000000:.1f}M"
 )  # noqa: F731
@@ -36,15 +45,49 @@ __XP_AS_STR__: Final[Callable[[int], str]] = (
 def generate_card(
     *,
     bg_image: BytesIO = MISSING,
-    profile_image: BytesIO = MISSING,
+    profile_image: BytesIO | Image.Image = MISSING,
     level: int = 1,
     base_rep: int = 0,
     current_rep: int = 20,
     completed_rep: int = 100,
     pool_name: str = "Unknown",
     reward: str = "Unknown",
-):
-    """Generate a card.
+) -> BytesIO:
+    """Generate a card, as a PNG.
+
+    See :func:`draw_card` for the parameters.
+
+    Returns
+    -------
+    BytesIO
+        The card image as a buffered stream of I/O Bytes.
+    """
+    return _png(
+        draw_card(
+            bg_image=bg_image,
+            profile_image=profile_image,
+            level=level,
+            base_rep=base_rep,
+            current_rep=current_rep,
+            completed_rep=completed_rep,
+            pool_name=pool_name,
+            reward=reward,
+        )
+    )
+
+
+def draw_card(
+    *,
+    bg_image: BytesIO = MISSING,
+    profile_image: BytesIO | Image.Image = MISSING,
+    level: int = 1,
+    base_rep: int = 0,
+    current_rep: int = 20,
+    completed_rep: int = 100,
+    pool_name: str = "Unknown",
+    reward: str = "Unknown",
+) -> Image.Image:
+    """Draw a card.
 
     This is adapted from the disrank library.
 
@@ -52,8 +95,9 @@ def generate_card(
     ----------
     bg_image: BytesIO = MISSING
         The background image. Defaults to the default background image.
-    profile_image: BytesIO = MISSING
-        The profile image. Defaults to the default profile image.
+    profile_image: BytesIO | Image.Image = MISSING
+        The profile image, either encoded or an already decoded image, like the ones from the avatar cache. Defaults
+        to the default profile image.
     level: int = 1
         The level of the pool.
     base_rep: int = 0
@@ -69,8 +113,8 @@ def generate_card(
 
     Returns
     -------
-    BytesIO
-        The card image as a buffered stream of I/O Bytes.
+    Image.Image
+        The card.
     """
     if bg_image is MISSING:
         card = Image.open(__DEFAULT_BG__).convert("RGBA")
@@ -91,8 +135,11 @@ def generate_card(
 
             card = card.crop((x1, y1, x2, y2)).resize((900, 238))
 
-    profile_bytes: BytesIO | pathlib.Path = profile_image if profile_image is not MISSING else __DEFAULT_PROFILE__
-    profile = Image.open(profile_bytes).convert("RGBA").resize((180, 180))
+    if isinstance(profile_image, Image.Image):
+        profile = profile_image if profile_image.size == (180, 180) else profile_image.resize((180, 180))
+    else:
+        profile_bytes = profile_image if profile_image is not MISSING else __DEFAULT_PROFILE__
+        profile = Image.open(profile_bytes).convert("RGBA").resize((180, 180))
 
     profile_pic_holder = Image.new("RGBA", card.size, (255, 255, 255, 0))  # Is used for a blank image for a mask
 
@@ -149,8 +196,138 @@ def generate_card(
     blank = Image.new("RGBA", pre.size, (255, 255, 255, 0))
     blank.paste(status, (169, 169))
 
-    final = Image.alpha_composite(pre, blank)
+    return Image.alpha_composite(pre, blank)
+
+
+def _png(image: Image.Image) -> BytesIO:
+    """Save an image as a PNG."""
     final_bytes = BytesIO()
-    final.save(final_bytes, "png")
+    image.save(final_bytes, "png")
     final_bytes.seek(0)
     return final_bytes
+
+
+@functools.cache
+def _rank_background() -> Image.Image:
+    """The decoded rank card background, loaded once."""
+    return Image.open(__DEFAULT_BG__).convert("RGBA")
+
+
+@functools.cache
+def _status_badge(status: str) -> Image.Image:
+    """The layer with a status badge, loaded and placed once per status."""
+    badge = Image.new("RGBA", _rank_background().size, (255, 255, 255, 0))
+    badge.paste(Image.open(__STATUSES__.get(status, __OFFLINE__)).convert("RGBA").resize((40, 40)), (169, 169))
+    return badge
+
+
+@functools.cache
+def _profile_mask() -> Image.Image:
+    """The mask cropping the profile picture to a circle, built once."""
+    mask = Image.new("RGBA", _rank_background().size, 0)
+    ImageDraw.Draw(mask).ellipse((29, 29, 209, 209), fill=(255, 25, 255, 255))
+    return mask
+
+
+def generate_profile(
+    *,
+    profile_image: BytesIO | Image.Image = MISSING,
+    level: int = 1,
+    current_xp: int = 0,
+    user_xp: int = 20,
+    next_xp: int = 100,
+    user_position: int = 1,
+    user_name: str = "Unknown",
+    user_status: str = "online",
+) -> BytesIO:
+    """Generate a rank card, as a PNG.
+
+    See :func:`draw_profile` for the parameters.
+
+    Returns
+    -------
+    BytesIO
+        The rank card as a buffered stream of I/O Bytes.
+    """
+    return _png(
+        draw_profile(
+            profile_image=profile_image,
+            level=level,
+            current_xp=current_xp,
+            user_xp=user_xp,
+            next_xp=next_xp,
+            user_position=user_position,
+            user_name=user_name,
+            user_status=user_status,
+        )
+    )
+
+
+def draw_profile(
+    *,
+    profile_image: BytesIO | Image.Image = MISSING,
+    level: int = 1,
+    current_xp: int = 0,
+    user_xp: int = 20,
+    next_xp: int = 100,
+    user_position: int = 1,
+    user_name: str = "Unknown",
+    user_status: str = "online",
+) -> Image.Image:
+    """Draw a rank card.
+
+    This is adapted from the disrank library, but renders from assets that are only loaded once, and takes the
+    profile picture rather than downloading it.
+
+    Parameters
+    ----------
+    profile_image: BytesIO | Image.Image = MISSING
+        The profile image, either encoded or an already decoded image, like the ones from the avatar cache. Defaults
+        to the default profile image.
+    level: int = 1
+        The level of the user.
+    current_xp: int = 0
+        The xp the user's current level started at.
+    user_xp: int = 20
+        The xp of the user.
+    next_xp: int = 100
+        The xp the user's next level starts at.
+    user_position: int = 1
+        The rank of the user on the leaderboard.
+    user_name: str = "Unknown"
+        The name of the user.
+    user_status: str = "online"
+        The status of the user, shown as a badge on the profile image, unknown statuses are shown as offline.
+
+    Returns
+    -------
+    Image.Image
+        The rank card.
+    """
+    card = _rank_background().copy()
+    if isinstance(profile_image, Image.Image):
+        profile = profile_image if profile_image.size == (180, 180) else profile_image.resize((180, 180))
+    else:
+        profile_bytes = profile_image if profile_image is not MISSING else __DEFAULT_PROFILE__
+        profile = Image.open(profile_bytes).convert("RGBA").resize((180, 180))
+
+    draw = ImageDraw.Draw(card)
+    draw.text((245, 22), user_name, __DARK__, font=__RANK_FONT__)
+    draw.text((245, 98), f"Rank #{user_position}", __DARK__, font=__SMALL_FONT__)
+    draw.text((245, 123), f"Level {level}", __DARK__, font=__SMALL_FONT__)
+    draw.text((245, 150), f"Exp {__XP_AS_STR__(user_xp)}/{__XP_AS_STR__(next_xp)}", __DARK__, font=__SMALL_FONT__)
+
+    # Progress bar and profile ring go on a blank layer, drawing on the card wouldn't make their background transparent
+    blank = Image.new("RGBA", card.size, (255, 255, 255, 0))
+    blank_draw = ImageDraw.Draw(blank)
+    blank_draw.rectangle((245, 185, 750, 205), fill=(255, 255, 255, 0), outline=__DARK__)
+    current_percentage = ((user_xp - current_xp) / (next_xp - current_xp)) * 100
+    blank_draw.rectangle((248, 188, (current_percentage * 4.9) + 248, 202), fill=__DARK__)
+    blank_draw.ellipse((20, 20, 218, 218), fill=(255, 255, 255, 0), outline=__DARK__)
+
+    profile_pic_holder = Image.new("RGBA", card.size, (255, 255, 255, 0))
+    profile_pic_holder.paste(profile, (29, 29, 209, 209))
+    pre = Image.composite(profile_pic_holder, card, _profile_mask())
+    pre = Image.alpha_composite(pre, blank)
+
+    return Image.alpha_composite(pre, _status_badge(user_status))
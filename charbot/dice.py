@@ -2,17 +2,277 @@
 # SPDX-FileCopyrightText: 2021 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
 # SPDX-License-Identifier: MIT
 """Rolls dice."""
+import asyncio
+import logging
 import random
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Any, NamedTuple
 
 import discord
 from discord.ext import commands
 from discord.ext.commands import Cog, Context
 from fluent.runtime import FluentLocalization
 
-from charbot import CBot
+from charbot import CBot, Config
 
 
-def roll(arg: str, user: str, i18n: FluentLocalization) -> str:
+if TYPE_CHECKING:  # pragma: no cover
+    import numpy as np
+
+_LOGGER = logging.getLogger("charbot.dice")
+BULK_THRESHOLD = 1_000  # terms with more dice than this are rolled with numpy instead of one randint per die
+BULK_CHUNK = 1 << 16  # dice rolled per numpy call, so a huge roll never holds more than this in memory
+
+
+class DiceLimits(NamedTuple):
+    """Limits on the dice expressions that can be rolled.
+
+    Attributes
+    ----------
+    max_length : int
+        The longest expression that will be parsed.
+    max_terms : int
+        The most dice and constant terms in an expression.
+    max_dice : int
+        The most dice in an expression, across all of its terms.
+    max_sides : int
+        The most sides a die can have.
+    detail_threshold : int
+        Rolls with more dice than this get a summary rather than every face.
+    offload_threshold : int
+        Rolls are made in a thread, off the event loop, when ``max_dice`` is above this, as the biggest rolls allowed
+        are then too slow to make on the loop.
+    """
+
+    max_length: int = 200
+    max_terms: int = 20
+    max_dice: int = 10_000
+    max_sides: int = 1_000_000
+    detail_threshold: int = 100
+    offload_threshold: int = 100_000
+
+    @classmethod
+    def from_config(cls, settings: Mapping[str, Any]) -> "DiceLimits":
+        """Make the limits from the ``dice`` section of the config, ignoring keys that aren't limits.
+
+        Parameters
+        ----------
+        settings : Mapping[str, Any]
+            The config section.
+
+        Returns
+        -------
+        DiceLimits
+            The limits, with the defaults for any not in the config.
+        """
+        if unknown := sorted(set(settings) - set(cls._fields)):
+            _LOGGER.warning("Ignoring unknown dice limits in the config: %s", ", ".join(unknown))
+        return cls(**{key: int(value) for key, value in settings.items() if key in cls._fields})
+
+
+class DiceTerm(NamedTuple):
+    """A term of dice, `count` dice with `sides` sides each."""
+
+    count: int
+    sides: int
+
+
+class Constant(NamedTuple):
+    """A constant modifier term."""
+
+    value: int
+
+
+Expression = list[DiceTerm | Constant]
+
+
+class RollResult(NamedTuple):
+    """The result of rolling an expression.
+
+    Attributes
+    ----------
+    total : int
+        The sum of every die and constant.
+    dice : int
+        How many dice were rolled.
+    lowest : int | None
+        The lowest face rolled, None if no dice were rolled.
+    highest : int | None
+        The highest face rolled, None if no dice were rolled.
+    results : list[int] | None
+        Every face and constant in order, None if there were too many dice to keep them.
+    """
+
+    total: int
+    dice: int
+    lowest: int | None
+    highest: int | None
+    results: list[int] | None
+
+
+class DiceLimitError(ValueError):
+    """Raised when an expression is valid but goes over the limits."""
+
+
+def parse(arg: str, limits: DiceLimits = DiceLimits()) -> Expression:
+    """Parse a dice expression.
+
+    Parameters
+    ----------
+    arg : str
+        The expression, dice like `2d6` or `d20` and integer constants, joined with `+`.
+    limits : DiceLimits
+        The limits the expression has to stay within.
+
+    Returns
+    -------
+    Expression
+        The parsed terms, in order.
+
+    Raises
+    ------
+    ValueError
+        If the expression isn't valid.
+    DiceLimitError
+        If the expression goes over the limits.
+    """
+    if len(arg) > limits.max_length:
+        raise DiceLimitError(f"Expression is longer than {limits.max_length} characters.")
+    parts = arg.split("+")
+    if len(parts) > limits.max_terms:
+        raise DiceLimitError(f"Expression has more than {limits.max_terms} terms.")
+    expression: Expression = []
+    dice = 0
+    for part in parts:
+        if "d" in part:
+            count, _, sides = part.partition("d")
+            if not (count.isdecimal() or count == "") or not sides.isdecimal():
+                raise ValueError(f"Invalid dice term {part!r}.")
+            term = DiceTerm(int(count) if count else 1, int(sides))
+            if term.sides < 1:
+                raise ValueError(f"Invalid dice term {part!r}.")
+            if term.sides > limits.max_sides:
+                raise DiceLimitError(f"Dice can have at most {limits.max_sides} sides.")
+            dice += term.count
+            expression.append(term)
+        else:
+            expression.append(Constant(int(part)))
+    if dice > limits.max_dice:
+        raise DiceLimitError(f"Expression rolls more than {limits.max_dice} dice.")
+    return expression
+
+
+def dice_count(expression: Expression) -> int:
+    """Get how many dice an expression rolls.
+
+    Parameters
+    ----------
+    expression : Expression
+        The parsed expression.
+
+    Returns
+    -------
+    int
+        The amount of dice.
+    """
+    return sum(term.count for term in expression if isinstance(term, DiceTerm))
+
+
+def _roll_bulk(term: DiceTerm, rng: "np.random.Generator") -> tuple[int, int, int]:
+    """Roll a large term of dice in chunks, returning the total, lowest and highest face."""
+    import numpy as np  # only needed for huge rolls, so only imported for them
+
+    total = 0
+    lowest, highest = term.sides, 1
+    remaining = term.count
+    while remaining:
+        chunk = rng.integers(1, term.sides, size=min(remaining, BULK_CHUNK), endpoint=True, dtype=np.int64)
+        total += int(chunk.sum())
+        lowest = min(lowest, int(chunk.min()))
+        highest = max(highest, int(chunk.max()))
+        remaining -= len(chunk)
+    return total, lowest, highest
+
+
+def evaluate(expression: Expression, detail_threshold: int = DiceLimits().detail_threshold) -> RollResult:
+    """Roll a parsed expression.
+
+    Parameters
+    ----------
+    expression : Expression
+        The parsed expression.
+    detail_threshold : int
+        Every face is only kept if the expression rolls at most this many dice.
+
+    Returns
+    -------
+    RollResult
+        The result of the roll.
+    """
+    detailed = dice_count(expression) <= detail_threshold
+    results: list[int] = []
+    total = dice = 0
+    lowest: int | None = None
+    highest: int | None = None
+    rng: "np.random.Generator | None" = None
+    for term in expression:
+        if isinstance(term, Constant):
+            results.append(term.value)
+            total += term.value
+            continue
+        if term.count == 0:
+            continue
+        if term.count <= BULK_THRESHOLD:
+            faces = [random.randint(1, term.sides) for _ in range(term.count)]
+            if detailed:
+                results.extend(faces)
+            term_total, term_lowest, term_highest = sum(faces), min(faces), max(faces)
+        else:
+            if rng is None:
+                from numpy.random import default_rng
+
+                rng = default_rng()
+            term_total, term_lowest, term_highest = _roll_bulk(term, rng)
+        total += term_total
+        dice += term.count
+        lowest = term_lowest if lowest is None else min(lowest, term_lowest)
+        highest = term_highest if highest is None else max(highest, term_highest)
+    return RollResult(total, dice, lowest, highest, results if detailed else None)
+
+
+def format_result(arg: str, user: str, result: RollResult, i18n: FluentLocalization) -> str:
+    """Format the result of a roll.
+
+    Parameters
+    ----------
+    arg : str
+        The expression that was rolled.
+    user : str
+        Name to attribute to the user
+    result : RollResult
+        The result of the roll.
+    i18n : FluentLocalization
+        Localizer
+    """
+    if result.results is None:
+        return i18n.format_value(
+            "summary",
+            args={
+                "user": user,
+                "dice": arg,
+                "total": result.total,
+                "count": result.dice,
+                "lowest": result.lowest,
+                "highest": result.highest,
+            },
+        )
+    output = ", ".join(f"{res}" for res in result.results)
+    return i18n.format_value(
+        "success", args={"user": user, "dice": arg, "total": result.total, "result": output, "locale": "en-US"}
+    )
+
+
+def roll(arg: str, user: str, i18n: FluentLocalization, limits: DiceLimits = DiceLimits()) -> str:
     """Dice roller.
 
     Parameters
@@ -23,36 +283,16 @@ def roll(arg: str, user: str, i18n: FluentLocalization) -> str:
         Dice roll string
     user: str
         Name to attribute to the user
+    limits: DiceLimits
+        The limits the roll has to stay within.
     """
-    dice = arg.split("+") if "+" in arg else [arg]
-    # noinspection PyBroadException
     try:
-        sums = 0
-        rolls = []
-        for die in dice:
-            if "d" in die:
-                try:
-                    num_rolls = int(die[: die.find("d")])
-                except ValueError:
-                    num_rolls = 1
-                for _ in range(1, num_rolls + 1):
-                    # fmt: off
-                    roll1 = random.randint(1, int(die[die.find("d") + 1:]))
-                    # fmt: on
-                    rolls.append(roll1)
-                    sums += roll1
-            else:
-                try:
-                    rolls.append(int(die))
-                    sums += int(die)
-                except ValueError:
-                    return i18n.format_value("error", args={"user": user})
-        output = ", ".join(f"{res}" for res in rolls)
-        return i18n.format_value(
-            "success", args={"user": user, "dice": arg, "total": sums, "result": output, "locale": "en-US"}
-        )
-    except Exception:  # skipcq: PYL-W0703
+        expression = parse(arg, limits)
+    except DiceLimitError:
+        return i18n.format_value("limit", args={"user": user, "dice": limits.max_dice, "sides": limits.max_sides})
+    except ValueError:
         return i18n.format_value("error", args={"user": user})
+    return format_result(arg, user, evaluate(expression, limits.detail_threshold), i18n)
 
 
 class Roll(Cog):
@@ -67,6 +307,8 @@ class Roll(Cog):
     ----------
     bot : Bot
         The bot object the cog is attached to.
+    limits : DiceLimits
+        The limits rolls have to stay within, from the `dice` section of the config if it has one.
 
     Methods
     -------
@@ -79,6 +321,11 @@ class Roll(Cog):
     # noinspection PyUnresolvedReferences
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.limits = DiceLimits()
+
+    async def cog_load(self) -> None:  # pragma: no cover
+        """Load the dice limits from the config."""
+        self.limits = DiceLimits.from_config(Config["dice"]) if "dice" in Config else DiceLimits()
 
     def cog_check(self, ctx: Context) -> bool:
         """Check to run for all cog commands.
@@ -105,10 +352,12 @@ class Roll(Cog):
         dice : str
             The dice to roll.
         """
-        await ctx.reply(
-            roll(dice, ctx.author.mention, FluentLocalization(["en-US"], ["dice.ftl"], ctx.bot.localizer_loader)),
-            mention_author=True,
-        )
+        i18n = FluentLocalization(["en-US"], ["dice.ftl"], ctx.bot.localizer_loader)
+        if self.limits.max_dice > self.limits.offload_threshold:
+            message = await asyncio.to_thread(roll, dice, ctx.author.mention, i18n, self.limits)
+        else:
+            message = roll(dice, ctx.author.mention, i18n, self.limits)
+        await ctx.reply(message, mention_author=True)
 
 
 async def setup(bot: commands.Bot):
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""Grouping of errors by where they come from, so repeats are counted rather than reported again.
+
+An error is fingerprinted by its type and the frames it was raised through, so the same bug hit by many users is one
+group. Only the first error of a group, and errors that show it happening at least twice as often as when it was last
+reported, are worth logging and notifying about, the rest are only counted, which skips formatting their tracebacks,
+writing them, and sending them to Sentry.
+"""
+import collections
+import datetime
+import hashlib
+import time
+import traceback
+from collections.abc import Callable
+
+from .stacks import blame, location
+
+
+__all__ = ("Example", "ErrorGroup", "ErrorAggregator", "fingerprint", "unwrap")
+
+
+def unwrap(error: BaseException) -> BaseException:
+    """Get the error a command or view error wraps, like the original of a ``CommandInvokeError``.
+
+    Parameters
+    ----------
+    error : BaseException
+        The error.
+
+    Returns
+    -------
+    BaseException
+        The error that was actually raised by the bot's code.
+    """
+    while isinstance(original := getattr(error, "original", None), BaseException):
+        error = original
+    return error
+
+
+def _stack(error: BaseException) -> traceback.StackSummary:
+    # lines are read from the source when the stack is formatted, not here
+    return traceback.StackSummary.extract(traceback.walk_tb(error.__traceback__), lookup_lines=False)
+
+
+def fingerprint(error: BaseException, stack: traceback.StackSummary | None = None) -> str:
+    """Fingerprint an error by its type and the frames it was raised through.
+
+    Parameters
+    ----------
+    error : BaseException
+        The error, already unwrapped.
+    stack : traceback.StackSummary | None
+        Its stack, None to extract it.
+
+    Returns
+    -------
+    str
+        The fingerprint, 12 hex digits.
+    """
+    if stack is None:
+        stack = _stack(error)
+    digest = hashlib.blake2b(f"{type(error).__module__}.{type(error).__qualname__}".encode(), digest_size=6)
+    for frame in stack:
+        digest.update(f"\0{frame.filename}:{frame.lineno}:{frame.name}".encode())
+    return digest.hexdigest()
+
+
+class Example:
+    """An occurrence of an error.
+
+    Attributes
+    ----------
+    fingerprint : str
+        The fingerprint of its group.
+    time : datetime.datetime
+        When it happened.
+    context : str
+        What it was raised from, like ``command Admin.ping``.
+    error : str
+        Its type and message.
+    stack : traceback.StackSummary
+        The frames it was raised through.
+    """
+
+    __slots__ = ("fingerprint", "time", "context", "error", "stack")
+
+    def __init__(self, fingerprint_: str, context: str, error: BaseException, stack: traceback.StackSummary):
+        self.fingerprint = fingerprint_
+        self.time = datetime.datetime.now(datetime.timezone.utc)
+        self.context = context
+        self.error = f"{type(error).__name__}: {error}"
+        self.stack = stack
+
+    def format(self) -> str:
+        """Format the example like a traceback.
+
+        Returns
+        -------
+        str
+            The example.
+        """
+        return f"{self.time:%Y-%m-%d %H:%M:%S} in {self.context}\n{''.join(self.stack.format())}{self.error}"
+
+
+class ErrorGroup:
+    """Errors with the same fingerprint.
+
+    Attributes
+    ----------
+    fingerprint : str
+        The fingerprint.
+    error : str
+        The type and message of the first error.
+    location : str
+        Where the bot's code raised it, like ``charbot/dice.py:50 in roll``.
+    count : int
+        How many times it happened.
+    recent : collections.deque[float]
+        When it happened in the window, by the aggregator's clock.
+    reported : int
+        How many times it happened in the window when it was last reported, 0 if it wasn't since the window was empty.
+    """
+
+    __slots__ = ("fingerprint", "error", "location", "count", "recent", "reported")
+
+    def __init__(self, fingerprint_: str, error: BaseException, stack: traceback.StackSummary):
+        self.fingerprint = fingerprint_
+        self.error = f"{type(error).__name__}: {error}"[:200]
+        self.location = location(blame(stack)) if stack else "unknown"
+        self.count: int = 0
+        self.recent: collections.deque[float] = collections.deque()
+        self.reported: int = 0
+
+    def summary(self, window: float) -> str:
+        """Summarize the group, for notifying about it.
+
+        Parameters
+        ----------
+        window : float
+            The length of the window, in seconds.
+
+        Returns
+        -------
+        str
+            The summary.
+        """
+        return (
+            f"`{self.fingerprint}` {self.error} at {self.location}, "
+            f"{self.count} so far, {len(self.recent)} in the last {window:.0f}s"
+        )
+
+
+class ErrorAggregator:
+    """Counts errors by fingerprint in sliding windows, and decides which are worth reporting.
+
+    An error is reported when it's the first of its group, or the first since its group was quiet for a window, or when
+    its group has happened at least twice as many times in the window as when it was last reported.
+
+    Parameters
+    ----------
+    window : float
+        The length of the sliding window, in seconds.
+    examples : int
+        How many recent errors to keep, of every group.
+    max_groups : int
+        The most groups to keep, the least recently seen are forgotten past it.
+    clock : Callable[[], float]
+        The clock to time with, in seconds.
+
+    Attributes
+    ----------
+    groups : dict[str, ErrorGroup]
+        The groups, by fingerprint, least recently seen first.
+    examples : collections.deque[Example]
+        The most recent errors, newest last.
+    """
+
+    def __init__(
+        self,
+        window: float = 300.0,
+        examples: int = 50,
+        max_groups: int = 256,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.window = window
+        self.max_groups = max_groups
+        self.groups: dict[str, ErrorGroup] = {}
+        self.examples: collections.deque[Example] = collections.deque(maxlen=examples)
+        self._clock = clock
+
+    def record(self, error: BaseException, context: str) -> ErrorGroup | None:
+        """Count an error.
+
+        Parameters
+        ----------
+        error : BaseException
+            The error, it's unwrapped first.
+        context : str
+            What it was raised from, like ``command Admin.ping``.
+
+        Returns
+        -------
+        ErrorGroup | None
+            Its group if it should be reported, None if it's only counted.
+        """
+        error = unwrap(error)
+        stack = _stack(error)
+        key = fingerprint(error, stack)
+        now = self._clock()
+        if (group := self.groups.pop(key, None)) is None:
+            if len(self.groups) >= self.max_groups:
+                del self.groups[next(iter(self.groups))]
+            group = ErrorGroup(key, error, stack)
+        self.groups[key] = group  # moved to the end, so the least recently seen is first
+        while group.recent and now - group.recent[0] >= self.window:
+            group.recent.popleft()
+        if not group.recent:
+            group.reported = 0
+        group.count += 1
+        group.recent.append(now)
+        self.examples.append(Example(key, context, error, stack))
+        if group.reported and len(group.recent) < group.reported * 2:
+            return None
+        group.reported = len(group.recent)
+        return group
+
+    def example(self, fingerprint_: str) -> Example | None:
+        """Get the most recent kept example of a group.
+
+        Parameters
+        ----------
+        fingerprint_ : str
+            The fingerprint of the group, or the start of it.
+
+        Returns
+        -------
+        Example | None
+            The example, None if none of the group's are kept.
+        """
+        return next((ex for ex in reversed(self.examples) if ex.fingerprint.startswith(fingerprint_)), None)
+
+    def format(self, limit: int = 10) -> str:
+        """Format the groups that happened most.
+
+        Parameters
+        ----------
+        limit : int
+            How many groups to show.
+
+        Returns
+        -------
+        str
+            The report.
+        """
+        groups = sorted(self.groups.values(), key=lambda group: group.count, reverse=True)[:limit]
+        if not groups:
+            return "No errors since startup."
+        return "\n".join(
+            f"{group.fingerprint} {group.count:>6} total  {group.error[:80]}\n{'':13}at {group.location}"
+            for group in groups
+        )
@@ -2,23 +2,27 @@
 # SPDX-FileCopyrightText: 2021 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
 # SPDX-License-Identifier: MIT
 """Event handling for Charbot."""
+import asyncio
+import functools
 import pathlib
 import re
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta
 from typing import cast, TYPE_CHECKING, Final
 
 import discord
 import orjson
 from discord import Color, Embed
-from discord.ext import tasks
 from discord.ext.commands import Cog
 from discord.utils import MISSING, utcnow
-from urlextract import URLExtract
 
 from . import CBot
+from .webhooks import WebhookSink
 
 
 if TYPE_CHECKING:  # pragma: no cover
+    # noinspection PyUnresolvedReferences
+    from urlextract import URLExtract
+
     # noinspection PyUnresolvedReferences
     from .levels import Leveling
 
@@ -127,6 +131,14 @@ def url_posting_allowed(
     )
 
 
+@functools.cache
+def url_extractor() -> "URLExtract":
+    """Get the URL extractor, only importing urlextract and loading its TLD list the first time it's needed."""
+    from urlextract import URLExtract
+
+    return URLExtract()
+
+
 class Events(Cog):
     """Event Cog.
 
@@ -152,8 +164,8 @@ class Events(Cog):
         "members",
         "sensitive_settings_path",
         "webhook",
+        "log_sink",
         "tilde_regex",
-        "extractor",
     )
 
     def __init__(self, bot: CBot):
@@ -162,38 +174,53 @@ class Events(Cog):
         self.timeouts = {}
         self.members: dict[int, datetime] = {}
         self.webhook: discord.Webhook = MISSING
+        self.log_sink: WebhookSink = MISSING
         self.tilde_regex = re.compile(
             r"~~:\.\|:;~~|tilde tilde colon dot vertical bar colon semicolon tilde tilde", re.MULTILINE | re.IGNORECASE
         )
-        self.extractor = URLExtract()
         self.sensitive_settings_path: Final[pathlib.Path] = pathlib.Path(__file__).parent / "sensitive_settings.json"
 
+    @property
+    def extractor(self) -> "URLExtract":
+        """The URL extractor, loaded on first use."""
+        return url_extractor()
+
     async def cog_load(self) -> None:  # pragma: no cover
         """Cog load function.
 
-        This is called when the cog is loaded, and initializes the
-        log_un-timeout task and the members cache
+        This is called when the cog is loaded, and initializes the members cache and the webhook, concurrently
         """
-        self.log_untimeout.start()
-        self.members.update(
-            {
-                user.id: user.joined_at
-                async for user in cast(
-                    discord.Guild,
-                    self.bot.get_guild(225345178955808768) or await self.bot.fetch_guild(225345178955808768),
-                ).fetch_members(limit=None)
-                if user.joined_at is not None
-            }
-        )
-        with open(self.sensitive_settings_path, "rb") as json_dict:
-            self.webhook = await self.bot.fetch_webhook(orjson.loads(json_dict.read())["webhook_id"])
+
+        async def fetch_members() -> None:
+            self.members.update(
+                {
+                    user.id: user.joined_at
+                    async for user in cast(
+                        discord.Guild,
+                        self.bot.get_guild(225345178955808768) or await self.bot.fetch_guild(225345178955808768),
+                    ).fetch_members(limit=None)
+                    if user.joined_at is not None
+                }
+            )
+
+        async def fetch_webhook() -> None:
+            with open(self.sensitive_settings_path, "rb") as json_dict:
+                self.webhook = await self.bot.fetch_webhook(orjson.loads(json_dict.read())["webhook_id"])
+            bot_user = cast(discord.ClientUser, self.bot.user)
+            self.log_sink = WebhookSink(self.webhook, username=bot_user.name, avatar_url=bot_user.display_avatar.url)
+            self.log_sink.start()
+
+        await asyncio.gather(fetch_members(), fetch_webhook())
 
     async def cog_unload(self) -> None:  # skipcq: PYL-W0236  # pragma: no cover
         """Call when cog is unloaded.
 
-        This stops the log_untimeout task
+        This cancels the scheduled un-timeout reports, and sends the logs still queued
         """
-        self.log_untimeout.cancel()
+        for member_id in self.timeouts:
+            self.bot.scheduler.cancel(f"untimeout:{member_id}")
+        if self.log_sink is not MISSING:
+            await self.log_sink.close()
 
     async def parse_timeout(self, after: discord.Member):
         """Parse the timeout and logs it to the mod log.
@@ -220,9 +247,9 @@ class Events(Cog):
         embed.set_author(name=f"[TIMEOUT] {after.name}#{after.discriminator}")
         embed.add_field(name="User", value=after.mention, inline=True)
         embed.add_field(name="Duration", value=time_string, inline=True)
-        bot_user = cast(discord.ClientUser, self.bot.user)
-        await self.webhook.send(username=bot_user.name, avatar_url=bot_user.display_avatar.url, embed=embed)
-        self.timeouts.update({after.id: after.timed_out_until})
+        self.log_sink.post(embed=embed)
+        self.timeouts.update({after.id: until})
+        self._schedule_untimeout(after.id, until)
 
     async def sensitive_scan(self, message: discord.Message) -> bool:
         """Check and take action if a message contains sensitive content.
@@ -261,42 +288,51 @@ class Events(Cog):
                     channel.category_id in (360818916861280256, 942578610336837632)
                 ):
                     return True
-                bot_user = cast(discord.ClientUser, self.bot.user)
-                await self.webhook.send(
-                    username=bot_user.name,
-                    avatar_url=bot_user.display_avatar.url,
-                    embed=sensitive_embed(message, used_words),
-                )
+                self.log_sink.post(embed=sensitive_embed(message, used_words))
                 self.last_sensitive_logged[message.author.id] = datetime.now()
                 return False
         return True
 
+    def _schedule_untimeout(self, member_id: int, until: datetime) -> None:
+        """Schedule the un-timeout report for when a member's timeout runs out.
+
+        Parameters
+        ----------
+        member_id : int
+            The ID of the timed out member.
+        until : datetime
+            When the timeout runs out.
+        """
+        self.bot.scheduler.schedule_once(
+            f"untimeout:{member_id}", until + timedelta(seconds=1), functools.partial(self.log_untimeout, member_id)
+        )
+
     # noinspection DuplicatedCode
-    @tasks.loop(seconds=30)
-    async def log_untimeout(self) -> None:
-        """Un-timeout Report Task.
+    async def log_untimeout(self, member_id: int) -> None:
+        """Un-timeout Report Job.
+
+        This job is scheduled for when a member's timeout runs out, and checks if it has. If it has, it will send a
+        message to the mod channel, otherwise, it's scheduled again for the new end of the timeout.
 
-        This task runs every 30 seconds and checks if any users that have been timed out have had their timeouts
-        expired. If they have, it will send a message to the mod channel.
+        Parameters
+        ----------
+        member_id : int
+            The ID of the timed out member.
         """
-        removable = []
-        for i, j in self.timeouts.copy().items():
-            if j < datetime.now(tz=timezone.utc):
-                guild = self.bot.get_guild(225345178955808768)
-                if guild is None:
-                    guild = await self.bot.fetch_guild(225345178955808768)
-                member = await guild.fetch_member(i)
-                if not member.is_timed_out():
-                    embed = Embed(color=Color.green())
-                    embed.set_author(name=f"[UNTIMEOUT] {member.name}#{member.discriminator}")
-                    embed.add_field(name="User", value=member.mention, inline=True)
-                    bot_user = cast(discord.ClientUser, self.bot.user)
-                    await self.webhook.send(username=bot_user.name, avatar_url=bot_user.display_avatar.url, embed=embed)
-                    removable.append(i)
-                elif member.is_timed_out():
-                    self.timeouts.update({i: member.timed_out_until})
-        for i in removable:
-            self.timeouts.pop(i)
+        guild = self.bot.get_guild(225345178955808768)
+        if guild is None:
+            guild = await self.bot.fetch_guild(225345178955808768)
+        member = await guild.fetch_member(member_id)
+        if member.is_timed_out():
+            until = cast(datetime, member.timed_out_until)
+            self.timeouts.update({member_id: until})
+            self._schedule_untimeout(member_id, until)
+            return
+        embed = Embed(color=Color.green())
+        embed.set_author(name=f"[UNTIMEOUT] {member.name}#{member.discriminator}")
+        embed.add_field(name="User", value=member.mention, inline=True)
+        self.log_sink.post(embed=embed)
+        self.timeouts.pop(member_id, None)
 
     @Cog.listener()
     async def on_member_join(self, member: discord.Member) -> None:
@@ -363,9 +399,9 @@ class Events(Cog):
                     embed = Embed(color=Color.green())
                     embed.set_author(name=f"[UNTIMEOUT] {after.name}#{after.discriminator}")
                     embed.add_field(name="User", value=after.mention, inline=True)
-                    bot_user = cast(discord.ClientUser, self.bot.user)
-                    await self.webhook.send(username=bot_user.name, avatar_url=bot_user.display_avatar.url, embed=embed)
-                    self.timeouts.pop(after.id)
+                    self.log_sink.post(embed=embed)
+                    self.bot.scheduler.cancel(f"untimeout:{after.id}")
+                    self.timeouts.pop(after.id, None)  # not tracked if they were timed out before a restart
         except Exception:  # skipcq: PYL-W0703
             if after.is_timed_out():
                 await self.parse_timeout(after)
@@ -451,8 +487,7 @@ class Events(Cog):
                     text=f"Sent by {message.author.display_name}-{message.author.id}",
                     icon_url=author.display_avatar.url,
                 )
-                bot_user = cast(discord.ClientUser, self.bot.user)
-                await self.webhook.send(username=bot_user.name, avatar_url=bot_user.display_avatar.url, embed=embed)
+                self.log_sink.post(embed=embed)
                 return  # skipcq: PYL-W0150
         if self.tilde_regex.search(message.content):
             await message.delete()
@@ -4,8 +4,9 @@
 """Dynamic stream calendar generator for the next week."""
 
 import datetime as _datetime
-import re
+import heapq
 from calendar import timegm
+from collections.abc import Iterator
 from datetime import datetime, time, timedelta, timezone
 from typing import Literal, NamedTuple, Optional, TypedDict
 from zoneinfo import ZoneInfo
@@ -13,17 +14,22 @@ from zoneinfo import ZoneInfo
 import discord
 import itertools
 import orjson
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord.utils import MISSING, format_dt, utcnow
 from typing_extensions import NotRequired
 from validators import url
 
 from . import CBot, Config
+from .scheduler import Daily
 
 
 ytLink = "https://www.youtube.com/charliepryor/live"
 chartime = ZoneInfo("US/Michigan")
 time_format = "%H:%M %x %Z"
+events_url = (
+    "https://www.googleapis.com/calendar/v3/calendars/u8n1onpbv9pb5du7gssv2md58s@group.calendar.google.com/events"
+)
+live_window = timedelta(hours=2)  # streams stay the "next stream" for this long after they start
 
 
 class EmbedField(NamedTuple):
@@ -44,44 +50,58 @@ class CalEventTime(TypedDict):
 class CalEvent(TypedDict):
     """A typed dictionary for a calendar event."""
 
+    id: str
     status: Literal["cancelled", "tentative", "confirmed"]
     created: str
     updated: str
     summary: str
     description: NotRequired[str]  # Not required, YT link is used as a fallback
-    recurrence: NotRequired[list[str]]  # Not required, Only used if it exists to filter out an event
+    recurrence: NotRequired[list[str]]  # Only present on the master event of a recurring series
+    recurringEventId: NotRequired[str]  # Only present on modified or cancelled instances of a recurring series
     start: CalEventTime
     end: CalEventTime
-    originalStartTime: CalEventTime
+    originalStartTime: NotRequired[CalEventTime]
 
 
 class CalResponse(TypedDict):
     """A typed dictionary for the response from the Google calendar API."""
 
     items: list[CalEvent]
+    nextPageToken: NotRequired[str]
+    nextSyncToken: NotRequired[str]
 
 
-def get_params(mintime: datetime, maxtime: datetime) -> dict[str, str]:
-    """Create an url for the Google calendar API query.
+class StoredInstance(NamedTuple):
+    """A single occurrence of an event, with its embed field pre-rendered."""
+
+    start: datetime
+    field: EmbedField
+
+
+InstanceKey = tuple[str, int]  # (series id, original start as a unix timestamp)
+
+
+def get_params(sync_token: str | None = None, page_token: str | None = None) -> dict[str, str]:
+    """Create the query parameters for the Google calendar API events list.
 
     Parameters
     ----------
-    mintime : datetime
-        The minimum time to search for.
-    maxtime : datetime
-        The maximum time to search for.
+    sync_token : str | None
+        The sync token from the last completed sync, if any. Without one a full sync is done.
+    page_token : str | None
+        The token of the page to fetch, when paging through a response.
 
     Returns
     -------
-    str
-        The url to query the Google calendar API.
+    dict[str, str]
+        The parameters to query the Google calendar API with.
     """
-    return {
-        "key": Config["calendar"]["key"],
-        "singleEvents": "True",
-        "timeMin": mintime.isoformat(),
-        "timeMax": maxtime.isoformat(),
-    }
+    params = {"key": Config["calendar"]["key"]}
+    if page_token is not None:
+        params["pageToken"] = page_token
+    elif sync_token is not None:
+        params["syncToken"] = sync_token
+    return params
 
 
 def half_hour_intervals():
@@ -114,25 +134,6 @@ def ceil_dt(dt: datetime, delta: timedelta) -> datetime:
     return dt + (datetime(_datetime.MINYEAR, 1, 1, tzinfo=timezone.utc) - dt) % delta
 
 
-def default_field(dictionary: dict[int, EmbedField], add_time: datetime, item: CalEvent) -> None:
-    """Add the default dict field for a specific time.
-
-    Parameters
-    ----------
-    dictionary : dict[int, EmbedField]
-        The dictionary to add the field to.
-    add_time : datetime
-        The time to add the field to.
-    item : dict
-        The item to add to the dictionary.
-    """
-    dictionary[timegm(add_time.utctimetuple())] = EmbedField(
-        item["summary"],
-        f"{format_dt(add_time, 'F')}\n[({add_time.astimezone(chartime).strftime(time_format)})]({ytLink})",
-        True,
-    )
-
-
 def calendar_embed(fields: dict[int, EmbedField], next_event: datetime | None) -> discord.Embed:
     """Create an embed for the calendar.
 
@@ -177,22 +178,286 @@ def calendar_embed(fields: dict[int, EmbedField], next_event: datetime | None) -
     return embed.set_footer(text="Last Updated")
 
 
-def update_time(convert: datetime) -> datetime:  # pragma: no cover
-    """Update the time to the correct week.
+def event_field(start: datetime, item: CalEvent) -> EmbedField:
+    """Render the embed field for an occurrence of an event.
+
+    Parameters
+    ----------
+    start : datetime
+        The start time of the occurrence.
+    item : CalEvent
+        The event the occurrence belongs to.
+
+    Returns
+    -------
+    EmbedField
+        The field to show in the calendar embed.
+    """
+    desc = item.get("description")
+    link = desc if desc and url(desc) else ytLink
+    return EmbedField(
+        item["summary"],
+        f"{format_dt(start, 'F')}\n[({start.astimezone(chartime).strftime(time_format)})]({link})",
+        True,
+    )
+
+
+def event_start(event_time: CalEventTime) -> datetime | None:
+    """Parse the start time of an event in the event's own timezone.
 
     Parameters
     ----------
-    convert : datetime
-        The time to update.
+    event_time : CalEventTime
+        The start (or original start) of the event.
 
     Returns
     -------
+    datetime | None
+        The aware start time, or None for all day events, which don't have a time.
+    """
+    if "dateTime" not in event_time:
+        return None
+    start = datetime.fromisoformat(event_time["dateTime"])
+    if zone := event_time.get("timeZone"):
+        # Recurrences step in wall clock time, so DST changes keep the stream at the same local time
+        start = start.astimezone(ZoneInfo(zone))
+    return start
+
+
+def _parse_rule_time(value: str, tz: _datetime.tzinfo | None) -> datetime:
+    """Parse an RFC 5545 DATE or DATE-TIME value."""
+    if value.endswith("Z"):
+        return datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+    if "T" in value:
+        return datetime.strptime(value, "%Y%m%dT%H%M%S").replace(tzinfo=tz)
+    return datetime.strptime(value, "%Y%m%d").replace(hour=23, minute=59, second=59, tzinfo=tz)
+
+
+def expand_recurrence(rules: list[str], start: datetime, until: datetime) -> Iterator[datetime]:
+    """Expand the recurrence rules of an event into the start times of its occurrences.
+
+    Only the daily and weekly rules the stream calendar uses are understood, any other frequency only yields the first
+    occurrence.
+
+    Parameters
+    ----------
+    rules : list[str]
+        The RRULE and EXDATE lines of the event.
+    start : datetime
+        The start of the first occurrence, in the event's timezone.
+    until : datetime
+        Stop expanding at this time.
+
+    Yields
+    ------
     datetime
-        The updated time.
+        The start time of each occurrence, in order.
     """
-    while convert < utcnow():
-        convert = convert + timedelta(days=7)
-    return convert
+    rule: dict[str, str] = {}
+    excluded: set[datetime] = set()
+    for line in rules:
+        name, _, value = line.partition(":")
+        if name == "RRULE":
+            rule = dict(part.split("=", 1) for part in value.split(";"))
+        elif name.startswith("EXDATE"):
+            params = dict(param.split("=", 1) for param in name.split(";")[1:])
+            tz = ZoneInfo(params["TZID"]) if "TZID" in params else start.tzinfo
+            excluded.update(_parse_rule_time(date, tz) for date in value.split(","))
+    freq = rule.get("FREQ")
+    if freq not in ("DAILY", "WEEKLY"):
+        if start < until and start not in excluded:
+            yield start
+        return
+    step = timedelta(days=int(rule.get("INTERVAL", "1")) * (7 if freq == "WEEKLY" else 1))
+    count = int(rule["COUNT"]) if "COUNT" in rule else None
+    if "UNTIL" in rule:
+        until = min(until, _parse_rule_time(rule["UNTIL"], start.tzinfo) + timedelta(seconds=1))
+    days = [0]
+    if freq == "WEEKLY" and "BYDAY" in rule:
+        weekdays = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+        days = sorted(weekdays.index(day[-2:]) - start.weekday() for day in rule["BYDAY"].split(","))
+    period = start
+    while period < until:
+        for offset in days:
+            occurrence = period + timedelta(days=offset)
+            if occurrence < start:
+                continue
+            if occurrence >= until or count == 0:
+                return
+            if count is not None:
+                count -= 1
+            if occurrence not in excluded:
+                yield occurrence
+        period += step
+
+
+class EventStore:
+    """Local copy of the stream calendar, kept up to date with incremental syncs.
+
+    Recurring events are expanded into their occurrences once, up to a rolling horizon, and every occurrence is kept
+    keyed by its series and original start time, so that modified and cancelled instances replace exactly the
+    occurrence they belong to. A heap of start times makes finding the next stream a peek.
+
+    Attributes
+    ----------
+    sync_token : str | None
+        The token to pass to the next incremental sync, None if a full sync is needed.
+    horizon : datetime | None
+        How far recurring events have been expanded.
+    """
+
+    def __init__(self):
+        self.sync_token: str | None = None
+        self.horizon: datetime | None = None
+        self.instances: dict[InstanceKey, StoredInstance] = {}
+        self._series: dict[str, set[InstanceKey]] = {}
+        self._masters: dict[str, CalEvent] = {}
+        self._exceptions: dict[str, dict[int, CalEvent]] = {}
+        self._heap: list[tuple[int, InstanceKey]] = []
+
+    def clear(self) -> None:
+        """Forget everything, so the next sync is a full one."""
+        self.sync_token = None
+        self.horizon = None
+        self.instances.clear()
+        self._series.clear()
+        self._masters.clear()
+        self._exceptions.clear()
+        self._heap.clear()
+
+    def _add(self, key: InstanceKey, start: datetime, item: CalEvent) -> None:
+        self.instances[key] = StoredInstance(start, event_field(start, item))
+        self._series.setdefault(key[0], set()).add(key)
+        heapq.heappush(self._heap, (timegm(start.utctimetuple()), key))
+
+    def _drop_series(self, series: str) -> None:
+        for key in self._series.pop(series, ()):
+            self.instances.pop(key, None)
+
+    def _expand(self, series: str, after: datetime, until: datetime) -> None:
+        master = self._masters[series]
+        start = event_start(master["start"])
+        if start is None:
+            return
+        exceptions = self._exceptions.get(series, {})
+        for occurrence in expand_recurrence(master.get("recurrence", []), start, until):
+            timestamp = timegm(occurrence.utctimetuple())
+            if occurrence > after and timestamp not in exceptions:
+                self._add((series, timestamp), occurrence, master)
+
+    def apply(self, items: list[CalEvent], now: datetime) -> None:
+        """Apply the events from a sync response to the store.
+
+        Parameters
+        ----------
+        items : list[CalEvent]
+            The changed events.
+        now : datetime
+            The current time, occurrences that have already finished are not stored.
+        """
+        floor = now - live_window
+        if self.horizon is None:
+            self.horizon = now
+        for item in items:
+            if series := item.get("recurringEventId"):
+                original = event_start(item.get("originalStartTime", item["start"]))
+                if original is None:
+                    continue
+                key = (series, timegm(original.utctimetuple()))
+                self._exceptions.setdefault(series, {})[key[1]] = item
+                self.instances.pop(key, None)
+                start = event_start(item["start"])
+                if item["status"] != "cancelled" and start is not None and start > floor:
+                    self._add(key, start, item)
+                continue
+            series = item["id"]
+            self._drop_series(series)
+            self._masters.pop(series, None)
+            if item["status"] == "cancelled":
+                self._exceptions.pop(series, None)
+                continue
+            if "recurrence" in item:
+                self._masters[series] = item
+                self._expand(series, floor, self.horizon)
+                for timestamp, exception in self._exceptions.get(series, {}).items():
+                    start = event_start(exception["start"])
+                    if exception["status"] != "cancelled" and start is not None and start > floor:
+                        self._add((series, timestamp), start, exception)
+            elif (start := event_start(item["start"])) is not None and start > floor:
+                self._add((series, timegm(start.utctimetuple())), start, item)
+
+    def extend(self, horizon: datetime, now: datetime) -> None:
+        """Expand the recurring events up to a new horizon.
+
+        Parameters
+        ----------
+        horizon : datetime
+            The time to expand the recurring events up to.
+        now : datetime
+            The current time, occurrences that have already finished are not stored.
+        """
+        if self.horizon is not None and horizon <= self.horizon:
+            return
+        after = self.horizon or now - live_window
+        for series in self._masters:
+            self._expand(series, after, horizon)
+        self.horizon = horizon
+        cutoff = timegm((now - live_window).utctimetuple())
+        for exceptions in self._exceptions.values():
+            for timestamp in [timestamp for timestamp in exceptions if timestamp < cutoff]:
+                del exceptions[timestamp]
+
+    def _current(self, timestamp: int, key: InstanceKey) -> StoredInstance | None:
+        instance = self.instances.get(key)
+        if instance is None or timegm(instance.start.utctimetuple()) != timestamp:
+            return None  # stale heap entry, the occurrence was cancelled or moved
+        return instance
+
+    def next_event(self, now: datetime) -> datetime | None:
+        """Get the start of the next (or currently live) stream, dropping finished ones.
+
+        Parameters
+        ----------
+        now : datetime
+            The current time.
+
+        Returns
+        -------
+        datetime | None
+            The start time of the next stream, or None if there are none scheduled.
+        """
+        cutoff = timegm((now - live_window).utctimetuple())
+        while self._heap:
+            timestamp, key = self._heap[0]
+            instance = self._current(timestamp, key)
+            if instance is not None and timestamp > cutoff:
+                return instance.start
+            heapq.heappop(self._heap)
+            if instance is not None:
+                self.instances.pop(key)
+                self._series.get(key[0], set()).discard(key)
+        return None
+
+    def fields(self, now: datetime, until: datetime) -> dict[int, EmbedField]:
+        """Get the embed fields for the upcoming streams.
+
+        Parameters
+        ----------
+        now : datetime
+            Streams that started before this aren't included.
+        until : datetime
+            Streams starting after this aren't included.
+
+        Returns
+        -------
+        dict[int, EmbedField]
+            The fields, keyed by the unix timestamp of the stream.
+        """
+        return {
+            timegm(instance.start.utctimetuple()): instance.field
+            for instance in self.instances.values()
+            if now <= instance.start <= until
+        }
 
 
 # noinspection GrazieInspection
@@ -211,17 +476,14 @@ class Calendar(commands.Cog):
         The bot the cog is attached to.
     message : discord.WebhookMessage
         The message the bot is editing.
+    store : EventStore
+        The local copy of the calendar.
     week_end : datetime
         The end of the week.
     webhook : discord.Webhook
         Webhook the bot is posting to.
     """
 
-    reccurence_regex = re.compile(
-        r"RRULE:FREQ=WEEKLY;UNTIL=(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})T"
-        r"(?P<hour>\d{2})(?P<minute>\d{2})(?P<second>\d{2})"
-    )  # in case this is ever needed, leaving it in
-
     def __init__(self, bot: CBot):
         self.bot: CBot = bot
         self.message: discord.WebhookMessage = MISSING
@@ -231,13 +493,14 @@ class Calendar(commands.Cog):
             + timedelta(days=7)
         )
         self.webhook: Optional[discord.Webhook] = MISSING
-        self.calendar.change_interval(time=list(half_hour_intervals()))
+        self.store: EventStore = MISSING
 
     async def cog_unload(self) -> None:  # skipcq: PYL-W0236
         """Unload hook."""
-        self.calendar.cancel()
+        self.bot.scheduler.cancel("calendar")
         self.bot.holder["message"] = self.message
         self.bot.holder["webhook"] = self.webhook
+        self.bot.holder["calendar_store"] = self.store
 
     async def cog_load(self) -> None:
         """Load hook."""
@@ -245,69 +508,48 @@ class Calendar(commands.Cog):
             Config["discord"]["webhooks"]["calendar"]
         )
         self.message = self.bot.holder.pop("message", MISSING)
-        self.calendar.start()
+        self.store = self.bot.holder.pop("calendar_store", None) or EventStore()
+        await self.bot.scheduler.register("calendar", self.calendar, Daily(tuple(half_hour_intervals())))
+
+    async def sync(self) -> None:
+        """Pull the changes to the calendar since the last sync into the store.
+
+        Without a sync token, or if Google has expired it, the store is rebuilt from a full sync.
+        """
+        page_token: str | None = None
+        while True:
+            async with self.bot.session.get(
+                events_url, params=get_params(self.store.sync_token, page_token)
+            ) as response:
+                if response.status == 410 and self.store.sync_token is not None:  # sync token expired, start over
+                    self.store.clear()
+                    page_token = None
+                    continue
+                items: CalResponse = await response.json(loads=orjson.loads)
+            now = utcnow()
+            self.store.apply(items["items"], now)
+            if (page_token := items.get("nextPageToken")) is None:
+                self.store.sync_token = items.get("nextSyncToken")
+                self.store.extend(now + timedelta(weeks=2), now)
+                return
 
-    @tasks.loop()
     async def calendar(self):
-        """Calendar loop.
+        """Calendar job.
 
-        This loop is responsible for posting the calendar every half hour.
-        It queries the Google calendar API and posts the results to the
-        webhook, after parding and formatting the results.
+        This job is responsible for posting the calendar every half hour.
+        It syncs the changes to the Google calendar into the local store and
+        posts the upcoming week from it to the webhook.
         """
-        mindatetime = datetime.now(tz=ZoneInfo("America/New_York"))
-        maxdatetime = datetime.now(tz=ZoneInfo("America/New_York")) + timedelta(weeks=1)
-        async with self.bot.session.get(
-            "https://www.googleapis.com/calendar/v3/calendars/"
-            "u8n1onpbv9pb5du7gssv2md58s@group.calendar.google.com/events",
-            params=get_params(mindatetime, maxdatetime),
-        ) as response:
-            items: CalResponse = await response.json(loads=orjson.loads)
-        fields: dict[int, EmbedField] = {}
-        cancelled_times = []
-        times: set[datetime] = set()
-        for item in items["items"]:
-            if item["status"] == "cancelled":
-                sub_time = datetime.fromisoformat(item["originalStartTime"]["dateTime"])
-                while sub_time < utcnow():
-                    sub_time = sub_time + timedelta(days=7)
-                cancelled_times.append(sub_time)
-                continue
-            sub_time = datetime.fromisoformat((item["start"]["dateTime"]))
-            flag = True
-            if mindatetime < sub_time + timedelta(hours=2):
-                times.add(sub_time)
-                flag = False
-            if sub_time < utcnow():
-                continue
-            if flag:
-                times.add(sub_time)  # pragma: no cover
-            if mindatetime < sub_time > maxdatetime:
-                continue
-            try:  # pragma: no cover
-                desc = item["description"]
-            except KeyError:  # pragma: no cover
-                default_field(fields, sub_time, item)
-            else:  # pragma: no cover
-                if url(desc):
-                    fields[timegm(sub_time.utctimetuple())] = EmbedField(
-                        f"{item['summary']}",
-                        f"{format_dt(sub_time, 'F')}\n[({sub_time.astimezone(chartime).strftime(time_format)})"
-                        f"]({desc})",
-                        True,
-                    )
-
-                else:
-                    default_field(fields, sub_time, item)
-        for sub_time in cancelled_times:
-            fields.pop(timegm(sub_time.utctimetuple()), None)
-            times.discard(sub_time)
+        await self.sync()
+        now = utcnow()
+        next_event = self.store.next_event(now)
+        fields = self.store.fields(now, now + timedelta(weeks=1))
         bot_user = self.bot.user
         assert isinstance(bot_user, discord.ClientUser)  # skipcq: BAN-B101
         if self.message is MISSING:
             assert self.webhook is not None  # skipcq: BAN-B101
             self.message = await self.webhook.fetch_message(Config["discord"]["messages"]["calendar"])
-        self.message = await self.message.edit(embed=calendar_embed(fields, min(times, default=None)))
+        self.message = await self.message.edit(embed=calendar_embed(fields, next_event))
 
 
 async def setup(bot: CBot):
@@ -5,19 +5,37 @@
 import asyncio
 import datetime
 import random
-import warnings
 from statistics import mean
-from typing import Any, cast
+from typing import TYPE_CHECKING, Any, cast
 
 import asyncpg
 import discord
-import pandas as pd
 from discord import ui
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord.utils import MISSING, utcnow
 from fluent.runtime import FluentLocalization
 
 from . import CBot, errors
+from .scheduler import Daily
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    import pandas as pd
+
+
+def read_games() -> "pd.DataFrame":
+    """Read the giveaway games, importing pandas on first use.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The games, with the index date in the form (m)m/(d)d/yyyy., and columns game, url, and source.
+    """
+    import pandas as pd
+
+    return pd.read_csv(
+        "charbot/giveaway.csv", index_col=0, usecols=[0, 1, 2, 4], names=["date", "game", "url", "source"]
+    )
 
 
 class GiveawayView(ui.View):
@@ -146,7 +164,7 @@ class GiveawayView(ui.View):
         if isinstance(error, errors.MissingProgramRole):
             await interaction.response.send_message(error.message, ephemeral=True)
         else:
-            await super(GiveawayView, self).on_error(interaction, error, item)
+            self.bot.report_error(error, f"giveaway button {getattr(item, 'label', None) or type(item).__name__}")
 
     def _prep_view_for_draw(self):
         """Disable all buttons."""
@@ -291,7 +309,8 @@ class GiveawayView(ui.View):
                 allowed_mentions=discord.AllowedMentions(users=True),
             )
         await self.bot.pool.execute("UPDATE bids SET bid = 0 WHERE bid > 0")
-        await self.bot.program_logs.send(
+        self.bot.invalidate_user_stats()
+        self.bot.program_log_sink.post(
             f"{self.game} giveaway ended. {len(bidders)} bidders, {len(winners)} winners, "
             f"{self.total_entries} entries, {self.top_bid} top bid.\n Winners:"
             f" {', '.join(w.mention for w in winners)}"
@@ -309,14 +328,13 @@ class GiveawayView(ui.View):
         button : ui.Button
             The button that was pressed.
         """
-        async with self.bot.pool.acquire() as conn:
-            wins = await conn.fetchval("SELECT wins FROM winners WHERE id = $1", interaction.user.id) or 0
-            if wins >= 3:
-                translator = FluentLocalization(
-                    [interaction.locale.value, "en-US"], ["giveaway.ftl"], self.bot.localizer_loader
-                )
-                await interaction.response.send_message(translator.format_value("giveaway-try-later"), ephemeral=True)
-                return
+        stats = await self.bot.user_stats(interaction.user.id)
+        if stats is not None and stats["wins"] >= 3:
+            translator = FluentLocalization(
+                [interaction.locale.value, "en-US"], ["giveaway.ftl"], self.bot.localizer_loader
+            )
+            await interaction.response.send_message(translator.format_value("giveaway-try-later"), ephemeral=True)
+            return
         modal = BidModal(self.bot, self)
         await interaction.response.send_modal(modal)
         await modal.wait()
@@ -338,16 +356,15 @@ class GiveawayView(ui.View):
         button : ui.Button
             The button that was pressed.
         """
-        async with self.bot.pool.acquire() as conn:
-            translator = FluentLocalization(
-                [interaction.locale.value, "en-US"], ["giveaway.ftl"], self.bot.localizer_loader
-            )
-            wins = await conn.fetchval("SELECT wins FROM winners WHERE id = $1", interaction.user.id) or 0
-            if wins >= 3:
-                await interaction.response.send_message(translator.format_value("giveaway-try-later"), ephemeral=True)
-                return
-            record = await conn.fetchval("SELECT bid FROM bids WHERE id = $1", interaction.user.id)
-            bid: int = record if record is not None else 0
+        translator = FluentLocalization(
+            [interaction.locale.value, "en-US"], ["giveaway.ftl"], self.bot.localizer_loader
+        )
+        stats = await self.bot.user_stats(interaction.user.id)
+        wins: int = stats["wins"] if stats is not None else 0
+        if wins >= 3:
+            await interaction.response.send_message(translator.format_value("giveaway-try-later"), ephemeral=True)
+            return
+        bid: int = stats["bid"] if stats is not None else 0
         chance = bid / self.total_entries
         await interaction.response.send_message(
             translator.format_value("giveaway-check-success", {"bid": bid, "chance": chance, "wins": wins}),
@@ -437,8 +454,9 @@ class BidModal(ui.Modal, title="Bid"):
             )
             return self.stop()
         await interaction.response.defer(ephemeral=True, thinking=True)
-        async with self.view.bid_lock, self.bot.pool.acquire() as conn, conn.transaction():
-            points: int | None = await conn.fetchval("SELECT points FROM users WHERE id = $1", interaction.user.id)
+        async with self.view.bid_lock:
+            stats = await self.bot.user_stats(interaction.user.id, cached=False)
+            points: int | None = stats["points"] if stats is not None else None
             if points is None or points == 0:
                 await interaction.followup.send(translator.format_value("giveaway-bid-no-rep"))
                 return self.stop()
@@ -448,40 +466,34 @@ class BidModal(ui.Modal, title="Bid"):
                 )
                 return self.stop()
             bid_int = min(bid_int, points)
-            current_bid = await conn.fetchval("SELECT bid FROM bids WHERE id = $1", interaction.user.id) or 0
+            current_bid: int = stats["bid"]
             if current_bid + bid_int > 32768:
                 bid_int = 32768 - current_bid
-            points: int | None = await conn.fetchval(
-                "UPDATE users SET points = points - $1 WHERE id = $2 RETURNING points", bid_int, interaction.user.id
-            )
-            if points is None:
-                warnings.warn("Points should not be None at this code.", RuntimeWarning)
-                points = 0
-                await conn.execute("UPDATE users SET points = 0 WHERE id = $1", interaction.user.id)
-            _new_bid: int | None = await conn.fetchval(
-                "UPDATE bids SET bid = bid + $1 WHERE id = $2 RETURNING bid", bid_int, interaction.user.id
+            # spend and bid in one statement, only if they still have the points
+            record = await self.bot.pool.fetchrow(
+                "WITH spent AS ("
+                " UPDATE users SET points = points - $1 WHERE id = $2 AND points >= $1 RETURNING id, points"
+                "), bid AS ("
+                " INSERT INTO bids (id, bid) SELECT id, $1 FROM spent"
+                " ON CONFLICT (id) DO UPDATE SET bid = bids.bid + excluded.bid RETURNING bid"
+                ") SELECT spent.points AS points, bid.bid AS bid FROM spent, bid",
+                bid_int,
+                interaction.user.id,
             )
-            if _new_bid is None:
-                warnings.warn("Bid should not be None at this code.", RuntimeWarning)
-                _new_bid = bid_int
-                await conn.execute(
-                    "INSERT INTO bids (bid,id) values ($1, $2) ON CONFLICT DO UPDATE SET bid = $1",
-                    bid_int,
-                    interaction.user.id,
+            self.bot.invalidate_user_stats(interaction.user.id)
+            if record is None:
+                await interaction.followup.send(
+                    translator.format_value("giveaway-bid-not-enough-rep", {"bid": bid_int, "points": points})
                 )
+                return self.stop()
+            points = record["points"]
+            new_bid: int = record["bid"]
             self.view.total_entries += bid_int
-            new_bid = cast(int, _new_bid)
             chance = new_bid / self.view.total_entries
             await interaction.followup.send(
                 translator.format_value(
                     "giveaway-bid-success",
-                    {
-                        "bid": bid_int,
-                        "new_bid": new_bid,
-                        "chance": chance,
-                        "points": points,
-                        "wins": await conn.fetchval("SELECT wins FROM winners WHERE id = $1", interaction.user.id) or 0,
-                    },
+                    {"bid": bid_int, "new_bid": new_bid, "chance": chance, "points": points, "wins": stats["wins"]},
                 ),
                 ephemeral=True,
             )
@@ -511,6 +523,7 @@ class Giveaway(commands.Cog):
         The member object for charlie.
     games: pandas.DataFrame
         The games dataframe, with the index date in the form (m)m/(d)d/yyyy., and columns game, url, and source.
+        Only loaded when the daily giveaway runs, so pandas isn't imported until then.
     """
 
     def __init__(self, bot: CBot):
@@ -518,13 +531,10 @@ class Giveaway(commands.Cog):
         self.yesterdays_giveaway: GiveawayView = bot.holder.pop("yesterdays_giveaway")
         self.current_giveaway: GiveawayView = bot.holder.pop("current_giveaway")
         self.charlie: discord.Member = MISSING
-        self.games: pd.DataFrame = pd.read_csv(
-            "charbot/giveaway.csv", index_col=0, usecols=[0, 1, 2, 4], names=["date", "game", "url", "source"]
-        )
+        self.games: "pd.DataFrame" = MISSING
 
     async def cog_load(self) -> None:
         """Call when the cog is loaded."""
-        self.daily_giveaway.start()
         if self.current_giveaway is not MISSING:
             message = self.current_giveaway.message
         else:
@@ -543,19 +553,28 @@ class Giveaway(commands.Cog):
         current_giveaway = GiveawayView.recreate_from_message(message, self.bot)
         await current_giveaway.message.edit(view=current_giveaway)
         self.current_giveaway = current_giveaway
+        await self.bot.scheduler.register(
+            "daily_giveaway",
+            self.daily_giveaway,
+            Daily((datetime.time(hour=9, minute=0, second=0, tzinfo=CBot.ZONEINFO),)),
+            misfire_grace=datetime.timedelta(hours=12),
+        )
 
     async def cog_unload(self) -> None:  # skipcq: PYL-W0236
         """Call when the cog is unloaded."""
-        self.daily_giveaway.cancel()
+        self.bot.scheduler.cancel("daily_giveaway")
         self.bot.holder["yesterdays_giveaway"] = self.yesterdays_giveaway
         self.bot.holder["current_giveaway"] = self.current_giveaway
 
-    @tasks.loop(time=datetime.time(hour=9, minute=0, second=0, tzinfo=CBot.ZONEINFO))  # skipcq: PYL-E1123
     async def daily_giveaway(self):
-        """Run the daily giveaway."""
+        """Run the daily giveaway, scheduled for 9am every day.
+
+        If the bot was down at 9am, it still runs when it's back, as long as that's within 12 hours.
+        """
         if self.bot.TIME().day == 1:
             # noinspection SqlWithoutWhere
             await self.bot.pool.execute("DELETE FROM winners")  # clear the table the start of each month
+            self.bot.invalidate_user_stats()
         if self.current_giveaway is not MISSING:
             self.yesterdays_giveaway = self.current_giveaway
             await self.yesterdays_giveaway.end()
@@ -564,9 +583,7 @@ class Giveaway(commands.Cog):
             if guild is None:
                 guild = await self.bot.fetch_guild(225345178955808768)
             self.charlie = await guild.fetch_member(225344348903047168)
-        self.games = pd.read_csv(
-            "charbot/giveaway.csv", index_col=0, usecols=[0, 1, 2, 4], names=["date", "game", "url", "source"]
-        )
+        self.games = await asyncio.to_thread(read_games)
         try:
             gameinfo: dict[str, str] = dict(self.games.loc[self.bot.TIME().strftime("%-m/%-d/%Y")])
         except KeyError:
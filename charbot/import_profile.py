@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""Import-cost audit of the bot, run with ``python -m charbot --import-profile``.
+
+Each module is imported in a fresh interpreter with ``-X importtime``, so the cost of an extension doesn't depend on
+what was imported before it, and the slowest imports it makes itself are listed, to find what's worth deferring.
+"""
+import pathlib
+import subprocess  # skipcq: BAN-B404
+import sys
+from collections.abc import Iterable
+from typing import NamedTuple
+
+from . import EXTENSIONS
+
+
+__all__ = ("ImportTime", "ModuleProfile", "parse_importtime", "profile_module", "format_profile", "main")
+_ROOT = pathlib.Path(__file__).parent.parent
+
+
+class ImportTime(NamedTuple):
+    """A line of ``-X importtime`` output.
+
+    Attributes
+    ----------
+    name : str
+        The imported module.
+    depth : int
+        How deeply nested the import is, 0 for the ones made by the command itself.
+    self_us : int
+        Microseconds spent importing the module itself.
+    cumulative_us : int
+        Microseconds spent importing the module and everything it imported.
+    """
+
+    name: str
+    depth: int
+    self_us: int
+    cumulative_us: int
+
+
+class ModuleProfile(NamedTuple):
+    """The import cost of a module.
+
+    Attributes
+    ----------
+    name : str
+        The module.
+    cumulative_us : int
+        Microseconds spent importing it and everything it imported, that wasn't already imported.
+    heaviest : list[ImportTime]
+        The slowest imports it made itself, slowest first.
+    error : str | None
+        The last line of the error, if importing it failed.
+    """
+
+    name: str
+    cumulative_us: int
+    heaviest: list[ImportTime]
+    error: str | None = None
+
+
+def parse_importtime(output: str) -> list[ImportTime]:
+    """Parse the output of ``-X importtime``.
+
+    Parameters
+    ----------
+    output : str
+        The interpreter's stderr.
+
+    Returns
+    -------
+    list[ImportTime]
+        The imports, in the order they finished, children before the module that imported them.
+    """
+    times = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")  # noqa: E203
+        if not self_us.strip().isdecimal():  # the header
+            continue
+        stripped = name.lstrip()
+        times.append(ImportTime(stripped, (len(name) - len(stripped) - 1) // 2, int(self_us), int(cumulative_us)))
+    return times
+
+
+def profile_module(name: str, times: list[ImportTime], top: int = 3) -> ModuleProfile:
+    """Get the cost of a module from the imports of a run that imported it.
+
+    Parameters
+    ----------
+    name : str
+        The module.
+    times : list[ImportTime]
+        The parsed imports.
+    top : int
+        How many of its slowest imports to keep.
+
+    Returns
+    -------
+    ModuleProfile
+        The module's cost, zero if it wasn't imported.
+    """
+    for index, entry in enumerate(times):
+        if entry.name == name:
+            children = []
+            for child in reversed(times[:index]):
+                if child.depth <= entry.depth:
+                    break
+                if child.depth == entry.depth + 1:
+                    children.append(child)
+            heaviest = sorted(children, key=lambda child: child.cumulative_us, reverse=True)[:top]
+            return ModuleProfile(name, entry.cumulative_us, heaviest)
+    return ModuleProfile(name, 0, [])
+
+
+def run(modules: Iterable[str]) -> list[ModuleProfile]:
+    """Import each module in a fresh interpreter, after the charbot package, and profile it.
+
+    Parameters
+    ----------
+    modules : Iterable[str]
+        The modules to profile.
+
+    Returns
+    -------
+    list[ModuleProfile]
+        The charbot package itself, then each of the modules.
+    """
+    profiles = []
+    for module in ["charbot", *modules]:
+        result = subprocess.run(  # skipcq: BAN-B603
+            [sys.executable, "-X", "importtime", "-c", f"import charbot; import {module}"],
+            cwd=_ROOT,
+            capture_output=True,
+            text=True,
+        )
+        profile = profile_module(module, parse_importtime(result.stderr))
+        if result.returncode != 0:
+            profile = profile._replace(error=result.stderr.strip().splitlines()[-1])
+        profiles.append(profile)
+    return profiles
+
+
+def format_profile(profiles: list[ModuleProfile]) -> str:
+    """Format the profiles, the charbot package first, then the modules slowest first.
+
+    Parameters
+    ----------
+    profiles : list[ModuleProfile]
+        The package's profile, then the modules'.
+
+    Returns
+    -------
+    str
+        The report.
+    """
+    package, *modules = profiles
+    lines = [f"{'module':<28}{'import':>10}  heaviest imports"]
+    for profile in [package, *sorted(modules, key=lambda profile: profile.cumulative_us, reverse=True)]:
+        heaviest = ", ".join(f"{child.name} {child.cumulative_us / 1000:.0f}ms" for child in profile.heaviest)
+        if profile.error is not None:
+            heaviest = f"failed: {profile.error}"
+        lines.append(f"{profile.name:<28}{profile.cumulative_us / 1000:>8.0f}ms  {heaviest}")
+    total = sum(profile.cumulative_us for profile in profiles)
+    lines.append(f"{'total':<28}{total / 1000:>8.0f}ms")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    """Print the import profile of the bot and every extension."""
+    print(format_profile(run(["jishaku", *EXTENSIONS])))
@@ -2,7 +2,6 @@
 # SPDX-FileCopyrightText: 2021 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
 # SPDX-License-Identifier: MIT
 """Level system."""
-import asyncio
 import datetime
 import random
 from typing import Callable, Optional, cast
@@ -11,12 +10,13 @@ import aiohttp
 import asyncpg
 import discord
 from discord import Interaction, app_commands
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord.utils import utcnow
-from disrank.generator import Generator
 from fluent.runtime import FluentLocalization
 
-from . import CBot, Config
+from . import CBot, Config, sql
+from .render import ProfileJob, filename
+from .scheduler import Daily
 
 
 async def update_level_roles(member: discord.Member, new_level: int) -> None:
@@ -57,9 +57,6 @@ class Leveling(commands.Cog):
         self._max_xp = 18
         self._xp_function: Callable[[int], int] = lambda x: (5 * x**2) + (50 * x) + 100
         self.off_cooldown: dict[int, datetime.datetime] = {}
-        self.generator = Generator()
-        self.generator.default_bg = "charbot/media/pools/card.png"
-        self.default_profile = "https://raw.githubusercontent.com/Bluesy1/CharB0T/main/charbot/media/pools/profile.png"
         self.session = aiohttp.ClientSession(
             auth=aiohttp.BasicAuth(login="Bluesy1", password=Config["github"]["token"]),
             headers=Config["github"]["headers"],
@@ -73,17 +70,18 @@ class Leveling(commands.Cog):
     async def cog_load(self) -> None:
         """Load the cog."""
         self.off_cooldown = self.bot.holder.pop("off_xp_cooldown", {})
-        self.update_pages.start()
+        await self.bot.scheduler.register(
+            "update_pages", self.update_pages, Daily(tuple(datetime.time(i) for i in range(24)))
+        )
 
     async def cog_unload(self) -> None:  # skipcq: PYL-W0236
         """Unload the cog."""
         self.bot.holder["off_xp_cooldown"] = self.off_cooldown
-        self.update_pages.cancel()
+        self.bot.scheduler.cancel("update_pages")
         await self.session.close()
 
-    @tasks.loop(time=[datetime.time(i) for i in range(24)])  # skipcq: PYL-E1123
     async def update_pages(self) -> None:
-        """Update the page."""
+        """Update the page, scheduled at the top of every hour."""
         if self._upload:
             async with self.session.post(self._post_url, json={"ref": "gh-pages"}) as _:
                 pass
@@ -99,8 +97,8 @@ class Leveling(commands.Cog):
         """
         if message.author.bot or message.guild is None:
             return
-        async with self.bot.pool.acquire() as conn, conn.transaction():
-            no_xp = await conn.fetchrow("SELECT * FROM no_xp WHERE guild = $1", message.guild.id)
+        async with self.bot.xp_pool.acquire() as conn, conn.transaction():
+            no_xp = await conn.fetchrow(sql.NO_XP, message.guild.id)
             if no_xp is None or message.channel.id in no_xp["channels"]:
                 return
             member = cast(discord.Member, message.author)
@@ -110,13 +108,11 @@ class Leveling(commands.Cog):
             if cooldown is None or cooldown.update_rate_limit() is None:
                 self._upload = True
                 self.off_cooldown[message.author.id] = utcnow() + datetime.timedelta(minutes=1)
-                user = await conn.fetchrow("SELECT * FROM xp_users WHERE id = $1", message.author.id)
+                user = await conn.fetchrow(sql.XP_USER, message.author.id)
                 gained = random.randint(self._min_xp, self._max_xp)
                 if user is None:
                     await conn.execute(
-                        "INSERT INTO xp_users "
-                        "(id, username, discriminator, xp, detailed_xp, level, messages, avatar, prestige)"
-                        " VALUES ($1, $2, $3, $4, $5, 0, 1, $6, 0) ON CONFLICT (id) DO NOTHING",
+                        sql.NEW_XP_USER,
                         member.id,
                         member.name,
                         member.discriminator,
@@ -140,8 +136,7 @@ class Leveling(commands.Cog):
                     new_level = user["level"]
                     new_xp = user["xp"] + gained
                 await conn.execute(
-                    "UPDATE xp_users SET level = $1, detailed_xp = $2, xp = $3, messages = messages + 1,"
-                    " avatar = $4 WHERE id = $5",
+                    sql.UPDATE_XP_USER,
                     new_level,
                     detailed,
                     new_xp,
@@ -184,7 +179,7 @@ class Leveling(commands.Cog):
 
     @app_commands.command()
     @app_commands.guild_only()
-    @app_commands.checks.cooldown(1, 3600, key=lambda interaction: interaction.user.id)
+    @app_commands.checks.cooldown(1, 60, key=lambda interaction: interaction.user.id)
     async def rank(self, interaction: Interaction, user: Optional[discord.Member] = None):
         """Check your or someone's level and rank.
 
@@ -215,19 +210,21 @@ class Leveling(commands.Cog):
                     ).format_value("rank-error")
                 )
                 return
-        image = await asyncio.to_thread(
-            self.generator.generate_profile,
-            profile_image=member.avatar.url if member.avatar is not None else self.default_profile,
-            level=user_record["level"],
-            current_xp=user_record["detailed_xp"][2] - user_record["detailed_xp"][0],
-            user_xp=user_record["xp"],
-            next_xp=user_record["detailed_xp"][2] - user_record["detailed_xp"][0] + user_record["detailed_xp"][1],
-            user_position=user_record["rank"],
-            user_name=f"{member.name}#{member.discriminator}",
-            user_status="offline" if isinstance(cached_member.status, str) else cached_member.status.value,
+        profile = await self.bot.avatars.get(member.avatar, 180) if member.avatar is not None else None
+        image = await self.bot.renderer.render(
+            ProfileJob(
+                profile_image=profile,
+                level=user_record["level"],
+                current_xp=user_record["detailed_xp"][2] - user_record["detailed_xp"][0],
+                user_xp=user_record["xp"],
+                next_xp=user_record["detailed_xp"][2] - user_record["detailed_xp"][0] + user_record["detailed_xp"][1],
+                user_position=user_record["rank"],
+                user_name=f"{member.name}#{member.discriminator}",
+                user_status="offline" if isinstance(cached_member.status, str) else cached_member.status.value,
+            )
         )
 
-        await interaction.followup.send(file=discord.File(image, "profile.png"))
+        await interaction.followup.send(file=discord.File(image, filename(ProfileJob, "profile")))
 
 
 async def setup(bot: CBot):
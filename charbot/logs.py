@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""Logging that never writes from the event loop.
+
+The handlers from the logging config are moved behind a queue, and written to by a listener thread, so the loop only
+ever puts records on a queue. Formatting, tracebacks included, happens on the listener thread too. Bursts of the same
+message are rate limited before they're queued, so an error storm costs a few records, not thousands, and the queue is
+bounded, dropping records rather than growing without limit if the handlers can't keep up.
+
+Handlers configured without a formatter write JSON lines.
+"""
+import asyncio
+import copy
+import datetime
+import logging
+import logging.config
+import queue
+import time
+from collections.abc import Callable, Iterable
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+
+import orjson
+
+from .sql_stats import QUERY_TAG
+
+
+__all__ = ("JsonFormatter", "ContextFilter", "DuplicateFilter", "NonBlockingQueueHandler", "QueuedLogging", "setup")
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as JSON lines, with the context the bot adds to them.
+
+    Can be used from the logging config with ``"()": "charbot.logs.JsonFormatter"``.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Format a record as a JSON object.
+
+        Parameters
+        ----------
+        record : logging.LogRecord
+            The record.
+
+        Returns
+        -------
+        str
+            The record, as a single line of JSON.
+        """
+        data: dict[str, Any] = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("tag", "task", "suppressed"):
+            if value := getattr(record, key, None):
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        if record.stack_info:
+            data["stack"] = self.formatStack(record.stack_info)
+        return orjson.dumps(data, default=str).decode()
+
+
+class ContextFilter(logging.Filter):
+    """Adds what was running to records, from where they were logged.
+
+    Adds ``tag``, what ran the current task, like ``command:Admin.ping``, and ``task``, the name of the current task.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Add the context to a record.
+
+        Parameters
+        ----------
+        record : logging.LogRecord
+            The record.
+
+        Returns
+        -------
+        bool
+            Always True.
+        """
+        record.tag = QUERY_TAG.get()
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        record.task = task.get_name() if task is not None else None
+        return True
+
+
+class DuplicateFilter(logging.Filter):
+    """Rate limits records of the same message.
+
+    Records are the same when they're from the same logger, at the same level, with the same unformatted message. At
+    most ``limit`` of them pass per ``window`` seconds, the first to pass after some were suppressed has how many in
+    its ``suppressed`` attribute.
+
+    Parameters
+    ----------
+    window : float
+        The length of the window, in seconds.
+    limit : int
+        How many of the same record pass per window.
+    clock : Callable[[], float]
+        The clock to time with, in seconds.
+    """
+
+    def __init__(self, window: float = 60.0, limit: int = 5, clock: Callable[[], float] = time.monotonic):
+        super().__init__()
+        self.window = window
+        self.limit = limit
+        self._clock = clock
+        # start of the window, records in it, records suppressed since the last one passed
+        self._seen: dict[tuple[str, int, str], list[Any]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Decide whether a record passes.
+
+        Parameters
+        ----------
+        record : logging.LogRecord
+            The record.
+
+        Returns
+        -------
+        bool
+            Whether it passes, False if it's suppressed.
+        """
+        now = self._clock()
+        key = (record.name, record.levelno, str(record.msg))
+        if (seen := self._seen.get(key)) is None or now - seen[0] >= self.window:
+            suppressed = seen[2] if seen is not None else 0
+            if len(self._seen) >= 1024:
+                self._prune(now)
+            self._seen[key] = [now, 1, 0]
+        else:
+            seen[1] += 1
+            if seen[1] > self.limit:
+                seen[2] += 1
+                return False
+            suppressed = seen[2]
+            seen[2] = 0
+        # the record is shared with every other handler, the message is only changed on the queued copy
+        record.suppressed = suppressed
+        return True
+
+    def _prune(self, now: float) -> None:
+        for key in [key for key, seen in self._seen.items() if now - seen[0] >= self.window]:
+            del self._seen[key]
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Puts records on a bounded queue, dropping them if it's full.
+
+    Unlike the standard queue handler, only the message is merged here, the traceback is left to be formatted by the
+    listener thread.
+
+    Attributes
+    ----------
+    dropped : int
+        How many records were dropped because the queue was full.
+    """
+
+    def __init__(self, queue_: "queue.Queue[logging.LogRecord]"):
+        super().__init__(queue_)
+        self.dropped: int = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Merge the message of a record with its arguments, which may change after it's queued.
+
+        Parameters
+        ----------
+        record : logging.LogRecord
+            The record.
+
+        Returns
+        -------
+        logging.LogRecord
+            A copy of the record, ready to be queued.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if suppressed := getattr(record, "suppressed", 0):
+            record.msg = f"{record.msg} [{suppressed} more like this suppressed]"
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Queue a record, or drop it if the queue is full.
+
+        Parameters
+        ----------
+        record : logging.LogRecord
+            The record.
+        """
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class QueuedLogging:
+    """Moves the handlers of the configured loggers behind queues, written to by listener threads.
+
+    Each logger with handlers gets its own queue and listener, so records still only go to the handlers that were
+    configured for them.
+
+    Parameters
+    ----------
+    maxsize : int
+        The most records each queue holds.
+    window : float
+        The rate limit window of the duplicate filter, in seconds.
+    limit : int
+        How many of the same record pass per window.
+
+    Attributes
+    ----------
+    handlers : list[NonBlockingQueueHandler]
+        The queue handlers that replaced the configured ones.
+    """
+
+    def __init__(self, maxsize: int = 10000, window: float = 60.0, limit: int = 5):
+        self.maxsize = maxsize
+        self.window = window
+        self.limit = limit
+        self.handlers: list[NonBlockingQueueHandler] = []
+        self._listeners: list[QueueListener] = []
+
+    @property
+    def dropped(self) -> int:
+        """How many records were dropped because a queue was full."""
+        return sum(handler.dropped for handler in self.handlers)
+
+    def start(self, loggers: Iterable[logging.Logger] | None = None) -> None:
+        """Move the handlers of loggers behind queues, and start writing to them.
+
+        Parameters
+        ----------
+        loggers : Iterable[logging.Logger] | None
+            The loggers to move the handlers of, None for every logger that has any.
+        """
+        if loggers is None:
+            loggers = [logging.getLogger()] + [
+                logger for logger in logging.Logger.manager.loggerDict.values() if isinstance(logger, logging.Logger)
+            ]
+        for logger in loggers:
+            if not logger.handlers or any(isinstance(handler, QueueHandler) for handler in logger.handlers):
+                continue
+            targets = list(logger.handlers)
+            for target in targets:
+                if target.formatter is None:
+                    target.setFormatter(JsonFormatter())
+                logger.removeHandler(target)
+            handler = NonBlockingQueueHandler(queue.Queue(self.maxsize))
+            handler.addFilter(DuplicateFilter(self.window, self.limit))
+            handler.addFilter(ContextFilter())
+            logger.addHandler(handler)
+            listener = QueueListener(handler.queue, *targets, respect_handler_level=True)
+            listener.start()
+            self.handlers.append(handler)
+            self._listeners.append(listener)
+
+    def stop(self) -> None:
+        """Write out the queued records and stop the listener threads."""
+        for listener in self._listeners:
+            listener.stop()
+        self._listeners.clear()
+
+
+def setup(config: dict[str, Any]) -> QueuedLogging:
+    """Configure logging from the config, then move the configured handlers behind queues.
+
+    Parameters
+    ----------
+    config : dict[str, Any]
+        The logging config, in the ``logging.config.dictConfig`` format.
+
+    Returns
+    -------
+    QueuedLogging
+        The started pipeline, stop it on exit so the queued records are written.
+    """
+    logging.config.dictConfig(config)
+    pipeline = QueuedLogging()
+    pipeline.start()
+    return pipeline
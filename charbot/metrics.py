@@ -0,0 +1,539 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""In-process metrics, served over HTTP in the Prometheus text format.
+
+Metrics measured as things happen, like event and command latency, live in the registry. Everything the bot's
+services already keep count of, like queue depths, cache hits and query latency, is read from them by collectors
+when the metrics are scraped, so the hot paths don't pay for it twice.
+"""
+import bisect
+import logging
+import time
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any, Final, Generic, Literal, TypeVar
+
+import discord
+from aiohttp import web
+
+from .cache import LRUCache
+
+
+__all__ = (
+    "BUCKETS",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "Family",
+    "Registry",
+    "BotMetrics",
+    "TimedResponse",
+    "MetricsServer",
+)
+_LOGGER = logging.getLogger("charbot.metrics")
+# upper bounds of the latency buckets, in seconds
+BUCKETS: tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE: Final[str] = "text/plain; version=0.0.4; charset=utf-8"
+Kind = Literal["counter", "gauge", "histogram"]
+M = TypeVar("M", "Counter", "Gauge", "Histogram")
+
+
+class Counter:
+    """A value that only goes up.
+
+    Attributes
+    ----------
+    value : float
+        The current value.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value: float = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Add to the counter.
+
+        Parameters
+        ----------
+        amount : float
+            How much to add.
+        """
+        self.value += amount
+
+
+class Gauge:
+    """A value that goes up and down.
+
+    Attributes
+    ----------
+    value : float
+        The current value.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value: float = 0.0
+
+    def set(self, value: float) -> None:
+        """Set the gauge.
+
+        Parameters
+        ----------
+        value : float
+            The new value.
+        """
+        self.value = value
+
+
+class Histogram:
+    """A latency histogram with fixed buckets.
+
+    Attributes
+    ----------
+    counts : list[int]
+        How many observations fell in each bucket, with a last one for those over the largest bound.
+    count : int
+        How many observations there were.
+    total : float
+        The sum of the observations, in seconds.
+    max : float
+        The largest observation, in seconds.
+    """
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts: list[int] = [0] * (len(BUCKETS) + 1)
+        self.count: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        """Record an observation.
+
+        Parameters
+        ----------
+        seconds : float
+            The observed latency.
+        """
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: "Histogram") -> None:
+        """Add another histogram's observations to this one.
+
+        Parameters
+        ----------
+        other : Histogram
+            The histogram to add.
+        """
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile, as the upper bound of the bucket it falls in.
+
+        Parameters
+        ----------
+        q : float
+            The quantile, between 0 and 1.
+
+        Returns
+        -------
+        float
+            The estimate in seconds, the largest observation if it's over the largest bound, 0 with no observations.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+_KINDS: dict[str, type[Counter | Gauge | Histogram]] = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Family(Generic[M]):
+    """A metric, with one child per set of label values.
+
+    Parameters
+    ----------
+    name : str
+        The name of the metric.
+    help : str
+        What the metric measures.
+    kind : Kind
+        The type of metric, counter, gauge or histogram.
+    labelnames : tuple[str, ...]
+        The names of the labels the children are told apart by.
+
+    Attributes
+    ----------
+    children : dict[tuple[str, ...], M]
+        The children, by their label values.
+    """
+
+    def __init__(self, name: str, help: str, kind: Kind, labelnames: tuple[str, ...] = ()):  # skipcq: PYL-W0622
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = labelnames
+        self.children: dict[tuple[str, ...], M] = {}
+        self._factory: Callable[[], M] = _KINDS[kind]  # type: ignore
+
+    def labels(self, *values: str) -> M:
+        """Get the child for a set of label values, making it if needed.
+
+        Parameters
+        ----------
+        *values : str
+            The label values, in the order of the label names.
+
+        Returns
+        -------
+        M
+            The child.
+
+        Raises
+        ------
+        ValueError
+            If the amount of values doesn't match the amount of labels.
+        """
+        if (child := self.children.get(values)) is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes {len(self.labelnames)} label values, not {len(values)}")
+            child = self.children[values] = self._factory()
+        return child
+
+    def _labels(self, values: tuple[str, ...], le: str | None = None) -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if le is not None:
+            pairs.append(f'le="{le}"')
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def expose(self) -> Iterator[str]:
+        """Format the metric in the Prometheus text format.
+
+        Yields
+        ------
+        str
+            Each line of the metric.
+        """
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, child in self.children.items():
+            if isinstance(child, Histogram):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, child.counts):
+                    cumulative += count
+                    yield f"{self.name}_bucket{self._labels(values, str(bound))} {cumulative}"
+                yield f"{self.name}_bucket{self._labels(values, '+Inf')} {child.count}"
+                yield f"{self.name}_sum{self._labels(values)} {_number(child.total)}"
+                yield f"{self.name}_count{self._labels(values)} {child.count}"
+            else:
+                yield f"{self.name}{self._labels(values)} {_number(child.value)}"
+
+
+class Registry:
+    """The metrics to serve.
+
+    Attributes
+    ----------
+    families : dict[str, Family]
+        The metrics measured as things happen, by name.
+    """
+
+    def __init__(self):
+        self.families: dict[str, Family[Any]] = {}
+        self._collectors: list[Callable[[], Iterable[Family[Any]]]] = []
+
+    def _add(self, family: Family[M]) -> Family[M]:
+        if family.name in self.families:
+            raise ValueError(f"A metric is already registered as {family.name}")
+        self.families[family.name] = family
+        return family
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Family[Counter]:  # skipcq: PYL-W0622
+        """Register a counter.
+
+        Parameters
+        ----------
+        name : str
+            The name of the metric.
+        help : str
+            What the metric counts.
+        labelnames : tuple[str, ...]
+            The names of its labels.
+
+        Returns
+        -------
+        Family[Counter]
+            The metric.
+
+        Raises
+        ------
+        ValueError
+            If a metric is already registered with the name.
+        """
+        return self._add(Family(name, help, "counter", labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Family[Gauge]:  # skipcq: PYL-W0622
+        """Register a gauge.
+
+        Parameters
+        ----------
+        name : str
+            The name of the metric.
+        help : str
+            What the metric measures.
+        labelnames : tuple[str, ...]
+            The names of its labels.
+
+        Returns
+        -------
+        Family[Gauge]
+            The metric.
+
+        Raises
+        ------
+        ValueError
+            If a metric is already registered with the name.
+        """
+        return self._add(Family(name, help, "gauge", labelnames))
+
+    def histogram(
+        self, name: str, help: str, labelnames: tuple[str, ...] = ()  # skipcq: PYL-W0622
+    ) -> Family[Histogram]:
+        """Register a latency histogram.
+
+        Parameters
+        ----------
+        name : str
+            The name of the metric.
+        help : str
+            What the metric times.
+        labelnames : tuple[str, ...]
+            The names of its labels.
+
+        Returns
+        -------
+        Family[Histogram]
+            The metric.
+
+        Raises
+        ------
+        ValueError
+            If a metric is already registered with the name.
+        """
+        return self._add(Family(name, help, "histogram", labelnames))
+
+    def register(self, collector: Callable[[], Iterable[Family[Any]]]) -> None:
+        """Register a collector, called on every scrape for metrics read from elsewhere.
+
+        Parameters
+        ----------
+        collector : Callable[[], Iterable[Family]]
+            Gives the metrics, made fresh for each scrape.
+        """
+        self._collectors.append(collector)
+
+    def expose(self) -> str:
+        """Format every metric in the Prometheus text format.
+
+        A collector that fails is logged and skipped, so one broken service doesn't hide the rest.
+
+        Returns
+        -------
+        str
+            The metrics.
+        """
+        lines: list[str] = []
+        for family in self.families.values():
+            lines.extend(family.expose())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception:  # skipcq: PYL-W0703
+                _LOGGER.exception("Metrics collector %r failed", collector)
+                continue
+            for family in families:
+                lines.extend(family.expose())
+        return "\n".join(lines) + "\n"
+
+
+class BotMetrics(Registry):
+    """The bot's metrics.
+
+    Attributes
+    ----------
+    events : Family[Histogram]
+        How long each event's listeners take, by event.
+    app_commands : Family[Histogram]
+        How long application commands take, by command and whether they succeeded.
+    acks : Family[Histogram]
+        How long application commands take to respond to or defer their interaction, by command.
+    caches : dict[str, LRUCache]
+        The caches to report the hits and misses of, by name.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.events = self.histogram("charbot_event_seconds", "How long event listeners took.", ("event",))
+        self.app_commands = self.histogram(
+            "charbot_app_command_seconds", "How long application commands took.", ("command", "outcome")
+        )
+        self.acks = self.histogram(
+            "charbot_interaction_ack_seconds",
+            "How long application commands took to respond to or defer their interaction.",
+            ("command",),
+        )
+        self.caches: dict[str, LRUCache[Any, Any]] = {}
+        self.register(self._collect_caches)
+
+    def command_started(self, interaction: discord.Interaction) -> None:
+        """Start timing an application command, and how long it takes to acknowledge its interaction.
+
+        Parameters
+        ----------
+        interaction : discord.Interaction
+            The interaction invoking the command, before anything has responded to it.
+        """
+        if interaction.command is None:
+            return
+        interaction.extras["started"] = time.perf_counter()
+        TimedResponse.install(interaction, self.acks.labels(interaction.command.qualified_name).observe)
+
+    def command_finished(self, interaction: discord.Interaction, outcome: str) -> None:
+        """Record how long an application command took.
+
+        Parameters
+        ----------
+        interaction : discord.Interaction
+            The interaction that invoked the command.
+        outcome : str
+            How the command ended, like ``ok`` or ``error``.
+        """
+        if interaction.command is not None and (started := interaction.extras.get("started")) is not None:
+            self.app_commands.labels(interaction.command.qualified_name, outcome).observe(time.perf_counter() - started)
+
+    def _collect_caches(self) -> Iterator[Family[Any]]:
+        requests: Family[Counter] = Family(
+            "charbot_cache_requests_total", "Cache lookups, by whether they hit.", "counter", ("cache", "result")
+        )
+        size: Family[Gauge] = Family("charbot_cache_entries", "How many entries caches hold.", "gauge", ("cache",))
+        for name, cache in self.caches.items():
+            requests.labels(name, "hit").inc(cache.hits)
+            requests.labels(name, "miss").inc(cache.misses)
+            size.labels(name).set(len(cache))
+        yield requests
+        yield size
+
+
+# the slot the response type is kept in, which every kind of response sets when it's sent
+_RESPONSE_TYPE: Any = discord.InteractionResponse.__dict__["_response_type"]
+
+
+class TimedResponse(discord.InteractionResponse):
+    """An interaction response that reports when the interaction is first responded to or deferred.
+
+    Parameters
+    ----------
+    parent : discord.Interaction
+        The interaction.
+    on_ack : Callable[[], None]
+        Called when the interaction is first responded to or deferred.
+    """
+
+    __slots__ = ("_on_ack",)
+
+    def __init__(self, parent: discord.Interaction, on_ack: Callable[[], None]):
+        self._on_ack = on_ack
+        super().__init__(parent)
+
+    @property
+    def _response_type(self) -> discord.InteractionResponseType | None:
+        return _RESPONSE_TYPE.__get__(self)
+
+    @_response_type.setter
+    def _response_type(self, value: discord.InteractionResponseType | None) -> None:
+        if value is not None and _RESPONSE_TYPE.__get__(self) is None:
+            self._on_ack()
+        _RESPONSE_TYPE.__set__(self, value)
+
+    @classmethod
+    def install(cls, interaction: discord.Interaction, on_ack: Callable[[float], None]) -> None:
+        """Time how long until an interaction is responded to or deferred, from now.
+
+        Call before anything has responded to it.
+
+        Parameters
+        ----------
+        interaction : discord.Interaction
+            The interaction.
+        on_ack : Callable[[float], None]
+            Called with how many seconds it took.
+        """
+        start = time.perf_counter()
+        # the response is cached in this slot, putting ours there makes every response go through it
+        interaction._cs_response = cls(  # pyright: ignore[reportGeneralTypeIssues]
+            interaction, lambda: on_ack(time.perf_counter() - start)
+        )
+
+
+class MetricsServer:
+    """Serves a registry's metrics on ``/metrics``.
+
+    Parameters
+    ----------
+    registry : Registry
+        The metrics to serve.
+    host : str
+        The address to listen on, local only by default.
+    port : int
+        The port to listen on.
+    """
+
+    def __init__(self, registry: Registry, host: str = "127.0.0.1", port: int = 9091):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner: web.AppRunner | None = None
+
+    async def _metrics(self, _: web.Request) -> web.Response:
+        return web.Response(body=self.registry.expose().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    async def start(self) -> None:
+        """Start serving the metrics."""
+        if self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        _LOGGER.info("Serving metrics on http://%s:%s/metrics", self.host, self.port)
+
+    async def close(self) -> None:
+        """Stop serving the metrics."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
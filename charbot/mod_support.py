@@ -2,20 +2,44 @@
 # SPDX-FileCopyrightText: 2021 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
 # SPDX-License-Identifier: MIT
 """Mod Support cog."""
+import asyncio
 import logging
+import os
 import pathlib
-from datetime import timedelta
-from typing import Final, Any
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from typing import Final, Any, cast
 
 import discord
 import orjson
 from discord import Embed, Interaction, PermissionOverwrite, Permissions, app_commands, ui
-from discord.ext import tasks
-from discord.ext.commands import GroupCog
+from discord.ext.commands import Cog, GroupCog
 from discord.ui import Item
 from discord.utils import utcnow
 
 from . import CBot
+from .scheduler import Every
+
+
+STALE_AFTER: Final[timedelta] = timedelta(days=3)  # tickets without a human message for this long are deleted
+ACTIVITY_DEBOUNCE: Final[timedelta] = timedelta(minutes=15)  # far below STALE_AFTER, so one write per busy period
+
+
+def is_ticket(channel: object) -> bool:
+    """Check if a channel is a mod support ticket channel.
+
+    Parameters
+    ----------
+    channel : object
+        The channel to check.
+
+    Returns
+    -------
+    bool
+        Whether the channel is a ticket channel.
+    """
+    return isinstance(channel, discord.TextChannel) and channel.name.endswith("mod-support")
 
 
 async def edit_check(interaction: Interaction) -> bool:
@@ -39,6 +63,97 @@ async def edit_check(interaction: Interaction) -> bool:
     )
 
 
+class Blacklist:
+    """The users banned from mod support, held in memory and written through to disk.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The JSON file the blacklist is stored in.
+
+    Attributes
+    ----------
+    path : pathlib.Path
+        The JSON file the blacklist is stored in.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path: Final[pathlib.Path] = path
+        self._users: set[int] = set()
+        self._lock = asyncio.Lock()
+
+    def __contains__(self, user_id: object) -> bool:
+        """Check if a user is blacklisted."""
+        return user_id in self._users
+
+    def __iter__(self):
+        """Iterate over the blacklisted user ids."""
+        return iter(self._users)
+
+    def __len__(self) -> int:
+        """Get the amount of blacklisted users."""
+        return len(self._users)
+
+    async def load(self) -> None:
+        """Read the blacklist from disk."""
+        data = await asyncio.to_thread(self.path.read_bytes)
+        self._users = set(orjson.loads(data)["blacklisted"])
+
+    def _write(self, users: list[int]) -> None:
+        """Atomically replace the file, so a crash mid write can't leave it truncated."""
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(orjson.dumps({"blacklisted": users}))
+                file.flush()
+                os.fsync(file.fileno())
+            if self.path.exists():  # mkstemp makes the file private, keep the permissions the blacklist had
+                shutil.copymode(self.path, tmp)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    async def _update(self, user_id: int, add: bool) -> bool:
+        async with self._lock:
+            if (user_id in self._users) is add:
+                return False
+            users = self._users | {user_id} if add else self._users - {user_id}
+            await asyncio.to_thread(self._write, sorted(users))
+            self._users = users
+            return True
+
+    async def add(self, user_id: int) -> bool:
+        """Add a user to the blacklist.
+
+        Parameters
+        ----------
+        user_id : int
+            The user to add.
+
+        Returns
+        -------
+        bool
+            Whether the user was added, False if they were already blacklisted.
+        """
+        return await self._update(user_id, True)
+
+    async def remove(self, user_id: int) -> bool:
+        """Remove a user from the blacklist.
+
+        Parameters
+        ----------
+        user_id : int
+            The user to remove.
+
+        Returns
+        -------
+        bool
+            Whether the user was removed, False if they weren't blacklisted.
+        """
+        return await self._update(user_id, False)
+
+
 class ModSupport(GroupCog, name="modsupport", description="mod support command group"):
     """Mod Support Cog.
 
@@ -53,58 +168,139 @@ class ModSupport(GroupCog, name="modsupport", description="mod support command g
     ----------
     bot : CBot
         The bot object.
+    blacklist : Blacklist
+        The users banned from mod support.
     """
 
     def __init__(self, bot: CBot):
         super(ModSupport, self).__init__()
         self.bot = bot
-        self.blacklist_path: Final[pathlib.Path] = pathlib.Path(__file__).parent / "mod_support_blacklist.json"
+        self.blacklist = Blacklist(pathlib.Path(__file__).parent / "mod_support_blacklist.json")
+        self._recorded: dict[int, datetime] = {}
 
     async def cog_unload(self) -> None:  # skipcq: PYL-W0236
         """Unload func."""
-        self.check_mod_support_channels.cancel()
+        self.bot.scheduler.cancel("check_mod_support_channels")
 
     async def cog_load(self) -> None:
         """Cog load func."""
-        self.check_mod_support_channels.start()
+        await self.blacklist.load()
+        await self.bot.scheduler.register(
+            "check_mod_support_channels", self.check_mod_support_channels, Every(timedelta(hours=8))
+        )
         guild = self.bot.get_guild(225345178955808768)
         if guild is None:
             guild = await self.bot.fetch_guild(225345178955808768)
         everyone = guild.default_role
         mod_roles = guild.get_role(338173415527677954)
         assert isinstance(mod_roles, discord.Role)  # skipcq: BAN-B101
+        mod_ids = (146285543146127361, 363095569515806722, 138380316095021056, 162833689196101632, 82495450153750528)
         mods = {
-            "146285543146127361": await guild.fetch_member(146285543146127361),
-            "363095569515806722": await guild.fetch_member(363095569515806722),
-            "138380316095021056": await guild.fetch_member(138380316095021056),
-            "162833689196101632": await guild.fetch_member(162833689196101632),
-            "82495450153750528": await guild.fetch_member(82495450153750528),
+            str(member.id): member
+            for member in await asyncio.gather(*(guild.fetch_member(mod_id) for mod_id in mod_ids))
         }
-        self.bot.add_view(ModSupportButtons(everyone, mod_roles, mods))
+        self.bot.add_view(ModSupportButtons(everyone, mod_roles, mods, self.blacklist))
+
+    async def record_activity(self, channel_id: int, when: datetime) -> None:
+        """Record activity in a ticket channel.
+
+        Parameters
+        ----------
+        channel_id : int
+            The ticket channel.
+        when : datetime
+            When the activity happened.
+        """
+        await self.bot.pool.execute(
+            "INSERT INTO mod_support_activity (channel_id, last_activity) VALUES ($1, $2) ON CONFLICT (channel_id)"
+            " DO UPDATE SET last_activity = GREATEST(mod_support_activity.last_activity, EXCLUDED.last_activity)",
+            channel_id,
+            when,
+        )
+        self._recorded[channel_id] = when
+
+    @Cog.listener()
+    async def on_message(self, message: discord.Message):
+        """Index the last human message in each ticket channel.
+
+        Parameters
+        ----------
+        message : discord.Message
+            The message that was sent.
+        """
+        if message.author.bot or message.guild is None or message.guild.id != 225345178955808768:
+            return
+        if not is_ticket(message.channel):
+            return
+        last = self._recorded.get(message.channel.id)
+        if last is not None and message.created_at - last < ACTIVITY_DEBOUNCE:
+            return
+        await self.record_activity(message.channel.id, message.created_at)
+
+    @Cog.listener()
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        """Index new ticket channels, so they get a full grace period before their first message.
+
+        Parameters
+        ----------
+        channel : discord.abc.GuildChannel
+            The channel that was created.
+        """
+        if channel.guild.id == 225345178955808768 and is_ticket(channel):
+            await self.record_activity(channel.id, channel.created_at)
+
+    @Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        """Forget the activity of deleted ticket channels.
+
+        Parameters
+        ----------
+        channel : discord.abc.GuildChannel
+            The channel that was deleted.
+        """
+        if is_ticket(channel):
+            self._recorded.pop(channel.id, None)
+            await self.bot.pool.execute("DELETE FROM mod_support_activity WHERE channel_id = $1", channel.id)
+
+    async def _bootstrap(self, channel: discord.TextChannel) -> None:
+        """Index a ticket channel the activity index doesn't know about yet, from its history."""
+        last = channel.created_at
+        async for message in channel.history(limit=None, after=utcnow() - STALE_AFTER, oldest_first=False):
+            if not message.author.bot:
+                last = message.created_at
+                break
+        await self.record_activity(channel.id, last)
 
-    @tasks.loop(hours=8)
     async def check_mod_support_channels(self):
-        """Remove stale modmail channels."""
+        """Remove stale modmail channels, scheduled every 8 hours.
+
+        Uses the activity index rather than the channels' history, so only channels the index doesn't know yet, like
+        the ones from before it existed, are read, and only once.
+        """
         guild = self.bot.get_guild(225345178955808768)
         if guild is None:
-            guild = await self.bot.fetch_guild(225345178955808768)
-        channels = await guild.fetch_channels()
-        cared: list[discord.TextChannel] = [
-            channel
-            for channel in channels
-            if channel.name.endswith("mod-support") and isinstance(channel, discord.TextChannel)
-        ]
-        for channel in cared:
-            temp = True
-            async for message in channel.history(after=utcnow() - timedelta(days=3)):
-                user = self.bot.user
-                assert isinstance(user, discord.ClientUser)  # skipcq: BAN-B101
-                if message.author.id == user.id:
-                    continue
-                temp = False
-                break
-            if temp:
+            return
+        tickets = {channel.id: channel for channel in guild.text_channels if is_ticket(channel)}
+        known: set[int] = {
+            record["channel_id"]
+            for record in await self.bot.pool.fetch(
+                "SELECT channel_id FROM mod_support_activity WHERE channel_id = ANY($1::BIGINT[])", list(tickets)
+            )
+        }
+        for channel_id, channel in tickets.items():
+            if channel_id not in known:
+                await self._bootstrap(channel)
+        stale = await self.bot.pool.fetch(
+            "SELECT channel_id FROM mod_support_activity WHERE last_activity < $1", utcnow() - STALE_AFTER
+        )
+        for record in stale:
+            if (channel := tickets.get(record["channel_id"])) is not None:
                 await channel.delete()
+            else:  # deleted while the bot was offline
+                self._recorded.pop(record["channel_id"], None)
+                await self.bot.pool.execute(
+                    "DELETE FROM mod_support_activity WHERE channel_id = $1", record["channel_id"]
+                )
 
     @app_commands.command(name="query", description="queries list of users banned from mod support")
     @app_commands.guild_only()
@@ -119,8 +315,7 @@ class ModSupport(GroupCog, name="modsupport", description="mod support command g
             The interaction object for the command.
         """
         if await edit_check(interaction):
-            with open(self.blacklist_path, "rb") as file:
-                blacklisted = [f"<@{item}>" for item in orjson.loads(file.read())["blacklisted"]]
+            blacklisted = [f"<@{item}>" for item in sorted(self.blacklist)]
             await interaction.response.send_message(
                 embed=Embed(title="Blacklisted users", description="\n".join(blacklisted)),
                 ephemeral=True,
@@ -146,20 +341,7 @@ class ModSupport(GroupCog, name="modsupport", description="mod support command g
             User to change
         """
         if await edit_check(interaction):
-            successful = False
-            with open(self.blacklist_path, "rb") as file:
-                modmail_blacklist = orjson.loads(file.read())
-            if add:
-                if user.id not in modmail_blacklist["blacklisted"]:
-                    modmail_blacklist["blacklisted"].append(user.id)
-                    with open(self.blacklist_path, "wb") as file:
-                        file.write(orjson.dumps(modmail_blacklist))
-                    successful = True
-            elif user.id in modmail_blacklist["blacklisted"]:
-                modmail_blacklist["blacklisted"].remove(user.id)
-                with open(self.blacklist_path, "wb") as file:
-                    file.write(orjson.dumps(modmail_blacklist))
-                successful = True
+            successful = await (self.blacklist.add(user.id) if add else self.blacklist.remove(user.id))
             if add and successful:
                 await interaction.response.send_message(
                     f"<@{user.id}> successfully added to the blacklist", ephemeral=True
@@ -196,6 +378,8 @@ class ModSupportButtons(ui.View):
         The mod role for the guild.
     mods : dict
         A dict of the mods in the guild.
+    blacklist : Blacklist
+        The users banned from mod support.
     """
 
     _PRIVATE_OPTIONS = [
@@ -211,12 +395,13 @@ class ModSupportButtons(ui.View):
         everyone: discord.Role,
         mod_role: discord.Role,
         mods: dict[str, discord.Member],
+        blacklist: Blacklist,
     ):
         super().__init__(timeout=None)
         self.everyone = everyone
         self.mod_role = mod_role
         self.mods = mods
-        self.filename: Final[pathlib.Path] = pathlib.Path(__file__).parent / "mod_support_blacklist.json"
+        self.blacklist = blacklist
 
     async def interaction_check(self, interaction: Interaction) -> bool:
         """Check to run for all interaction instances.
@@ -231,13 +416,13 @@ class ModSupportButtons(ui.View):
         bool
             True if the interaction should be run, False otherwise.
         """
-        with open(self.filename, "rb") as file:
-            return interaction.user.id not in orjson.loads(file.read())["blacklisted"]
+        return interaction.user.id not in self.blacklist
 
     async def on_error(self, interaction: Interaction, error: Exception, item: Item[Any], /) -> None:
-        """On error logger"""
-        logging.getLogger("charbot.mod_support").error(
-            "Ignoring exception in view %r for item %r, with user %s", self, item, interaction.user, exc_info=error
+        """On error logger, repeats of an error already logged are only counted."""
+        label = getattr(item, "label", None) or type(item).__name__
+        cast(CBot, interaction.client).report_error(
+            error, f"mod support {label} for {interaction.user}", logging.getLogger("charbot.mod_support")
         )
 
     async def standard_callback(self, button: discord.ui.Button, interaction: Interaction):
@@ -262,6 +447,7 @@ class ModSupportButtons(ui.View):
                     user: PermissionOverwrite.from_pair(Permissions(139586817088), Permissions.none()),
                 },
                 f"{button.label}-{user.name}-mod-support",
+                self.blacklist,
             )
         )
 
@@ -350,7 +536,9 @@ class ModSupportButtons(ui.View):
         }
         for uid in select.values:
             perms[self.mods[uid]] = PermissionOverwrite.from_pair(Permissions(139586817088), Permissions.none())
-        await interaction.response.send_modal(ModSupportModal(perms, f"Private-{user.name}-mod-support"))
+        await interaction.response.send_modal(
+            ModSupportModal(perms, f"Private-{user.name}-mod-support", self.blacklist)
+        )
 
 
 class ModSupportModal(ui.Modal, title="Mod Support Form"):
@@ -364,6 +552,8 @@ class ModSupportModal(ui.Modal, title="Mod Support Form"):
         A dictionary of role, member, and user to permission overrides.
     channel_name: str
         The name of the channel to be created on modal submit.
+    blacklist: Blacklist
+        The users banned from mod support.
 
     Attributes
     ----------
@@ -371,8 +561,8 @@ class ModSupportModal(ui.Modal, title="Mod Support Form"):
         A dictionary of role, member, and user to permission overrides.
     channel_name: str
         The name of the channel to be created on modal submit.
-    filename: str
-        The name of the file to be used to store the blacklist.
+    blacklist: Blacklist
+        The users banned from mod support.
     """
 
     logger = logging.getLogger("charbot.mod_support")
@@ -381,11 +571,12 @@ class ModSupportModal(ui.Modal, title="Mod Support Form"):
         self,
         perm_overrides: dict[discord.Role | discord.Member, discord.PermissionOverwrite],
         channel_name: str,
+        blacklist: Blacklist,
     ):
         super().__init__(title="Mod Support Form")
         self.perm_overrides = perm_overrides
         self.channel_name = channel_name
-        self.filename = "charbot/mod_support_blacklist.json"
+        self.blacklist = blacklist
 
     async def interaction_check(self, interaction: Interaction) -> bool:
         """Check to run for all interaction instances.
@@ -402,8 +593,7 @@ class ModSupportModal(ui.Modal, title="Mod Support Form"):
         bool
             Whether or not the interaction user is allowed to use this modal.
         """
-        with open(self.filename, "rb") as file:
-            return interaction.user.id not in orjson.loads(file.read())["blacklisted"]
+        return interaction.user.id not in self.blacklist
 
     short_description = ui.TextInput(
         label="Short Description of your problem/query",
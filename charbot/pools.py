@@ -2,7 +2,6 @@
 # SPDX-FileCopyrightText: 2021 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
 # SPDX-License-Identifier: MIT
 """Reputation pools."""
-import asyncio
 from typing import Final
 
 import asyncpg
@@ -11,7 +10,7 @@ from discord import Interaction, app_commands
 from discord.ext import commands
 
 from . import CBot, errors
-from .card import generate_card
+from .render import CardJob, filename
 
 
 CHANNEL_ID: Final[int] = 969972085445238784
@@ -144,22 +143,9 @@ class Pools(commands.GroupCog, name="pools", description="Reputation pools for c
             after = await conn.fetchval(
                 "UPDATE pools SET current = current + $1 WHERE pool = $2 returning current", amount, pool
             )
-        image_bytes = await asyncio.to_thread(
-            generate_card,
-            level=pool_record["level"],
-            base_rep=pool_record["start"],
-            current_rep=after,
-            completed_rep=pool_record["cap"],
-            pool_name=pool,
-            reward=pool_record["reward"],
-        )
-        image = discord.File(image_bytes, filename=f"{pool}.png")
-        await interaction.followup.send(
-            f"You have added {amount} rep to {pool} you now have {remaining} rep remaining.", file=image
-        )
-        if after == pool_record["cap"]:
-            image_bytes = await asyncio.to_thread(
-                generate_card,
+        self.bot.invalidate_user_stats(interaction.user.id)
+        image_bytes = await self.bot.renderer.render(
+            CardJob(
                 level=pool_record["level"],
                 base_rep=pool_record["start"],
                 current_rep=after,
@@ -167,7 +153,23 @@ class Pools(commands.GroupCog, name="pools", description="Reputation pools for c
                 pool_name=pool,
                 reward=pool_record["reward"],
             )
-            image = discord.File(image_bytes, filename=f"{pool}.png")
+        )
+        image = discord.File(image_bytes, filename=filename(CardJob, pool))
+        await interaction.followup.send(
+            f"You have added {amount} rep to {pool} you now have {remaining} rep remaining.", file=image
+        )
+        if after == pool_record["cap"]:
+            image_bytes = await self.bot.renderer.render(
+                CardJob(
+                    level=pool_record["level"],
+                    base_rep=pool_record["start"],
+                    current_rep=after,
+                    completed_rep=pool_record["cap"],
+                    pool_name=pool,
+                    reward=pool_record["reward"],
+                )
+            )
+            image = discord.File(image_bytes, filename=filename(CardJob, pool))
             channel = interaction.channel
             assert isinstance(channel, discord.abc.Messageable)  # skipcq: BAN-B101
             await channel.send(f"{interaction.user.mention} has filled {pool}!", file=image)
@@ -199,16 +201,17 @@ class Pools(commands.GroupCog, name="pools", description="Reputation pools for c
             if all(role.id not in pool_record["required_roles"] for role in user.roles):
                 await interaction.followup.send("Pool not found. Please choose one from the autocomplete.")
                 return
-        image_bytes = await asyncio.to_thread(
-            generate_card,
-            level=pool_record["level"],
-            base_rep=pool_record["start"],
-            current_rep=pool_record["current"],
-            completed_rep=pool_record["cap"],
-            pool_name=pool,
-            reward=pool_record["reward"],
+        image_bytes = await self.bot.renderer.render(
+            CardJob(
+                level=pool_record["level"],
+                base_rep=pool_record["start"],
+                current_rep=pool_record["current"],
+                completed_rep=pool_record["cap"],
+                pool_name=pool,
+                reward=pool_record["reward"],
+            )
         )
-        await interaction.followup.send(file=discord.File(image_bytes, filename=f"{pool}.png"))
+        await interaction.followup.send(file=discord.File(image_bytes, filename=filename(CardJob, pool)))
 
 
 async def setup(bot: CBot):
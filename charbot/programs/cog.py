@@ -3,8 +3,6 @@
 #
 # SPDX-License-Identifier: MIT
 """Program classes and functions."""
-import asyncio
-import datetime
 import random
 import re
 from itertools import count
@@ -16,7 +14,7 @@ from discord.ext import commands
 
 from .. import CBot, GuildInteraction as Interaction, errors
 from . import sudoku, tictactoe, shrugman
-from .minesweeper import Minesweeper
+from .minesweeper import FILENAME as MINESWEEPER_FILENAME, Minesweeper
 from charbot_rust.minesweeper import Game as MinesweeperGame  # pyright: ignore[reportGeneralTypeIssues]
 
 MESSAGE: Final = "You must be at least level 1 to participate in the giveaways system and be in <#969972085445238784>."
@@ -92,9 +90,9 @@ class Reputation(commands.Cog, name="Programs"):
         """
         await interaction.response.defer(ephemeral=True)
         view = tictactoe.TicTacToe(difficulty)
-        embed = discord.Embed(title="TicTacToe").set_image(url="attachment://tictactoe.png")
+        embed = discord.Embed(title="TicTacToe").set_image(url=f"attachment://{tictactoe.FILENAME}")
         embed.set_footer(text="Play by typing /programs tictactoe")
-        image = await asyncio.to_thread(view.display)
+        image = await view.display(interaction.client.renderer)
         await interaction.followup.send(embed=embed, view=view, file=image)
 
     @programs.command(
@@ -155,11 +153,14 @@ class Reputation(commands.Cog, name="Programs"):
         else:
             game = MinesweeperGame.super_expert()
         view = Minesweeper(game)
-        file = await view.draw(await interaction.client.translate("minesweeper-lose-title", interaction.locale))
+        file = await view.draw(
+            interaction.client.renderer,
+            await interaction.client.translate("minesweeper-lose-title", interaction.locale),
+        )
         embed = discord.Embed(title="Minesweeper", color=discord.Color.dark_purple())
         embed.set_footer(text="Play by typing /programs minesweeper")
         embed.set_author(name=interaction.user.display_name, icon_url=interaction.user.display_avatar.url)
-        embed.set_image(url="attachment://minesweeper.png")
+        embed.set_image(url=f"attachment://{MINESWEEPER_FILENAME}")
         await interaction.followup.send(embed=embed, view=view, file=file)
 
     # noinspection SpellCheckingInspection
@@ -174,28 +175,28 @@ class Reputation(commands.Cog, name="Programs"):
             The interaction of the command invocation.
         """
         await interaction.response.defer(ephemeral=True)
-        giveaway_user = await self.bot.giveaway_user(interaction.user.id)
-        if giveaway_user is None:
-            async with self.bot.pool.acquire() as conn:
-                await conn.execute("INSERT INTO users (id, points) VALUES ($1, 20)", interaction.user.id)
-                await conn.execute(
-                    "INSERT INTO daily_points (id, last_claim, last_particip_dt, particip, won) VALUES "
-                    "($1, $2, $3, 0, 0)",
-                    interaction.user.id,
-                    self.bot.TIME(),
-                    self.bot.TIME() - datetime.timedelta(days=1),
-                )
-                await conn.execute("INSERT INTO bids (id, bid) VALUES ($1, 0)", interaction.user.id)
-                await interaction.followup.send("You got some Rep today, inmate")
-            return
-        if giveaway_user["daily"] >= self.bot.TIME():
+        # One statement, so the claim is atomic and costs a single round trip: the daily_points upsert only touches
+        # the row if the last claim was before today's, and the rest only happen if it did. The user is created with
+        # the points if they're new, which is fine for the foreign keys, as they're checked at the end of the statement
+        points = await self.bot.pool.fetchval(
+            "WITH claim AS ("
+            " INSERT INTO daily_points (id, last_claim, last_particip_dt, particip, won)"
+            " VALUES ($1, $2::TIMESTAMPTZ, $2::TIMESTAMPTZ - INTERVAL '1 day', 0, 0)"
+            " ON CONFLICT (id) DO UPDATE SET last_claim = excluded.last_claim"
+            " WHERE daily_points.last_claim < excluded.last_claim RETURNING id"
+            "), award AS ("
+            " INSERT INTO users (id, points) SELECT id, 20 FROM claim"
+            " ON CONFLICT (id) DO UPDATE SET points = users.points + 20 RETURNING points"
+            "), bid AS ("
+            " INSERT INTO bids (id, bid) SELECT id, 0 FROM claim ON CONFLICT (id) DO NOTHING"
+            ") SELECT points FROM award",
+            interaction.user.id,
+            self.bot.TIME(),
+        )
+        self.bot.invalidate_user_stats(interaction.user.id)
+        if points is None:
             await interaction.followup.send("No more Rep for you yet, get back to your cell")
             return
-        async with self.bot.pool.acquire() as conn:
-            await conn.execute("UPDATE users SET points = points + 20 WHERE id = $1", interaction.user.id)
-            await conn.execute(
-                "UPDATE daily_points SET last_claim = $1 WHERE id = $2", self.bot.TIME(), interaction.user.id
-            )
         await interaction.followup.send("You got some Rep today, inmate")
 
     @app_commands.command(
@@ -211,20 +212,18 @@ class Reputation(commands.Cog, name="Programs"):
             The interaction of the command invocation.
         """
         await interaction.response.defer(ephemeral=True)
-        async with self.bot.pool.acquire() as conn:
-            points = await conn.fetchval("SELECT points from users where id = $1", interaction.user.id) or 0
-            # noinspection SpellCheckingInspection
-            limits = await conn.fetchrow("SELECT * from daily_points where id = $1", interaction.user.id) or {
-                "last_claim": 0,
-                "last_particip_dt": 0,
-                "particip": 0,
-            }
-            wins = await conn.fetchval("SELECT wins FROM winners WHERE id = $1", interaction.user.id) or 0
-        claim = "have" if limits["last_claim"] == self.bot.TIME() else "haven't"
         # noinspection SpellCheckingInspection
-        particip = (
-            "have" if (limits["last_particip_dt"] == self.bot.TIME()) and (limits["particip"] >= 10) else "haven't"
-        )
+        stats = await self.bot.user_stats(interaction.user.id) or {
+            "points": 0,
+            "last_claim": None,
+            "last_particip_dt": None,
+            "particip": 0,
+            "wins": 0,
+        }
+        points, wins = stats["points"], stats["wins"]
+        claim = "have" if stats["last_claim"] == self.bot.TIME() else "haven't"
+        # noinspection SpellCheckingInspection
+        particip = "have" if (stats["last_particip_dt"] == self.bot.TIME()) and (stats["particip"] >= 10) else "haven't"
         await interaction.followup.send(
             f"You have {points} reputation, you {claim} claimed your daily bonus, and you {particip} hit"
             f" your daily program cap, and have {wins}/3 wins in the last month.",
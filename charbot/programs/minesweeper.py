@@ -6,19 +6,22 @@
 
 """Minesweeper game."""
 import string
-from io import BytesIO
+from typing import Final
 
 from fluent.runtime import FluentResourceLoader, FluentLocalization
 from typing_extensions import Self
 
 import discord
-from PIL import Image
 from discord import ButtonStyle, ui, SelectOption
 
 from .. import GuildComponentInteraction as Interaction, CBot
+from ..render import MinesweeperJob, RenderService, filename
 from charbot_rust import minesweeper
 
 
+FILENAME: Final[str] = filename(MinesweeperJob, "minesweeper")
+
+
 class Minesweeper(ui.View):
     """Minesweeper view for rust.
 
@@ -68,22 +71,26 @@ class Minesweeper(ui.View):
         self.row.placeholder = i18n("minesweeper-select-row-placeholder")
         self.column.placeholder = i18n("minesweeper-select-col-placeholder")
 
-    async def draw(self, alt: str) -> discord.File:
+    async def draw(self, renderer: RenderService, alt: str) -> discord.File:
         """Draw the game board.
 
         This method is called every time the view is drawn. It draws the game board and returns it as a discord.File.
 
+        Parameters
+        ----------
+        renderer : RenderService
+            The workers to encode the image in.
+        alt : str
+            The alt text of the image.
+
         Returns
         -------
         discord.File
             The game board as a discord.File.
         """
         board, size = self.game.draw()
-        img = Image.frombytes("RGB", size, bytes(board))
-        bytesio = BytesIO()
-        img.save(bytesio, "PNG")
-        bytesio.seek(0)
-        return discord.File(bytesio, filename="minesweeper.png", description=alt)
+        image = await renderer.render(MinesweeperJob(bytes(board), tuple(size)))
+        return discord.File(image, filename=FILENAME, description=alt)
 
     async def handle_lose(self, interaction: Interaction[CBot]):
         """Handle a loss.
@@ -108,8 +115,8 @@ class Minesweeper(ui.View):
                 data={"awarded": awarded},
             ),
             color=discord.Color.red(),
-        ).set_image(url="attachment://minesweeper.png")
-        file = await self.draw(await translate("minesweeper-image-alt-text", locale))
+        ).set_image(url=f"attachment://{FILENAME}")
+        file = await self.draw(interaction.client.renderer, await translate("minesweeper-image-alt-text", locale))
         await interaction.edit_original_response(attachments=[file], embed=embed, view=None)
         self.stop()
 
@@ -136,8 +143,8 @@ class Minesweeper(ui.View):
                 data={"awarded": awarded},
             ),
             color=discord.Color.green(),
-        ).set_image(url="attachment://minesweeper.png")
-        file = await self.draw(await translate("minesweeper-image-alt-text", locale))
+        ).set_image(url=f"attachment://{FILENAME}")
+        file = await self.draw(interaction.client.renderer, await translate("minesweeper-image-alt-text", locale))
         await interaction.edit_original_response(attachments=[file], embed=embed, view=None)
         self.stop()
 
@@ -156,7 +163,10 @@ class Minesweeper(ui.View):
         """
         val = select.values[0]
         self.game.change_row(int(val))
-        file = await self.draw(await interaction.client.translate("minesweeper-image-alt-text", interaction.locale))
+        file = await self.draw(
+            interaction.client.renderer,
+            await interaction.client.translate("minesweeper-image-alt-text", interaction.locale),
+        )
         for opt in select.options:
             opt.default = opt.value == val
         await interaction.response.edit_message(attachments=[file], view=self)
@@ -176,7 +186,10 @@ class Minesweeper(ui.View):
         """
         val = select.values[0]
         self.game.change_col(int(val))
-        file = await self.draw(await interaction.client.translate("minesweeper-image-alt-text", interaction.locale))
+        file = await self.draw(
+            interaction.client.renderer,
+            await interaction.client.translate("minesweeper-image-alt-text", interaction.locale),
+        )
         for opt in select.options:
             opt.default = opt.value == val
         await interaction.response.edit_message(attachments=[file], view=self)
@@ -200,7 +213,10 @@ class Minesweeper(ui.View):
         elif self.game.is_win():
             await self.handle_win(interaction)
         else:
-            file = await self.draw(await interaction.client.translate("minesweeper-image-alt-text", interaction.locale))
+            file = await self.draw(
+                interaction.client.renderer,
+                await interaction.client.translate("minesweeper-image-alt-text", interaction.locale),
+            )
             await interaction.response.edit_message(attachments=[file], view=self)
             if res == minesweeper.RevealResult.Flagged:  # pyright: ignore[reportGeneralTypeIssues]
                 await interaction.followup.send(
@@ -233,7 +249,8 @@ class Minesweeper(ui.View):
                 await self.handle_win(interaction)
             else:
                 file = await self.draw(
-                    await interaction.client.translate("minesweeper-image-alt-text", interaction.locale)
+                    interaction.client.renderer,
+                    await interaction.client.translate("minesweeper-image-alt-text", interaction.locale),
                 )
                 await interaction.response.edit_message(attachments=[file], view=self)
         else:
@@ -254,7 +271,10 @@ class Minesweeper(ui.View):
         """
         res = self.game.toggle_flag()
         if res:
-            file = await self.draw(await interaction.client.translate("minesweeper-image-alt-text", interaction.locale))
+            file = await self.draw(
+                interaction.client.renderer,
+                await interaction.client.translate("minesweeper-image-alt-text", interaction.locale),
+            )
             await interaction.response.edit_message(attachments=[file], view=self)
         else:
             await interaction.response.send_message(  # pragma: no cover
@@ -280,8 +300,11 @@ class Minesweeper(ui.View):
             title=await interaction.client.translate("minesweeper-quit-title", interaction.locale),
             description=await interaction.client.translate("minesweeper-quit-description", interaction.locale),
             color=discord.Color.red(),
-        ).set_image(url="attachment://minesweeper.png")
-        file = await self.draw(await interaction.client.translate("minesweeper-image-alt-text", interaction.locale))
+        ).set_image(url=f"attachment://{FILENAME}")
+        file = await self.draw(
+            interaction.client.renderer,
+            await interaction.client.translate("minesweeper-image-alt-text", interaction.locale),
+        )
         await interaction.response.edit_message(attachments=[file], embed=embed, view=None)
         self.stop()
 
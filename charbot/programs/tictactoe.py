@@ -6,21 +6,22 @@
 
 import asyncio
 import datetime
-import pathlib
-from io import BytesIO
-from typing import cast
+from typing import Final, cast
 
 from typing_extensions import Self
 
 import discord
-from PIL import Image
 from discord import ButtonStyle, ui
 from discord.utils import utcnow
 
 from .. import GuildComponentInteraction as Interaction, CBot
+from ..render import RenderService, TicTacToeJob, filename
 from charbot_rust.tictactoe import Game, Difficulty, Piece  # pyright: ignore[reportGeneralTypeIssues]
 
 
+FILENAME: Final[str] = filename(TicTacToeJob, "tictactoe")
+
+
 class TicTacToe(ui.View):
     """Tic Tac Toe View.
 
@@ -67,28 +68,25 @@ class TicTacToe(ui.View):
         self.bot_right.disabled = True
         self.stop()
 
-    def display(self) -> discord.File:
+    async def display(self, renderer: RenderService) -> discord.File:
         """Display the tictactoe game as an image.
 
+        Parameters
+        ----------
+        renderer : RenderService
+            The workers to render the image in.
+
         Returns
         -------
         discord.File
             The image of the tictactoe game.
         """
-        grid = Image.open(pathlib.Path(__file__).parent.parent / "media/tictactoe/grid.png", "r").convert("RGBA")
-        cross = Image.open(pathlib.Path(__file__).parent.parent / "media/tictactoe/X.png", "r")
-        circle = Image.open(pathlib.Path(__file__).parent.parent / "media/tictactoe/O.png", "r")
-        for command, display in self.game.display_commands():
-            if display == Piece.Empty:
-                continue
-            if display == Piece.X:
-                grid.paste(cross, command.value, cross)
-            elif display == Piece.O:
-                grid.paste(circle, command.value, circle)
-        buffer = BytesIO()
-        grid.save(buffer, format="PNG")
-        buffer.seek(0)
-        return discord.File(buffer, filename="tictactoe.png")
+        pieces = tuple(
+            (command.value, "X" if display == Piece.X else "O")
+            for command, display in self.game.display_commands()
+            if display != Piece.Empty
+        )
+        return discord.File(await renderer.render(TicTacToeJob(pieces)), filename=FILENAME)
 
     async def move(self, interaction: Interaction[CBot], button: ui.Button[Self], pos: int) -> None:
         """Call this to handle a move button press.
@@ -118,10 +116,10 @@ class TicTacToe(ui.View):
                 f"{utcnow().replace(microsecond=0) - self.time.replace(microsecond=0)} seconds! You gained "
                 f"{gained_points} reputation. {'(Daily Cap Reached)' if gained_points != max_points else ''}",
                 color=discord.Color.green(),
-            ).set_image(url="attachment://tictactoe.png")
+            ).set_image(url=f"attachment://{FILENAME}")
             embed.set_footer(text="Start playing by typing /programs tictactoe")
             self.disable()
-            image = await asyncio.to_thread(self.display)
+            image = await self.display(interaction.client.renderer)
             await interaction.edit_original_response(attachments=[image], embed=embed, view=self)
         elif self.game.has_player_lost():
             points = self.game.points()
@@ -134,10 +132,10 @@ class TicTacToe(ui.View):
                 f"{utcnow().replace(microsecond=0) - self.time.replace(microsecond=0)} seconds! You gained "
                 f"{gained_points} reputation. {'(Daily Cap Reached)' if gained_points != max_points else ''}",
                 color=discord.Color.red(),
-            ).set_image(url="attachment://tictactoe.png")
+            ).set_image(url=f"attachment://{FILENAME}")
             embed.set_footer(text="Start playing by typing /programs tictactoe")
             self.disable()
-            image = await asyncio.to_thread(self.display)
+            image = await self.display(interaction.client.renderer)
             await interaction.edit_original_response(attachments=[image], embed=embed, view=self)
         elif self.game.is_draw():
             points = self.game.points()
@@ -150,13 +148,13 @@ class TicTacToe(ui.View):
                 f"{utcnow().replace(microsecond=0) - self.time.replace(microsecond=0)} seconds! You gained "
                 f"{gained_points} reputation. {'(Daily Cap Reached)' if gained_points != max_points else ''}",
                 color=discord.Color.gold(),
-            ).set_image(url="attachment://tictactoe.png")
+            ).set_image(url=f"attachment://{FILENAME}")
             embed.set_footer(text="Start playing by typing /programs tictactoe")
             self.disable()
-            image = await asyncio.to_thread(self.display)
+            image = await self.display(interaction.client.renderer)
             await interaction.edit_original_response(attachments=[image], embed=embed, view=self)
         else:
-            image = await asyncio.to_thread(self.display)
+            image = await self.display(interaction.client.renderer)
             await interaction.edit_original_response(attachments=[image], view=self)
 
     @ui.button(style=ButtonStyle.green, emoji="✅")  # pyright: ignore[reportGeneralTypeIssues]
@@ -215,7 +213,7 @@ class TicTacToe(ui.View):
             title="TicTacToe",
             description=f"Cancelled, time taken: {utcnow().replace(microsecond=0) - self.time.replace(microsecond=0)}",
             color=discord.Color.red(),
-        ).set_image(url="attachment://tictactoe.png")
+        ).set_image(url=f"attachment://{FILENAME}")
         embed.set_footer(text="Start playing by typing /programs tictactoe")
         await interaction.response.edit_message(embed=embed)
 
@@ -2,20 +2,28 @@
 # SPDX-FileCopyrightText: 2021 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
 # SPDX-License-Identifier: MIT
 """Query extension."""
+
 import asyncio
+import hashlib
+import logging
+import multiprocessing
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from io import BytesIO
-from datetime import datetime
-from typing import cast, TYPE_CHECKING, Final
+from datetime import datetime, timedelta
+from typing import cast, TYPE_CHECKING, Final, NamedTuple
 from zoneinfo import ZoneInfo
 
 import discord
-import pytesseract
 from discord import app_commands
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord.ext.commands import Cog, Context
 from PIL import Image, ImageOps
 
+from .cache import LRUCache, TTLCache
+from .scheduler import Every
 
 if TYPE_CHECKING:  # pragma: no cover
     from . import CBot, GuildInteraction as Interaction
@@ -44,6 +52,378 @@ __rules__: Final[dict[int, str]] = {
     "Find a way to say it another way, if the bot kills your message.",
 }
 __source__ = "<https://github.com/Bluesy1/CharB0T/tree/main/charbot>"
+_LOGGER = logging.getLogger("charbot.query")
+
+
+OCR_MIN_WIDTH: Final[int] = 1000  # small images are upscaled, tesseract misses text under ~20px high
+OCR_MAX_WIDTH: Final[int] = 2000  # big screenshots are downscaled, past this it's only slower, not more accurate
+OCR_MARGIN: Final[int] = 10  # border kept around the content when cropping, tesseract reads badly at the edge
+OCR_STRIP_HEIGHT: Final[int] = 1600  # tall images are read as strips of this height
+OCR_STRIP_OVERLAP: Final[int] = 80  # so a line of text cut by one strip is whole in the next
+
+
+class _Strip(NamedTuple):
+    """A preprocessed piece of an image, in a form that's cheap to send to a worker process."""
+
+    mode: str
+    size: tuple[int, int]
+    data: bytes
+
+
+def otsu_threshold(histogram: list[int]) -> int:
+    """Find the threshold that best splits a grayscale histogram into foreground and background.
+
+    Parameters
+    ----------
+    histogram : list[int]
+        The 256 bin histogram of a grayscale image.
+
+    Returns
+    -------
+    int
+        The threshold, pixels above it are background.
+    """
+    total = sum(histogram)
+    weighted_total = sum(i * count for i, count in enumerate(histogram))
+    background = weighted_background = 0
+    best, threshold = -1.0, 127
+    for i, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        weighted_background += i * count
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best:
+            best, threshold = variance, i
+    return threshold
+
+
+def preprocess(img: Image.Image, *, binarise: bool = True) -> list[Image.Image]:
+    """Prepare an image for tesseract.
+
+    Takes the first frame, flattens it to grayscale on white, scales it to a width tesseract reads well, crops the
+    empty margins, optionally binarises it, and splits tall images into overlapping strips.
+
+    Parameters
+    ----------
+    img : Image.Image
+        The image to prepare.
+    binarise : bool
+        Whether to threshold the image to black and white.
+
+    Returns
+    -------
+    list[Image.Image]
+        The strips to read, from top to bottom.
+    """
+    if getattr(img, "is_animated", False):
+        img.seek(0)
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        flat = Image.new("RGBA", img.size, "white")
+        flat.alpha_composite(img)
+        img = flat
+    gray = ImageOps.grayscale(img)
+    if gray.width > OCR_MAX_WIDTH:
+        gray = gray.resize((OCR_MAX_WIDTH, round(gray.height * OCR_MAX_WIDTH / gray.width)), Image.Resampling.LANCZOS)
+    elif gray.width < OCR_MIN_WIDTH:
+        scale = min(OCR_MIN_WIDTH / gray.width, 3)
+        gray = gray.resize((round(gray.width * scale), round(gray.height * scale)), Image.Resampling.BICUBIC)
+    histogram = gray.histogram()
+    threshold = otsu_threshold(histogram)
+    dark = sum(histogram[: threshold + 1])
+    if dark > gray.width * gray.height - dark:
+        gray = ImageOps.invert(gray)  # light text on a dark background, tesseract wants dark on light
+        threshold = 255 - threshold
+    if bbox := gray.point(lambda px: 255 if px <= threshold else 0).getbbox():
+        left, top, right, bottom = bbox
+        gray = gray.crop(
+            (
+                max(left - OCR_MARGIN, 0),
+                max(top - OCR_MARGIN, 0),
+                min(right + OCR_MARGIN, gray.width),
+                min(bottom + OCR_MARGIN, gray.height),
+            )
+        )
+    if binarise:
+        gray = gray.point(lambda px: 0 if px <= threshold else 255)
+    if gray.height <= OCR_STRIP_HEIGHT + OCR_STRIP_OVERLAP:
+        return [gray]
+    step = OCR_STRIP_HEIGHT - OCR_STRIP_OVERLAP
+    return [
+        gray.crop((0, top, gray.width, min(top + OCR_STRIP_HEIGHT, gray.height)))
+        for top in range(0, gray.height - OCR_STRIP_OVERLAP, step)
+    ]
+
+
+def clean_text(text: str) -> str:
+    """Collapse the blank lines tesseract leaves in its output.
+
+    Parameters
+    ----------
+    text : str
+        The raw tesseract output.
+
+    Returns
+    -------
+    str
+        The cleaned text.
+    """
+    unfiltered = re.sub(r"\n[\n ]*", "\n", text)
+    return re.sub(r"", "", unfiltered, flags=re.IGNORECASE)
+
+
+def join_strips(texts: list[str]) -> str:
+    """Join the text read from overlapping strips, dropping the lines read twice in the overlap.
+
+    Parameters
+    ----------
+    texts : list[str]
+        The text of each strip, from top to bottom.
+
+    Returns
+    -------
+    str
+        The text of the whole image.
+    """
+    lines: list[str] = []
+    for text in texts:
+        new = text.strip("\n").split("\n")
+        for size in range(min(len(lines), len(new)), 0, -1):
+            if [line.strip() for line in lines[-size:]] == [line.strip() for line in new[:size]]:
+                new = new[size:]
+                break
+        lines.extend(new)
+    return "\n".join(lines)
+
+
+def get_text(image: BytesIO, *, binarise: bool = True) -> str:
+    """Get the text from an image using pytesseract.
+
+    Parameters
+    ----------
+    image : BytesIO
+        The image to read.
+    binarise : bool
+        Whether to threshold the image to black and white before reading it.
+
+    Returns
+    -------
+    str
+        The text in the image.
+    """
+    import pytesseract  # imported on first use, it's slow to import and only needed here and in the OCR workers
+
+    strips = preprocess(Image.open(image), binarise=binarise)
+    return join_strips([clean_text(pytesseract.image_to_string(strip)) for strip in strips])
+
+
+def _prepare_job(data: bytes) -> list[_Strip]:
+    """Worker process entry point, preprocesses an image into strips."""
+    return [_Strip(strip.mode, strip.size, strip.tobytes()) for strip in preprocess(Image.open(BytesIO(data)))]
+
+
+def _read_strip(strip: _Strip) -> str:
+    """Worker process entry point, reads the text in a strip."""
+    import pytesseract
+
+    return clean_text(pytesseract.image_to_string(Image.frombytes(strip.mode, strip.size, strip.data)))
+
+
+class OCRQueueFull(Exception):
+    """Raised when the OCR queue can't take another image.
+
+    Parameters
+    ----------
+    per_user : bool
+        Whether it's the user's share of the queue that's full, rather than the whole queue.
+    """
+
+    def __init__(self, per_user: bool):
+        super().__init__("Too many images are queued for OCR for this user." if per_user else "The OCR queue is full.")
+        self.per_user: bool = per_user
+
+
+class _OCRJob(NamedTuple):
+    digest: bytes
+    data: bytes
+    future: "asyncio.Future[str]"
+
+
+class OCRService:
+    """A bounded pool of OCR worker processes, fed from a single queue that is shared fairly between users.
+
+    Each user gets their own queue, and the workers take jobs from the users in turn, so one person queueing a pile of
+    images only delays themselves. Results are cached by the hash of the image, and an image that is already being
+    read is only read once, however many people ask for it.
+
+    Parameters
+    ----------
+    workers : int
+        The amount of worker processes, which is also how many images are read at once.
+    max_pending : int
+        The most images that can be waiting in the queue.
+    max_pending_per_user : int
+        The most images a single user can have waiting in the queue.
+    cache : LRUCache[bytes, str] | None
+        The result cache to use, a new one is made if not given.
+
+    Attributes
+    ----------
+    cache : LRUCache[bytes, str]
+        Cached OCR results, by the sha256 of the image.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_pending: int = 20,
+        max_pending_per_user: int = 3,
+        cache: LRUCache[bytes, str] | None = None,
+    ):
+        self.workers: int = workers
+        self.max_pending: int = max_pending
+        self.max_pending_per_user: int = max_pending_per_user
+        self.cache: LRUCache[bytes, str] = cache if cache is not None else LRUCache(256)
+        self._queues: dict[int, deque[_OCRJob]] = {}
+        self._turns: deque[int] = deque()
+        self._in_flight: dict[bytes, asyncio.Future[str]] = {}
+        self._pending: int = 0
+        self._wakeup = asyncio.Event()
+        self._executor: ProcessPoolExecutor | None = None
+        self._tasks: list[asyncio.Task[None]] = []
+
+    @property
+    def pending(self) -> int:
+        """The amount of images waiting in the queue."""
+        return self._pending
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn rather than fork, forking the running bot would copy its sockets and event loop into the workers
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_executor(self, broken: ProcessPoolExecutor | None) -> None:
+        """Replace a broken executor, unless another worker already has."""
+        if self._executor is not broken:
+            return
+        if broken is not None:
+            broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._new_executor()
+
+    def start(self) -> None:
+        """Start the worker processes and the tasks feeding them."""
+        if self._tasks:
+            return
+        self._executor = self._new_executor()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"ocr-worker-{i}") for i in range(self.workers)]
+
+    async def close(self) -> None:
+        """Stop the workers, failing anything still queued."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for queue in self._queues.values():
+            for job in queue:
+                if not job.future.done():
+                    job.future.cancel()
+        self._queues.clear()
+        self._turns.clear()
+        self._in_flight.clear()
+        self._pending = 0
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def read(self, user_id: int, data: bytes) -> str:
+        """Read the text in an image, waiting for a turn in the queue if needed.
+
+        Parameters
+        ----------
+        user_id : int
+            The user who asked for the image to be read, used to share the queue fairly.
+        data : bytes
+            The image.
+
+        Returns
+        -------
+        str
+            The text in the image.
+
+        Raises
+        ------
+        OCRQueueFull
+            If the queue, or the user's share of it, is full.
+        """
+        digest = hashlib.sha256(data).digest()
+        if (cached := self.cache.get(digest)) is not None:
+            return cached
+        if (future := self._in_flight.get(digest)) is not None:
+            return await asyncio.shield(future)
+        if self._pending >= self.max_pending:
+            raise OCRQueueFull(per_user=False)
+        queue = self._queues.get(user_id)
+        if queue is not None and len(queue) >= self.max_pending_per_user:
+            raise OCRQueueFull(per_user=True)
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[digest] = future
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+            self._turns.append(user_id)
+        queue.append(_OCRJob(digest, data, future))
+        self._pending += 1
+        self._wakeup.set()
+        return await asyncio.shield(future)
+
+    def _next_job(self) -> _OCRJob | None:
+        """Take the next job, going round the users with queued images in turn."""
+        if not self._turns:
+            return None
+        user_id = self._turns.popleft()
+        queue = self._queues[user_id]
+        job = queue.popleft()
+        if queue:
+            self._turns.append(user_id)
+        else:
+            del self._queues[user_id]
+        self._pending -= 1
+        return job
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            executor = self._executor
+            try:
+                strips = await loop.run_in_executor(executor, _prepare_job, job.data)
+                # one at a time, so a tall image only ever uses this worker's share of the pool
+                texts = [await loop.run_in_executor(executor, _read_strip, strip) for strip in strips]
+                text = join_strips(texts)
+            except BrokenProcessPool as exc:
+                _LOGGER.error("OCR worker pool broke, restarting it.", exc_info=exc)
+                self._replace_executor(executor)
+                job.future.set_exception(exc)
+            except asyncio.CancelledError:
+                job.future.cancel()  # the service is closing, don't leave the asker waiting forever
+                raise
+            except Exception as exc:  # skipcq: PYL-W0703
+                job.future.set_exception(exc)
+            else:
+                self.cache[job.digest] = text
+                job.future.set_result(text)
+            finally:
+                self._in_flight.pop(job.digest, None)
+                if job.future.done() and not job.future.cancelled():
+                    job.future.exception()  # mark as retrieved, the asker may have given up waiting
 
 
 class Query(Cog):
@@ -58,22 +438,32 @@ class Query(Cog):
     ----------
     bot : Bot
         The bot object the cog is attached to.
+    ocr_done : TTLCache[int, bool]
+        The messages that have already been read in the last day.
+    ocr : OCRService
+        The OCR worker pool.
     """
 
     # noinspection PyUnresolvedReferences
     def __init__(self, bot: "CBot"):
-        self.ocr_done: set[int] = set()
+        self.ocr_done: TTLCache[int, bool] = TTLCache(60 * 60 * 24)
+        self.ocr: OCRService = OCRService()
         self.bot = bot
 
     async def cog_load(self) -> None:  # pragma: no cover
         """Load the cog."""
         self.ocr_done = self.bot.holder.get("ocr_done", self.ocr_done)
-        self.clear_ocr_done.start()
+        self.ocr = OCRService(cache=self.bot.holder.get("ocr_cache", self.ocr.cache))
+        self.bot.metrics.caches["ocr"] = self.ocr.cache
+        self.ocr.start()
+        await self.bot.scheduler.register("clear_ocr_done", self.clear_ocr_done, Every(timedelta(hours=1)))
 
     async def cog_unload(self) -> None:  # pragma: no cover
         """Unload the cog."""
         self.bot.holder["ocr_done"] = self.ocr_done
-        self.clear_ocr_done.cancel()
+        self.bot.holder["ocr_cache"] = self.ocr.cache
+        self.bot.scheduler.cancel("clear_ocr_done")
+        await self.ocr.close()
 
     def cog_check(self, ctx: Context) -> bool:
         """Check to run for all cog commands.
@@ -163,14 +553,28 @@ class Query(Cog):
     @staticmethod
     def get_text(image: BytesIO) -> str:
         """Get the text from an image using pytesseract"""
-        img = Image.open(image)
-        if img.is_animated:
-            img.seek(0)
-            buf = BytesIO()
-            img.save(buf, format="PNG", save_all=False)
-            img = Image.open(buf)
-        unfiltered = re.sub(r"\n[\n ]*", "\n", pytesseract.image_to_string(ImageOps.grayscale(img)))
-        return re.sub(r"", "", unfiltered, flags=re.IGNORECASE)
+        return get_text(image)
+
+    async def read_image(self, user_id: int, data: bytes) -> str | None:
+        """Read an image through the OCR queue.
+
+        Parameters
+        ----------
+        user_id : int
+            The user who asked for the image to be read.
+        data : bytes
+            The image.
+
+        Returns
+        -------
+        str | None
+            The text in the image, or None if the queue was full.
+        """
+        try:
+            return await self.ocr.read(user_id, data)
+        except OCRQueueFull as exc:
+            _LOGGER.info("Refused OCR request from %s: %s", user_id, exc)
+            return None
 
     @commands.command(aliases=["ocr"])
     @commands.max_concurrency(2, commands.BucketType.channel, wait=True)
@@ -184,6 +588,8 @@ class Query(Cog):
         image : discord.Attachment | None
             The image to pull text from.
         """
+        import pytesseract
+
         try:
             langs = pytesseract.get_languages()
         except pytesseract.TesseractNotFoundError:
@@ -201,11 +607,11 @@ class Query(Cog):
                     if ref.message_id in self.ocr_done:
                         await ctx.reply("I have already read this image.")
                         return
-                    self.ocr_done.add(cast(int, ref.message_id))
+                    done_key = cast(int, ref.message_id)
                     attachments = cast(discord.Message, ref.resolved).attachments
                     if len(attachments) == 1:
-                        buffer = BytesIO(await attachments[0].read())
-                        res = await asyncio.to_thread(self.get_text, buffer)
+                        self.ocr_done[done_key] = True
+                        res = await self.read_image(ctx.author.id, await attachments[0].read())
                     else:
                         await ctx.reply("Please provide an image or reply to a message with an image.")
                         return
@@ -213,10 +619,13 @@ class Query(Cog):
                     await ctx.reply("Please provide an image or reply to a message with an image.")
                     return
             else:
-                self.ocr_done.add(ctx.message.id)
-                buffer = BytesIO(await image.read())
-                res = await asyncio.to_thread(self.get_text, buffer)
-            if len(res.strip()) < 5:
+                done_key = ctx.message.id
+                self.ocr_done[done_key] = True
+                res = await self.read_image(ctx.author.id, await image.read())
+            if res is None:
+                self.ocr_done.pop(done_key)  # it wasn't read, so it can be asked for again
+                await ctx.reply("I'm reading too many images right now, please try again in a bit.")
+            elif len(res.strip()) < 5:
                 await ctx.reply("I could not read any text from the image.")
             else:
                 await ctx.reply(f"```\n{res.strip()[:300]}\n```")
@@ -234,11 +643,11 @@ class Query(Cog):
             return
         if not payload.emoji.is_unicode_emoji():
             return
-        elif payload.emoji.name != "\U0001F984":
+        elif payload.emoji.name != "\U0001f984":
             return
         if payload.message_id in self.ocr_done:
             return
-        self.ocr_done.add(payload.message_id)
+        self.ocr_done[payload.message_id] = True
         guild = cast(discord.Guild, self.bot.get_guild(payload.guild_id))
         channel = cast(
             discord.TextChannel | discord.VoiceChannel,
@@ -248,17 +657,20 @@ class Query(Cog):
         if len(message.attachments) < 1:
             await channel.send(f"Please only react to messages with at least one attachment. <@{payload.user_id}>")
             return
-        buffer = BytesIO(await message.attachments[0].read())
-        res = await asyncio.to_thread(self.get_text, buffer)
-        if len(res.strip()) < 5:
+        res = await self.read_image(payload.user_id, await message.attachments[0].read())
+        if res is None:
+            self.ocr_done.pop(payload.message_id)  # it wasn't read, so it can be asked for again
+            await channel.send(
+                f"<@{payload.user_id}> I'm reading too many images right now, please try again in a bit."
+            )
+        elif len(res.strip()) < 5:
             await channel.send(f"<@{payload.user_id}> I could not read any text from the image.")
         else:
             await channel.send(f"<@{payload.user_id}>\n```\n{res.strip()[:300]}\n```")
 
-    @tasks.loop(hours=24)  # pragma: no cover
-    async def clear_ocr_done(self):
-        """Clear the OCR done set."""
-        self.ocr_done.clear()
+    async def clear_ocr_done(self):  # pragma: no cover
+        """Drop the expired entries from the OCR done map, scheduled hourly."""
+        self.ocr_done.prune()
 
     @app_commands.command()  # pyright: ignore[reportGeneralTypeIssues]
     @app_commands.guild_only()
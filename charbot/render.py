@@ -0,0 +1,514 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""Image rendering in worker processes, off the event loop and out of the bot's GIL."""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import pathlib
+import time
+from collections.abc import Iterable, Mapping
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from types import MappingProxyType
+from typing import NamedTuple, Protocol
+
+from discord import Color
+from PIL import Image, ImageDraw
+
+from .metrics import Histogram
+
+
+__all__ = (
+    "Encoding",
+    "PNG",
+    "OPTIMISED_PNG",
+    "PALETTE_PNG",
+    "FAST_WEBP",
+    "WEBP",
+    "SMALL_WEBP",
+    "ENCODINGS",
+    "encode",
+    "render_job",
+    "filename",
+    "RenderJob",
+    "CardJob",
+    "ProfileJob",
+    "BannerJob",
+    "TicTacToeJob",
+    "MinesweeperJob",
+    "RenderQueueFull",
+    "RenderService",
+    "EncodingResult",
+    "sample_jobs",
+    "benchmark",
+    "format_benchmark",
+)
+_LOGGER = logging.getLogger("charbot.render")
+_TICTACTOE_PATH = pathlib.Path(__file__).parent / "media/tictactoe"
+
+
+class Encoding(NamedTuple):
+    """How an image is encoded for upload.
+
+    Attributes
+    ----------
+    format : str
+        The PIL format to save in.
+    extension : str
+        The file extension of the format, for the attachment's name.
+    options : Mapping[str, int | bool]
+        The options to save with.
+    palette : bool
+        Whether to store images with at most 256 colors with a palette, which is lossless for them.
+    """
+
+    format: str
+    extension: str
+    options: Mapping[str, int | bool] = MappingProxyType({})
+    palette: bool = False
+
+
+PNG = Encoding("PNG", "png")
+OPTIMISED_PNG = Encoding("PNG", "png", MappingProxyType({"optimize": True}))
+PALETTE_PNG = Encoding("PNG", "png", MappingProxyType({"optimize": True}), palette=True)
+FAST_WEBP = Encoding("WEBP", "webp", MappingProxyType({"lossless": True, "quality": 0, "method": 0}))
+WEBP = Encoding("WEBP", "webp", MappingProxyType({"lossless": True, "quality": 0, "method": 1}))
+SMALL_WEBP = Encoding("WEBP", "webp", MappingProxyType({"lossless": True, "quality": 25, "method": 2}))
+ENCODINGS: Mapping[str, Encoding] = MappingProxyType(
+    {
+        "png": PNG,
+        "optimised png": OPTIMISED_PNG,
+        "palette png": PALETTE_PNG,
+        "fast webp": FAST_WEBP,
+        "webp": WEBP,
+        "small webp": SMALL_WEBP,
+    }
+)
+
+
+def _exact_palette(image: Image.Image) -> Image.Image | None:
+    """Convert an image with at most 256 colors to a palette image with exactly them, None if it has more."""
+    image = image.convert("RGBA")
+    if image.getcolors(256) is None:
+        return None
+    import numpy as np
+
+    pixels = np.asarray(image).view(np.uint32).reshape(image.height, image.width)
+    colors, indices = np.unique(pixels, return_inverse=True)
+    paletted = Image.fromarray(indices.astype(np.uint8).reshape(pixels.shape), "P")
+    paletted.putpalette(colors.view(np.uint8).tobytes(), rawmode="RGBA")
+    return paletted
+
+
+def encode(image: Image.Image, encoding: Encoding) -> bytes:
+    """Encode an image for upload, losslessly.
+
+    Parameters
+    ----------
+    image : Image.Image
+        The image.
+    encoding : Encoding
+        How to encode it.
+
+    Returns
+    -------
+    bytes
+        The encoded image.
+    """
+    if encoding.palette and (paletted := _exact_palette(image)) is not None:
+        image = paletted
+    buffer = BytesIO()
+    image.save(buffer, encoding.format, **encoding.options)
+    return buffer.getvalue()
+
+
+class RenderJob(Protocol):
+    """A picklable description of an image, drawn and encoded in a worker process.
+
+    Attributes
+    ----------
+    encoding : Encoding
+        How the image is encoded, picked for the kind of image with ``python -m charbot --render-benchmark``.
+    """
+
+    encoding: Encoding
+
+    def draw(self) -> Image.Image:
+        """Draw the image.
+
+        Returns
+        -------
+        Image.Image
+            The image.
+        """
+        ...  # pragma: no cover
+
+
+def render_job(job: RenderJob) -> bytes:
+    """Draw and encode a job's image.
+
+    Parameters
+    ----------
+    job : RenderJob
+        The job.
+
+    Returns
+    -------
+    bytes
+        The encoded image.
+    """
+    return encode(job.draw(), job.encoding)
+
+
+def filename(job: RenderJob | type[RenderJob], stem: str) -> str:
+    """Get the name to upload a job's image as.
+
+    Parameters
+    ----------
+    job : RenderJob | type[RenderJob]
+        The job, or its type.
+    stem : str
+        The name without the extension.
+
+    Returns
+    -------
+    str
+        The name, with the extension of the job's encoding.
+    """
+    return f"{stem}.{job.encoding.extension}"
+
+
+class CardJob(NamedTuple):
+    """A pool card, see :func:`charbot.card.draw_card`."""
+
+    level: int
+    base_rep: int
+    current_rep: int
+    completed_rep: int
+    pool_name: str
+    reward: str
+
+    encoding = FAST_WEBP
+
+    def draw(self) -> Image.Image:
+        """Draw the card."""
+        from .card import draw_card
+
+        return draw_card(**self._asdict())
+
+
+class ProfileJob(NamedTuple):
+    """A rank card, see :func:`charbot.card.draw_profile`.
+
+    The profile image is the decoded avatar, None for the default one.
+    """
+
+    profile_image: Image.Image | None
+    level: int
+    current_xp: int
+    user_xp: int
+    next_xp: int
+    user_position: int
+    user_name: str
+    user_status: str
+
+    encoding = FAST_WEBP
+
+    def draw(self) -> Image.Image:
+        """Draw the rank card."""
+        from discord.utils import MISSING
+
+        from .card import draw_profile
+
+        kwargs = self._asdict()
+        if kwargs["profile_image"] is None:
+            kwargs["profile_image"] = MISSING
+        return draw_profile(**kwargs)
+
+
+class BannerJob(NamedTuple):
+    """A member's banner, see :func:`charbot.betas.banner.draw_banner`.
+
+    Banners are cached once rendered, so they're worth the slower, smaller encoding.
+    """
+
+    base: pathlib.Path | Color | tuple[Color, Color]
+    username: str
+    profile: Image.Image
+    quote: str
+    prestige: int
+
+    encoding = SMALL_WEBP
+
+    def draw(self) -> Image.Image:
+        """Draw the banner."""
+        from .betas.banner import draw_banner
+
+        return draw_banner(*self)
+
+
+@functools.cache
+def _tictactoe_assets() -> tuple[Image.Image, Image.Image, Image.Image]:
+    """The tictactoe grid and pieces, loaded once per worker."""
+    grid = Image.open(_TICTACTOE_PATH / "grid.png").convert("RGBA")
+    cross = Image.open(_TICTACTOE_PATH / "X.png")
+    circle = Image.open(_TICTACTOE_PATH / "O.png")
+    cross.load()
+    circle.load()
+    return grid, cross, circle
+
+
+class TicTacToeJob(NamedTuple):
+    """A tictactoe board, as the positions to paste each piece at, and whether it's an ``X`` or an ``O``."""
+
+    pieces: tuple[tuple[tuple[int, int], str], ...]
+
+    encoding = WEBP
+
+    def draw(self) -> Image.Image:
+        """Draw the board."""
+        grid, cross, circle = _tictactoe_assets()
+        grid = grid.copy()
+        for position, piece in self.pieces:
+            image = cross if piece == "X" else circle
+            grid.paste(image, position, image)
+        return grid
+
+
+class MinesweeperJob(NamedTuple):
+    """A minesweeper board, as the raw RGB pixels the game draws and their size."""
+
+    board: bytes
+    size: tuple[int, int]
+
+    encoding = WEBP
+
+    def draw(self) -> Image.Image:
+        """Draw the board."""
+        return Image.frombytes("RGB", self.size, self.board)
+
+
+def _warm() -> None:
+    """Load the fonts and assets into a new worker, so its first render doesn't pay for them."""
+    from . import card
+    from .betas import banner  # noqa: F401  # loads the banner fonts
+
+    card._rank_background()
+    card._profile_mask()
+    for status in card.__STATUSES__:
+        card._status_badge(status)
+    _tictactoe_assets()
+
+
+def _ready() -> None:
+    """Do nothing, submitted once per worker on start so they're all spawned and warmed up front."""
+
+
+class RenderQueueFull(Exception):
+    """Raised when too many images are already waiting to be rendered."""
+
+    def __init__(self):
+        super().__init__("Too many images are waiting to be rendered, try again in a moment.")
+
+
+class RenderService:
+    """A pool of worker processes that render images, so drawing them doesn't hold the bot's GIL.
+
+    At most one job per worker is handed to the pool at a time, the rest wait their turn on the event loop, where they
+    can still be cancelled. Once ``max_pending`` jobs are waiting or rendering, new ones are refused, so a burst of
+    renders gets a quick error rather than an ever growing wait.
+
+    Until the service is started, and after it's closed, jobs are rendered in a thread instead.
+
+    Parameters
+    ----------
+    workers : int
+        The amount of worker processes.
+    max_pending : int
+        The most jobs that can be waiting or rendering at once.
+
+    Attributes
+    ----------
+    timings : dict[str, Histogram]
+        How long rendering took once a worker was free, by the kind of job.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 32):
+        self.workers: int = workers
+        self.max_pending: int = max_pending
+        self.timings: dict[str, Histogram] = {}
+        self._pending: int = 0
+        self._slots = asyncio.Semaphore(workers)
+        self._executor: Executor | None = None
+
+    @property
+    def pending(self) -> int:
+        """The amount of jobs waiting or rendering."""
+        return self._pending
+
+    def _new_executor(self) -> Executor:
+        # spawn rather than fork, forking the running bot would copy its sockets and event loop into the workers
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_warm)
+
+    async def start(self) -> None:
+        """Start the worker processes, and wait for them to be warmed up."""
+        if self._executor is not None:
+            return
+        self._executor = self._new_executor()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _ready) for _ in range(self.workers)))
+
+    async def close(self) -> None:
+        """Stop the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def render(self, job: RenderJob) -> BytesIO:
+        """Render an image, waiting for a free worker if needed.
+
+        Parameters
+        ----------
+        job : RenderJob
+            The image to render.
+
+        Returns
+        -------
+        BytesIO
+            The image, in the job's encoding.
+
+        Raises
+        ------
+        RenderQueueFull
+            If too many jobs are already waiting or rendering.
+        """
+        if self._pending >= self.max_pending:
+            raise RenderQueueFull()
+        self._pending += 1
+        try:
+            async with self._slots:
+                start = time.perf_counter()
+                if (executor := self._executor) is None:
+                    data = await asyncio.to_thread(render_job, job)
+                else:
+                    try:
+                        data = await asyncio.get_running_loop().run_in_executor(executor, render_job, job)
+                    except BrokenProcessPool:
+                        # every slot rendering on it sees it break, only the first replaces it
+                        if self._executor is executor:
+                            _LOGGER.error("Render worker pool broke, restarting it.", exc_info=True)
+                            executor.shutdown(wait=False, cancel_futures=True)
+                            self._executor = self._new_executor()
+                        raise
+                kind = type(job).__name__
+                if (timing := self.timings.get(kind)) is None:
+                    timing = self.timings[kind] = Histogram()
+                timing.observe(time.perf_counter() - start)
+                return BytesIO(data)
+        finally:
+            self._pending -= 1
+
+
+class EncodingResult(NamedTuple):
+    """How well an encoding did on a sample image.
+
+    Attributes
+    ----------
+    job : str
+        The kind of image.
+    encoding : str
+        The name of the encoding.
+    size : int
+        How many bytes the encoded image is.
+    seconds : float
+        How long encoding it took, on average.
+    chosen : bool
+        Whether it's the encoding the kind of image uses.
+    """
+
+    job: str
+    encoding: str
+    size: int
+    seconds: float
+    chosen: bool
+
+
+def sample_jobs() -> dict[str, RenderJob]:
+    """Get a typical image of each kind, to benchmark the encodings with.
+
+    Returns
+    -------
+    dict[str, RenderJob]
+        The sample jobs, by kind of image.
+    """
+    avatar = Image.new("RGBA", (180, 180), (88, 101, 242, 255))
+    ImageDraw.Draw(avatar).ellipse((40, 40, 140, 140), fill=(255, 255, 255, 255))
+    board = Image.new("RGB", (400, 400), (189, 189, 189))
+    draw = ImageDraw.Draw(board)
+    for x in range(10):
+        for y in range(10):
+            draw.rectangle((x * 40 + 1, y * 40 + 1, x * 40 + 38, y * 40 + 38), fill=(255, 255, 255) if x > y else None)
+            draw.text((x * 40 + 15, y * 40 + 12), f"{(x * y) % 8 + 1}", fill=(0, 0, 255) if x % 2 else (255, 0, 0))
+    return {
+        "card": CardJob(2, 100, 150, 300, "Pool", "A game of your choice"),
+        "profile": ProfileJob(avatar, 3, 100, 150, 300, 7, "Name#0001", "online"),
+        "banner": BannerJob((Color.blue(), Color.red()), "Name", avatar.resize((128, 128)), "A quote", 2),
+        "tictactoe": TicTacToeJob(((((0, 0), "X"), ((351, 0), "O"), ((176, 176), "X"), ((0, 351), "O")))),
+        "minesweeper": MinesweeperJob(board.tobytes(), board.size),
+    }
+
+
+def benchmark(
+    jobs: Mapping[str, RenderJob], encodings: Mapping[str, Encoding] = ENCODINGS, repeat: int = 5
+) -> list[EncodingResult]:
+    """Encode each image with each encoding, to pick the encoding for each kind of image.
+
+    Parameters
+    ----------
+    jobs : Mapping[str, RenderJob]
+        The images, by kind of image.
+    encodings : Mapping[str, Encoding]
+        The encodings to try, by name.
+    repeat : int
+        How many times to encode each image, to average the time over.
+
+    Returns
+    -------
+    list[EncodingResult]
+        The results, by kind of image, then encoding.
+    """
+    results = []
+    for kind, job in jobs.items():
+        image = job.draw()
+        for name, encoding in encodings.items():
+            start = time.perf_counter()
+            for _ in range(repeat):
+                size = len(encode(image, encoding))
+            seconds = (time.perf_counter() - start) / repeat
+            results.append(EncodingResult(kind, name, size, seconds, encoding == job.encoding))
+    return results
+
+
+def format_benchmark(results: Iterable[EncodingResult]) -> str:
+    """Format benchmark results, marking the encodings in use with a star.
+
+    Parameters
+    ----------
+    results : Iterable[EncodingResult]
+        The results.
+
+    Returns
+    -------
+    str
+        The report.
+    """
+    lines = [f"{'image':<14}{'encoding':<16}{'bytes':>10}{'encode':>10}"]
+    lines.extend(
+        f"{result.job:<14}{result.encoding + ('*' if result.chosen else ''):<16}"
+        f"{result.size:>10}{result.seconds * 1000:>8.1f}ms"
+        for result in results
+    )
+    return "\n".join(lines)
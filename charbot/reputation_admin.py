@@ -2,20 +2,22 @@
 # SPDX-FileCopyrightText: 2021 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
 # SPDX-License-Identifier: MIT
 """Admin commands for the reputation system."""
-import asyncio
 import datetime
+import logging
 from typing import Optional, cast
 
 import asyncpg
 import discord
 from discord import app_commands
-from discord.ext import commands, tasks
-from discord.utils import utcnow, sleep_until
+from discord.ext import commands
+from discord.utils import utcnow
 
 from . import CBot, GuildInteraction as Interaction
-from .card import generate_card
+from .render import CardJob, filename
+from .scheduler import RETRY_AFTER
 
 
+_LOGGER = logging.getLogger("charbot.reputation_admin")
 _ALLOWED_MENTIONS = discord.AllowedMentions(roles=False, users=False, everyone=False)
 
 
@@ -84,12 +86,12 @@ class ReputationAdmin(
 
     async def cog_load(self) -> None:
         """Load the cog."""
-        self._del_role.start()
+        await self._schedule_next_deal_expiry()
 
     async def cog_unload(self) -> None:
         """Unload the cog."""
         self.bot.tree.remove_command(self.ctx_menu.name, type=self.ctx_menu.type)
-        self._del_role.cancel()
+        self.bot.scheduler.cancel("deal_role_expiry")
 
     pools = app_commands.Group(name="pools", description="Administration commands for the reputation pools.")
     reputation = app_commands.Group(name="reputation", description="Administration commands for the reputation system.")
@@ -229,16 +231,17 @@ class ReputationAdmin(
             current,
             start,
         )
-        image_bytes = await asyncio.to_thread(
-            generate_card,
-            level=level,
-            base_rep=start,
-            current_rep=current,
-            completed_rep=capacity,
-            pool_name=name,
-            reward=reward,
+        image_bytes = await self.bot.renderer.render(
+            CardJob(
+                level=level,
+                base_rep=start,
+                current_rep=current,
+                completed_rep=capacity,
+                pool_name=name,
+                reward=reward,
+            )
         )
-        image = discord.File(image_bytes, f"{name}.png")
+        image = discord.File(image_bytes, filename(CardJob, name))
         await interaction.followup.send(f"Pool {name} created with reward {reward}!", file=image)
         client_user = cast(discord.ClientUser, self.bot.user)
         await self.bot.program_logs.send(
@@ -356,16 +359,17 @@ class ReputationAdmin(
             start if start is not None else previous["start"],
             pool,
         )
-        image_bytes = await asyncio.to_thread(
-            generate_card,
-            level=level if level is not None else previous["level"],
-            base_rep=start if start is not None else previous["start"],
-            current_rep=current if current is not None else previous["current"],
-            completed_rep=capacity if capacity is not None else previous["cap"],
-            pool_name=name or pool,
-            reward=reward or previous["reward"],
+        image_bytes = await self.bot.renderer.render(
+            CardJob(
+                level=level if level is not None else previous["level"],
+                base_rep=start if start is not None else previous["start"],
+                current_rep=current if current is not None else previous["current"],
+                completed_rep=capacity if capacity is not None else previous["cap"],
+                pool_name=name or pool,
+                reward=reward or previous["reward"],
+            )
         )
-        image = discord.File(image_bytes, f"{previous['pool']}.png")
+        image = discord.File(image_bytes, filename(CardJob, previous["pool"]))
         await interaction.followup.send(
             f"Pool {name or pool}{f' (formerly {pool})' if name is not None else ''} edited!", file=image
         )
@@ -474,16 +478,17 @@ class ReputationAdmin(
             if _pool is None:
                 await interaction.followup.send(f"Error: Pool `{pool}` not found.")
             else:
-                image_bytes = await asyncio.to_thread(
-                    generate_card,
-                    level=_pool["level"],
-                    base_rep=_pool["start"],
-                    current_rep=_pool["current"],
-                    completed_rep=_pool["cap"],
-                    pool_name=pool,
-                    reward=_pool["reward"],
+                image_bytes = await self.bot.renderer.render(
+                    CardJob(
+                        level=_pool["level"],
+                        base_rep=_pool["start"],
+                        current_rep=_pool["current"],
+                        completed_rep=_pool["cap"],
+                        pool_name=pool,
+                        reward=_pool["reward"],
+                    )
                 )
-                image = discord.File(image_bytes, f"{_pool['pool']}.png")
+                image = discord.File(image_bytes, filename(CardJob, _pool["pool"]))
                 await interaction.followup.send(
                     f"Pool `{pool}`: {_pool['level']} level pool with {_pool['start']} base rep, {_pool['current']}"
                     f" current rep, {_pool['cap']} completed rep, and {_pool['reward']} reward. "
@@ -522,6 +527,7 @@ class ReputationAdmin(
                     username=client_user.name,
                     avatar_url=client_user.display_avatar.url,
                 )
+        self.bot.invalidate_user_stats(user.id)  # once committed, so a read can't cache the old stats
 
     @reputation.command()  # pyright: ignore[reportGeneralTypeIssues]
     async def remove_reputation(self, interaction: Interaction[CBot], user: discord.User, amount: int):
@@ -560,6 +566,7 @@ class ReputationAdmin(
                     username=client_user.name,
                     avatar_url=client_user.display_avatar.url,
                 )
+        self.bot.invalidate_user_stats(user.id)  # once committed, so a read can't cache the old stats
 
     # noinspection DuplicatedCode
     @reputation.command()  # pyright: ignore[reportGeneralTypeIssues]
@@ -734,37 +741,62 @@ class ReputationAdmin(
             f" {user.name} (id: {user.id})",
         )
         await interaction.guild.edit_role_positions({role: above.position + 1}, reason="Correct placement of deal role")
+        until = utcnow() + datetime.timedelta(days=days)
         await self.bot.pool.execute(
-            "INSERT INTO deal_no_deal (user_id, role_id, until) VALUES ($1, $2, $3)",
-            user.id,
-            role.id,
-            utcnow() + datetime.timedelta(days=days),
+            "INSERT INTO deal_no_deal (user_id, role_id, until) VALUES ($1, $2, $3)", user.id, role.id, until
         )
         await user.add_roles(role, reason="Deal role")
         await interaction.followup.send(
             f"{user.mention} has been given their deal role for {days} days.", ephemeral=True
         )
-        if self._del_role.is_running():
-            self._del_role.cancel()
-        self._del_role.start(role, days)
+        self._schedule_deal_expiry(until)
 
-    @tasks.loop(hours=1)
-    async def _del_role(self):
-        """Removes the deal role from users who have it."""
-        async with self.bot.pool.acquire() as conn, conn.transaction():
-            rle = await conn.fetchrow("SELECT * FROM deal_no_deal ORDER BY until LIMIT 1")
-            if rle is None:
-                self._del_role.stop()
-                return
-            if rle["until"] < utcnow():
-                await sleep_until(rle["until"])
-            guild = self.bot.get_guild(225345178955808768) or await self.bot.fetch_guild(225345178955808768)
-            role = guild.get_role(rle["role_id"])
-            if role is not None:
-                await role.delete(reason="Deal role expired")
-            await conn.execute("DELETE FROM deal_no_deal WHERE role_id = $1", rle["role_id"])
-            if len(await conn.fetch("SELECT * FROM deal_no_deal")) == 0:
-                self._del_role.stop()
+    def _schedule_deal_expiry(self, until: datetime.datetime) -> None:
+        """Schedule the deal role expiry job for `until`, unless it's already scheduled sooner.
+
+        Parameters
+        ----------
+        until : datetime.datetime
+            When the next deal role expires.
+        """
+        job = self.bot.scheduler.jobs.get("deal_role_expiry")
+        if job is None or until < job.next_run:
+            self.bot.scheduler.schedule_once("deal_role_expiry", until, self._expire_deal_roles)
+
+    async def _schedule_next_deal_expiry(self) -> None:
+        """Schedule the expiry job for the first deal role to expire, by the until index."""
+        until = await self.bot.pool.fetchval("SELECT until FROM deal_no_deal ORDER BY until LIMIT 1")
+        if until is not None:
+            self._schedule_deal_expiry(until)
+
+    async def _expire_deal_roles(self) -> None:
+        """Delete every deal role that's due in one batch, then schedule the job for the next one.
+
+        The job is one-off, so if this fails it's scheduled again to retry rather than left unscheduled.
+        """
+        try:
+            async with self.bot.pool.acquire() as conn, conn.transaction():
+                role_ids = [
+                    row["role_id"]
+                    for row in await conn.fetch(
+                        "DELETE FROM deal_no_deal WHERE until <= $1 RETURNING role_id", utcnow()
+                    )
+                ]
+                if role_ids:
+                    guild = self.bot.get_guild(225345178955808768) or await self.bot.fetch_guild(225345178955808768)
+                    for role_id in role_ids:
+                        role = guild.get_role(role_id)
+                        if role is None:
+                            continue
+                        try:
+                            await role.delete(reason="Deal role expired")
+                        except discord.HTTPException:
+                            # the roles before it are already gone, so the rows can't be rolled back for it
+                            _LOGGER.exception("Couldn't delete expired deal role %s", role_id)
+            await self._schedule_next_deal_expiry()
+        except Exception:  # skipcq: PYL-W0703
+            _LOGGER.exception("Couldn't expire deal roles, retrying")
+            self._schedule_deal_expiry(utcnow() + RETRY_AFTER)
 
 
 async def setup(bot: CBot):
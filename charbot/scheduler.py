@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""Job scheduler for the bot's timed tasks.
+
+Every timed task runs off one timer heap, so the bot only wakes up when something is due. Recurring jobs are kept in
+the ``scheduled_jobs`` table, and each run is claimed there before it starts, so a run happens at most once even across
+restarts, and runs missed while the bot was down are handled by the job's misfire grace rather than all at once.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from datetime import datetime, time as dt_time, timedelta, timezone
+from typing import Any, NamedTuple
+
+import asyncpg
+import sentry_sdk
+from discord.utils import utcnow
+
+from .sql_stats import QUERY_TAG
+
+
+__all__ = ("Every", "Daily", "Trigger", "JobStats", "Job", "Scheduler")
+_LOGGER = logging.getLogger("charbot.scheduler")
+RETRY_AFTER = timedelta(minutes=1)
+
+
+class Every(NamedTuple):
+    """Run a job at a fixed interval.
+
+    Runs are anchored to the first one, so they don't drift by how long the jobs take.
+
+    Attributes
+    ----------
+    interval : timedelta
+        The time between runs.
+    """
+
+    interval: timedelta
+
+    def first(self, now: datetime) -> datetime:
+        """Get when a new job first runs, right away."""
+        return now
+
+    def next(self, scheduled: datetime, now: datetime) -> datetime:
+        """Get the first run on the interval from `scheduled` that's after `now`."""
+        if scheduled > now:
+            return scheduled + self.interval
+        return scheduled + self.interval * ((now - scheduled) // self.interval + 1)
+
+
+class _DailyTimes(NamedTuple):
+    times: tuple[dt_time, ...]
+
+
+class Daily(_DailyTimes):
+    """Run a job at fixed times of the day.
+
+    Attributes
+    ----------
+    times : tuple[time, ...]
+        The times to run at, in their own timezone, or UTC if they don't have one.
+
+    Raises
+    ------
+    ValueError
+        If there are no times.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, times: tuple[dt_time, ...]) -> "Daily":
+        """Make the trigger, checking there's a time to run at."""
+        if not times:
+            raise ValueError("Daily needs at least one time to run at")
+        return super().__new__(cls, tuple(times))
+
+    def first(self, now: datetime) -> datetime:
+        """Get when a new job first runs, at the next of the times."""
+        return self.next(now, now)
+
+    def next(self, scheduled: datetime, now: datetime) -> datetime:
+        """Get the first of the times that's after both `scheduled` and `now`."""
+        after = max(scheduled, now)
+        candidates = []
+        for run_time in self.times:
+            tz = run_time.tzinfo or timezone.utc
+            local = after.astimezone(tz)
+            for days in (0, 1):
+                candidate = datetime.combine(local.date() + timedelta(days=days), run_time.replace(tzinfo=None), tz)
+                if candidate > after:
+                    candidates.append(candidate.astimezone(timezone.utc))
+                    break
+        return min(candidates)
+
+
+Trigger = Every | Daily
+
+
+class JobStats:
+    """Timing of a job's runs.
+
+    Attributes
+    ----------
+    runs : int
+        How many times the job has run.
+    failures : int
+        How many of the runs raised an exception.
+    skipped : int
+        How many runs were skipped, because the last one was still going or they were claimed elsewhere.
+    misfires : int
+        How many runs were missed by more than the job's misfire grace, and skipped.
+    last_lateness : float
+        How many seconds after it was due the last run started.
+    max_lateness : float
+        The most seconds after it was due a run has started.
+    total_lateness : float
+        The sum of how late every run started, in seconds.
+    last_duration : float
+        How many seconds the last run took.
+    max_duration : float
+        The most seconds a run has taken.
+    """
+
+    __slots__ = (
+        "runs",
+        "failures",
+        "skipped",
+        "misfires",
+        "last_lateness",
+        "max_lateness",
+        "total_lateness",
+        "last_duration",
+        "max_duration",
+    )
+
+    def __init__(self):
+        self.runs = self.failures = self.skipped = self.misfires = 0
+        self.last_lateness = self.max_lateness = self.total_lateness = 0.0
+        self.last_duration = self.max_duration = 0.0
+
+    @property
+    def mean_lateness(self) -> float:
+        """The mean seconds after they were due the runs have started."""
+        return self.total_lateness / self.runs if self.runs else 0.0
+
+    def record(self, lateness: float, duration: float, failed: bool) -> None:
+        """Record a run.
+
+        Parameters
+        ----------
+        lateness : float
+            How many seconds after it was due the run started.
+        duration : float
+            How many seconds the run took.
+        failed : bool
+            Whether the run raised an exception.
+        """
+        self.runs += 1
+        self.failures += failed
+        self.last_lateness = lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        self.total_lateness += lateness
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+
+
+class Job:
+    """A job registered with the scheduler.
+
+    Parameters
+    ----------
+    name : str
+        The unique name of the job.
+    callback : Callable[[], Awaitable[Any]]
+        The coroutine function to run.
+    trigger : Trigger | None
+        When the job recurs, None for a one-off job.
+    next_run : datetime
+        When the job next runs.
+    misfire_grace : timedelta | None
+        How late a run can start and still happen, later ones are skipped. None to always run.
+
+    Attributes
+    ----------
+    stats : JobStats
+        The timing of the job's runs.
+    task : asyncio.Task | None
+        The current run, if the job is running.
+    """
+
+    __slots__ = ("name", "callback", "trigger", "next_run", "misfire_grace", "stats", "task", "_entry")
+
+    def __init__(
+        self,
+        name: str,
+        callback: Callable[[], Awaitable[Any]],
+        trigger: Trigger | None,
+        next_run: datetime,
+        misfire_grace: timedelta | None,
+    ):
+        self.name = name
+        self.callback = callback
+        self.trigger = trigger
+        self.next_run = next_run
+        self.misfire_grace = misfire_grace
+        self.stats = JobStats()
+        self.task: asyncio.Task[None] | None = None
+        self._entry = 0
+
+    @property
+    def persistent(self) -> bool:
+        """Whether the job is kept in the database, only recurring jobs are."""
+        return self.trigger is not None
+
+    @property
+    def running(self) -> bool:
+        """Whether the job is running right now."""
+        return self.task is not None and not self.task.done()
+
+
+class Scheduler:
+    """Runs the bot's timed jobs off a single timer heap.
+
+    Recurring jobs are registered with a trigger, and their next run is kept in the ``scheduled_jobs`` table. One-off
+    jobs are only kept in memory, the cogs scheduling them keep whatever they need to schedule them again on load.
+
+    Parameters
+    ----------
+    pool : asyncpg.Pool
+        The database pool the recurring jobs are kept with.
+
+    Attributes
+    ----------
+    jobs : dict[str, Job]
+        The registered jobs, by name.
+    """
+
+    def __init__(self, pool: asyncpg.Pool):
+        self.pool = pool
+        self.jobs: dict[str, Job] = {}
+        self._heap: list[tuple[datetime, int, Job]] = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._runner: asyncio.Task[None] | None = None
+        self._running: set[asyncio.Task[None]] = set()
+
+    def _push(self, job: Job) -> None:
+        job._entry = next(self._counter)
+        heapq.heappush(self._heap, (job.next_run, job._entry, job))
+        if self._heap[0][2] is job:
+            self._wakeup.set()
+
+    def _add(self, job: Job) -> Job:
+        if (old := self.jobs.get(job.name)) is not None:
+            job.stats, job.task = old.stats, old.task
+        self.jobs[job.name] = job
+        self._push(job)
+        return job
+
+    async def register(
+        self,
+        name: str,
+        callback: Callable[[], Awaitable[Any]],
+        trigger: Trigger,
+        *,
+        misfire_grace: timedelta | None = None,
+    ) -> Job:
+        """Register a recurring job, replacing any with the same name.
+
+        If the job has run before, it keeps the schedule stored for it, so reloading a cog doesn't run it again early.
+
+        Parameters
+        ----------
+        name : str
+            The unique name of the job.
+        callback : Callable[[], Awaitable[Any]]
+            The coroutine function to run.
+        trigger : Trigger
+            When the job recurs.
+        misfire_grace : timedelta | None
+            How late a run, like one missed while the bot was down, can start and still happen. Later runs are
+            skipped to the next one due. None to always run missed runs, once.
+
+        Returns
+        -------
+        Job
+            The registered job.
+        """
+        now = utcnow()
+        next_run = await self.pool.fetchval(
+            "INSERT INTO scheduled_jobs (name, next_run) VALUES ($1, $2)"
+            " ON CONFLICT (name) DO UPDATE SET name = excluded.name RETURNING next_run",
+            name,
+            trigger.first(now),
+        )
+        return self._add(Job(name, callback, trigger, next_run, misfire_grace))
+
+    def schedule_once(self, name: str, when: datetime, callback: Callable[[], Awaitable[Any]]) -> Job:
+        """Schedule a one-off job, replacing any with the same name.
+
+        Replacing a job doesn't cancel its current run, so a job can reschedule itself.
+
+        Parameters
+        ----------
+        name : str
+            The unique name of the job.
+        when : datetime
+            When to run the job.
+        callback : Callable[[], Awaitable[Any]]
+            The coroutine function to run.
+
+        Returns
+        -------
+        Job
+            The scheduled job.
+        """
+        return self._add(Job(name, callback, None, when, None))
+
+    def cancel(self, name: str) -> bool:
+        """Remove a job, cancelling its current run if it's running.
+
+        Parameters
+        ----------
+        name : str
+            The name of the job.
+
+        Returns
+        -------
+        bool
+            Whether there was a job with the name.
+        """
+        job = self.jobs.pop(name, None)
+        if job is None:
+            return False
+        if job.task is not None:
+            job.task.cancel()
+        return True
+
+    def start(self, before: Callable[[], Awaitable[Any]] | None = None) -> None:
+        """Start running jobs.
+
+        Parameters
+        ----------
+        before : Callable[[], Awaitable[Any]] | None
+            Awaited before the first job runs, like the bot's wait_until_ready.
+        """
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run(before), name="charbot-scheduler")
+
+    async def close(self) -> None:
+        """Stop running jobs, and cancel the ones running."""
+        if self._runner is not None:
+            self._runner.cancel()
+        tasks = list(self._running)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _pop_due(self) -> tuple[Job, datetime] | None:
+        """Drop stale entries, and pop the first job if it's due, returning it and when it was due."""
+        while self._heap:
+            when, entry, job = self._heap[0]
+            if self.jobs.get(job.name) is not job or job._entry != entry:
+                heapq.heappop(self._heap)
+                continue
+            if when > utcnow():
+                return None
+            heapq.heappop(self._heap)
+            return job, when
+        return None
+
+    async def _run(self, before: Callable[[], Awaitable[Any]] | None) -> None:
+        if before is not None:
+            await before()
+        while True:
+            self._wakeup.clear()
+            due = self._pop_due()
+            if due is not None:
+                try:
+                    await self._dispatch(*due)
+                except Exception:  # skipcq: PYL-W0703
+                    # the runner is the only thing running every job, it can't be allowed to die with one
+                    job = due[0]
+                    _LOGGER.exception("Couldn't dispatch job %s, retrying", job.name)
+                    if self.jobs.get(job.name) is job:
+                        job.next_run = utcnow() + RETRY_AFTER
+                        self._push(job)
+                continue
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), (self._heap[0][0] - utcnow()).total_seconds())
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch(self, job: Job, scheduled: datetime) -> None:
+        """Claim a due run, schedule the next one, and start it."""
+        now = utcnow()
+        lateness = (now - scheduled).total_seconds()
+        if job.persistent:
+            assert job.trigger is not None  # skipcq: BAN-B101
+            next_run = job.trigger.next(scheduled, now)
+            try:
+                claimed = await self.pool.fetchval(
+                    "UPDATE scheduled_jobs SET next_run = $3, last_run = $4 WHERE name = $1 AND next_run = $2"
+                    " RETURNING TRUE",
+                    job.name,
+                    scheduled,
+                    next_run,
+                    now,
+                )
+            except (OSError, asyncpg.PostgresError):
+                _LOGGER.exception("Couldn't claim a run of job %s, retrying", job.name)
+                job.next_run = now + RETRY_AFTER
+                self._push(job)
+                return
+            if not claimed:  # claimed elsewhere, follow the stored schedule
+                job.stats.skipped += 1
+                try:
+                    stored = await self.pool.fetchval("SELECT next_run FROM scheduled_jobs WHERE name = $1", job.name)
+                except (OSError, asyncpg.PostgresError):
+                    _LOGGER.exception("Couldn't read the schedule of job %s, retrying", job.name)
+                    job.next_run = now + RETRY_AFTER
+                    self._push(job)
+                    return
+                job.next_run = stored if stored is not None and stored > scheduled else next_run
+                self._push(job)
+                return
+            job.next_run = next_run
+            self._push(job)
+            if job.misfire_grace is not None and lateness > job.misfire_grace.total_seconds():
+                job.stats.misfires += 1
+                _LOGGER.warning("Skipped job %s, it was due %.0f seconds ago", job.name, lateness)
+                return
+        else:
+            del self.jobs[job.name]
+        if job.running:
+            job.stats.skipped += 1
+            _LOGGER.warning("Skipped job %s, its last run is still going", job.name)
+            return
+        job.task = asyncio.create_task(self._execute(job, lateness), name=f"charbot-job-{job.name}")
+        self._running.add(job.task)
+        job.task.add_done_callback(self._running.discard)
+
+    @staticmethod
+    async def _execute(job: Job, lateness: float) -> None:
+        QUERY_TAG.set(f"job:{job.name}")
+        start = time.perf_counter()
+        failed = False
+        try:
+            with sentry_sdk.start_transaction(op="job", name=f"job:{job.name}"):
+                await job.callback()
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # skipcq: PYL-W0703
+            failed = True
+            _LOGGER.exception("Job %s raised an exception", job.name)
+        finally:
+            duration = time.perf_counter() - start
+            job.stats.record(lateness, duration, failed)
+            _LOGGER.debug("Ran job %s, %.3fs late, in %.3fs", job.name, lateness, duration)
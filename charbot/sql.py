@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""Named SQL statements for the hot paths, and the database pools, or lanes, they run on.
+
+Registered statements are prepared when each connection is opened, into the connection's statement cache, where
+asyncpg looks statements up by their text, so running one never parses it again, and a statement that doesn't match
+the schema stops the bot at startup rather than failing the first time it's run. Inline statements are prepared the
+first time a connection runs them. The cache is sized to keep every registered statement, and every inline one the
+cogs use, without evicting any.
+
+The per-message xp path gets its own small pool, so it never waits for a connection behind slow commands or admin
+work, and the statements it runs are never evicted by theirs.
+"""
+from collections.abc import Callable, Coroutine
+from typing import Any, Final, NamedTuple
+
+import asyncpg
+
+from . import Config
+
+
+__all__ = (
+    "Lane",
+    "GENERAL",
+    "XP",
+    "STATEMENTS",
+    "STATEMENT_CACHE_SIZE",
+    "statement",
+    "prepare_statements",
+    "create_pool",
+    "NO_XP",
+    "XP_USER",
+    "NEW_XP_USER",
+    "UPDATE_XP_USER",
+    "USER_STATS",
+)
+
+
+class Lane(NamedTuple):
+    """A database pool for one kind of work.
+
+    Attributes
+    ----------
+    name : str
+        The name of the lane.
+    min_size : int
+        How many connections to keep open.
+    max_size : int
+        The most connections to open.
+    """
+
+    name: str
+    min_size: int
+    max_size: int
+
+
+# together they open at most as many connections as the single pool used to
+GENERAL: Final[Lane] = Lane("general", 45, 90)
+XP: Final[Lane] = Lane("xp", 2, 10)
+STATEMENTS: dict[str, str] = {}
+STATEMENT_CACHE_SIZE: Final[int] = 256
+
+
+def statement(name: str, sql: str) -> str:
+    """Register a statement by name.
+
+    Every use of a registered statement shares its text, and so its prepared statement.
+
+    Parameters
+    ----------
+    name : str
+        The name of the statement.
+    sql : str
+        The statement.
+
+    Returns
+    -------
+    str
+        The statement, to run like any other.
+
+    Raises
+    ------
+    ValueError
+        If another statement is already registered with the name.
+    """
+    if STATEMENTS.setdefault(name, sql) != sql:
+        raise ValueError(f"A different statement is already registered as {name}")
+    return sql
+
+
+async def prepare_statements(conn: asyncpg.Connection) -> None:
+    """Prepare every registered statement on a connection, into its statement cache.
+
+    Parameters
+    ----------
+    conn : asyncpg.Connection
+        The connection.
+    """
+    for sql in STATEMENTS.values():
+        # the public prepare doesn't cache, and it's the cached statement that fetch and execute use
+        await conn._prepare(sql, use_cache=True)  # skipcq: PYL-W0212
+
+
+def create_pool(
+    lane: Lane,
+    *,
+    init: Callable[[asyncpg.Connection], Coroutine[Any, Any, None]] | None = None,
+    **kwargs: Any,
+) -> asyncpg.Pool:
+    """Create the pool for a lane, connecting to the configured database.
+
+    Every connection has the registered statements prepared when it's opened.
+
+    Parameters
+    ----------
+    lane : Lane
+        The lane to create the pool for.
+    init : Callable[[asyncpg.Connection], Coroutine[Any, Any, None]] | None
+        More setup for each new connection, run after the statements are prepared.
+    **kwargs : Any
+        Extra options for the pool.
+
+    Returns
+    -------
+    asyncpg.Pool
+        The pool, to be awaited or used as an async context manager.
+    """
+
+    async def setup(conn: asyncpg.Connection) -> None:
+        await prepare_statements(conn)
+        if init is not None:
+            await init(conn)
+
+    return asyncpg.create_pool(
+        min_size=lane.min_size,
+        max_size=lane.max_size,
+        statement_cache_size=STATEMENT_CACHE_SIZE,
+        host=Config["postgres"]["host"],
+        user=Config["postgres"]["user"],
+        password=Config["postgres"]["password"],
+        database=Config["postgres"]["database"],
+        init=setup,
+        **kwargs,
+    )
+
+
+NO_XP = statement("no_xp", "SELECT * FROM no_xp WHERE guild = $1")
+XP_USER = statement("xp_user", "SELECT * FROM xp_users WHERE id = $1")
+NEW_XP_USER = statement(
+    "new_xp_user",
+    "INSERT INTO xp_users (id, username, discriminator, xp, detailed_xp, level, messages, avatar, prestige)"
+    " VALUES ($1, $2, $3, $4, $5, 0, 1, $6, 0) ON CONFLICT (id) DO NOTHING",
+)
+UPDATE_XP_USER = statement(
+    "update_xp_user",
+    "UPDATE xp_users SET level = $1, detailed_xp = $2, xp = $3, messages = messages + 1, avatar = $4 WHERE id = $5",
+)
+USER_STATS = statement("user_stats", "SELECT * FROM user_stats WHERE id = $1")
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""Per-statement query latency, tagged by what ran the query, and plans of slow queries."""
+import asyncio
+import logging
+import random
+import re
+from collections.abc import Callable, Coroutine
+from contextvars import ContextVar
+from typing import Any, NamedTuple
+
+import asyncpg
+from asyncpg.connection import LoggedQuery
+
+from .cache import TTLCache
+from .metrics import Histogram
+
+
+__all__ = ("QUERY_TAG", "StatementKey", "QueryStats")
+_LOGGER = logging.getLogger("charbot.sql")
+_EXPLAIN_LOGGER = logging.getLogger("charbot.sql.explain")
+# what's running queries in the current task, set for each command and event
+QUERY_TAG: ContextVar[str] = ContextVar("QUERY_TAG", default="other")
+_EXPLAINABLE = frozenset({"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "VALUES"})
+# selects that lock rows, which are explained without running them like data changing statements
+_LOCKING = re.compile(r"\bFOR\s+(?:NO\s+KEY\s+UPDATE|UPDATE|KEY\s+SHARE|SHARE)\b", re.IGNORECASE)
+
+
+def _analyzable(query: str) -> bool:
+    """Whether a statement is safe to run again to explain it, only plain selects are."""
+    return query.lstrip().split(None, 1)[0].upper() == "SELECT" and _LOCKING.search(query) is None
+
+
+class StatementKey(NamedTuple):
+    """What the latency of a statement is recorded by.
+
+    Attributes
+    ----------
+    lane : str
+        The pool the statement ran on.
+    tag : str
+        What ran it, like ``command:Levels.rank`` or ``event:message``.
+    query : str
+        The statement, with its whitespace collapsed.
+    """
+
+    lane: str
+    tag: str
+    query: str
+
+
+class QueryStats:
+    """Records how long every statement takes, and captures the plans of slow ones.
+
+    Installed on every connection of a pool with ``init=stats.installer(lane)``, through asyncpg's query loggers, so
+    every statement run on the pool is timed, whether through the pool, a connection or a transaction.
+
+    Statements slower than the threshold are sampled, and the plans of the sampled ones are logged. Plain selects are
+    run again with ``EXPLAIN (ANALYZE, BUFFERS)``, in a transaction that's rolled back, everything else only with
+    ``EXPLAIN``, so a slow write isn't repeated, taking its locks and firing its triggers again. Each statement is
+    explained at most once per ``explain_every`` seconds, and only one at a time.
+
+    Parameters
+    ----------
+    slow : float
+        How many seconds a statement has to take to be slow.
+    sample_rate : float
+        The chance of a slow statement being explained.
+    explain_every : float
+        The least amount of seconds between explaining the same statement again.
+    rand : Callable[[], float]
+        The random number generator to sample with.
+
+    Attributes
+    ----------
+    histograms : dict[StatementKey, Histogram]
+        The latency of each statement.
+    explain_pool : asyncpg.Pool | None
+        The pool to explain slow statements on, None to not explain them.
+    """
+
+    def __init__(
+        self,
+        slow: float = 0.25,
+        sample_rate: float = 0.1,
+        explain_every: float = 60 * 10,
+        rand: Callable[[], float] = random.random,
+    ):
+        self.slow: float = slow
+        self.sample_rate: float = sample_rate
+        self.histograms: dict[StatementKey, Histogram] = {}
+        self.explain_pool: asyncpg.Pool | None = None
+        self._rand = rand
+        self._explained: TTLCache[str, bool] = TTLCache(explain_every)
+        self._explaining: asyncio.Task[None] | None = None
+
+    def installer(self, lane: str) -> Callable[[asyncpg.Connection], Coroutine[Any, Any, None]]:
+        """Get the ``init`` hook for a pool, which times every statement run on its connections.
+
+        Parameters
+        ----------
+        lane : str
+            The name of the pool.
+
+        Returns
+        -------
+        Callable[[asyncpg.Connection], Coroutine[Any, Any, None]]
+            The hook.
+        """
+
+        async def install(conn: asyncpg.Connection) -> None:
+            reset = conn.get_reset_query()
+            conn.add_query_logger(lambda record: None if record.query == reset else self.record(lane, record))
+
+        return install
+
+    def record(self, lane: str, record: LoggedQuery) -> None:
+        """Record a statement that ran, called in the context of the task that ran it.
+
+        Parameters
+        ----------
+        lane : str
+            The pool it ran on.
+        record : LoggedQuery
+            The statement, and how long it took.
+        """
+        query = " ".join(record.query.split())
+        key = StatementKey(lane, QUERY_TAG.get(), query)
+        if (histogram := self.histograms.get(key)) is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(record.elapsed)
+        if record.elapsed >= self.slow and record.exception is None and self._should_explain(query):
+            self._explained[query] = True
+            self._explaining = asyncio.create_task(self._explain(key, record), name="explain-slow-query")
+
+    def _should_explain(self, query: str) -> bool:
+        return (
+            self.explain_pool is not None
+            and (self._explaining is None or self._explaining.done())
+            and query.split(" ", 1)[0].upper() in _EXPLAINABLE
+            and query not in self._explained
+            and self._rand() < self.sample_rate
+        )
+
+    async def _explain(self, key: StatementKey, record: LoggedQuery) -> None:
+        assert self.explain_pool is not None  # skipcq: BAN-B101
+        QUERY_TAG.set("explain")
+        try:
+            async with self.explain_pool.acquire() as conn:
+                transaction = conn.transaction()
+                await transaction.start()
+                try:
+                    await conn.execute("SET LOCAL statement_timeout = 10000")
+                    explain = "EXPLAIN (ANALYZE, BUFFERS)" if _analyzable(record.query) else "EXPLAIN"
+                    plan = await conn.fetch(f"{explain} {record.query}", *record.args)
+                finally:
+                    await transaction.rollback()
+        except Exception:  # skipcq: PYL-W0703
+            _LOGGER.warning("Couldn't explain slow statement %s", key.query, exc_info=True)
+            return
+        _EXPLAIN_LOGGER.warning(
+            "Slow statement from %s on the %s pool took %.0fms:\n%s\n%s",
+            key.tag,
+            key.lane,
+            record.elapsed * 1000,
+            key.query,
+            "\n".join(row[0] for row in plan),
+        )
+
+    def top(self, limit: int = 10) -> list[tuple[StatementKey, Histogram]]:
+        """Get the statements that took the most time in total.
+
+        Parameters
+        ----------
+        limit : int
+            How many statements to get.
+
+        Returns
+        -------
+        list[tuple[StatementKey, Histogram]]
+            The statements and their latency, most total time first.
+        """
+        return sorted(self.histograms.items(), key=lambda item: item[1].total, reverse=True)[:limit]
+
+    def format(self, limit: int = 10, width: int = 80) -> str:
+        """Format the statements that took the most time in total.
+
+        Parameters
+        ----------
+        limit : int
+            How many statements to show.
+        width : int
+            How much of each statement to show.
+
+        Returns
+        -------
+        str
+            The report.
+        """
+        lines = [f"{'calls':>7}{'total':>10}{'mean':>9}{'p95':>9}{'max':>9}  where"]
+        for key, histogram in self.top(limit):
+            mean = histogram.total / histogram.count
+            lines.append(
+                f"{histogram.count:>7}{histogram.total * 1000:>8.0f}ms{mean * 1000:>7.1f}ms"
+                f"{histogram.quantile(0.95) * 1000:>7.1f}ms{histogram.max * 1000:>7.1f}ms  {key.lane} {key.tag}"
+            )
+            lines.append(f"    {key.query[:width]}")
+        return "\n".join(lines)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""Finding where in the bot's own code a stack is, for blaming stalls and errors on it."""
+import pathlib
+import traceback
+from typing import Final
+
+
+__all__ = ("blame", "location")
+_PACKAGE: Final[str] = str(pathlib.Path(__file__).parent)
+
+
+def blame(stack: traceback.StackSummary) -> traceback.FrameSummary:
+    """Pick the innermost frame of the bot's own code, or the innermost frame if none is.
+
+    Parameters
+    ----------
+    stack : traceback.StackSummary
+        The stack, it can't be empty.
+
+    Returns
+    -------
+    traceback.FrameSummary
+        The frame.
+    """
+    return next((frame for frame in reversed(stack) if frame.filename.startswith(_PACKAGE)), stack[-1])
+
+
+def location(frame: traceback.FrameSummary) -> str:
+    """Describe where a frame is, relative to the repo if it's the bot's own code.
+
+    Parameters
+    ----------
+    frame : traceback.FrameSummary
+        The frame.
+
+    Returns
+    -------
+    str
+        The file, line and function, like ``charbot/dice.py:50 in roll``.
+    """
+    path = pathlib.Path(frame.filename)
+    if frame.filename.startswith(_PACKAGE):
+        path = path.relative_to(pathlib.Path(_PACKAGE).parent)
+    return f"{path.as_posix()}:{frame.lineno} in {frame.name}"
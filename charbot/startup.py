@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""Startup timings for the bot."""
+import logging
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+
+__all__ = ("StartupReport",)
+_LOGGER = logging.getLogger("charbot.startup")
+
+
+class StartupReport:
+    """Times the phases of startup, so time-to-ready can be seen and shrunk after each deploy.
+
+    Phases can overlap, as independent ones run concurrently, so their times don't add up to the total.
+
+    Parameters
+    ----------
+    clock : Callable[[], float]
+        The clock to time with, in seconds.
+
+    Attributes
+    ----------
+    phases : dict[str, float]
+        How many seconds each phase of setup took, in the order they finished.
+    extensions : dict[str, float]
+        How many seconds each extension took to load, in the order they finished.
+    ready_after : float | None
+        How many seconds after the bot was created it was ready, None until it is.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self._clock = clock
+        self._started = clock()
+        self.phases: dict[str, float] = {}
+        self.extensions: dict[str, float] = {}
+        self.ready_after: float | None = None
+
+    @contextmanager
+    def _time(self, into: dict[str, float], name: str) -> Iterator[None]:
+        start = self._clock()
+        try:
+            yield
+        finally:
+            into[name] = self._clock() - start
+
+    def phase(self, name: str):
+        """Time a phase of setup.
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase.
+        """
+        return self._time(self.phases, name)
+
+    def extension(self, name: str):
+        """Time loading an extension.
+
+        Parameters
+        ----------
+        name : str
+            The name of the extension.
+        """
+        return self._time(self.extensions, name)
+
+    def ready(self) -> bool:
+        """Mark the bot as ready, the first time it is.
+
+        Returns
+        -------
+        bool
+            Whether this was the first time, and the report is complete.
+        """
+        if self.ready_after is not None:
+            return False
+        self.ready_after = self._clock() - self._started
+        return True
+
+    def format(self) -> str:
+        """Format the report, slowest first within each section.
+
+        Returns
+        -------
+        str
+            The report.
+        """
+        lines = ["Startup report:"]
+        for title, timings in (("Setup phases", self.phases), ("Extensions", self.extensions)):
+            lines.append(f"  {title}:")
+            lines.extend(
+                f"    {name:<32}{seconds * 1000:>9.0f}ms"
+                for name, seconds in sorted(timings.items(), key=lambda item: item[1], reverse=True)
+            )
+        if self.ready_after is not None:
+            lines.append(f"  {'Ready after':<34}{self.ready_after * 1000:>9.0f}ms")
+        return "\n".join(lines)
+
+    def log(self) -> None:
+        """Log the report."""
+        _LOGGER.info(self.format())
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""Sentry trace sampling, by what a transaction is for.
+
+Every event, command and scheduled job runs in its own transaction, named like the query tags, ``event:message``,
+``command:Admin.ping`` or ``job:giveaway_end``. The sampler picks the rate for each by the first pattern its name
+matches, so the handlers that run thousands of times an hour can be sampled sparsely, while rare admin and giveaway
+work is always traced. Errors are reported whether or not their transaction was sampled.
+
+The rates are read from the ``[sentry.traces]`` table of the config, a ``default`` rate and a ``rates`` table of
+patterns, which are checked before the built in ones::
+
+    [sentry.traces]
+    default = 0.1
+
+    [sentry.traces.rates]
+    "event:message" = 0.005
+    "command:Admin.*" = 1.0
+"""
+from collections.abc import Mapping
+from fnmatch import fnmatchcase
+from types import MappingProxyType
+from typing import Any, Final
+
+
+__all__ = ("DEFAULT_RATE", "DEFAULT_RATES", "TraceSampler")
+DEFAULT_RATE: Final[float] = 0.1
+DEFAULT_RATES: Final[Mapping[str, float]] = MappingProxyType(
+    {
+        # thousands an hour, a handful is plenty to see what a typical one costs
+        "event:message": 0.01,
+        "event:message_edit": 0.05,
+        "event:typing": 0.0,
+        "event:presence_update": 0.0,
+        "event:raw_*": 0.0,
+        # rare, and worth seeing every one of
+        "command:Admin.*": 1.0,
+        "command:Giveaway.*": 1.0,
+        "job:*": 1.0,
+        # the metrics endpoint is scraped every few seconds
+        "*MetricsServer._metrics": 0.0,
+    }
+)
+
+
+class TraceSampler:
+    """Picks the trace sample rate of a transaction by its name, for ``sentry_sdk.init(traces_sampler=...)``.
+
+    Parameters
+    ----------
+    rates : Mapping[str, float]
+        The sample rate for transaction names matching each shell style pattern, the first match is used.
+    default : float
+        The sample rate of transactions no pattern matches.
+    """
+
+    def __init__(self, rates: Mapping[str, float] = DEFAULT_RATES, default: float = DEFAULT_RATE):
+        self.rates: dict[str, float] = dict(rates)
+        self.default: float = default
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> "TraceSampler":
+        """Make a sampler from the ``[sentry.traces]`` config table, on top of the built in rates.
+
+        Parameters
+        ----------
+        config : Mapping[str, Any]
+            The table, with an optional ``default`` rate and ``rates`` table.
+
+        Returns
+        -------
+        TraceSampler
+            The sampler.
+        """
+        rates = dict(config.get("rates", {}))
+        for pattern, rate in DEFAULT_RATES.items():
+            rates.setdefault(pattern, rate)
+        return cls(rates, config.get("default", DEFAULT_RATE))
+
+    def rate(self, name: str) -> float:
+        """Get the sample rate of a transaction.
+
+        Parameters
+        ----------
+        name : str
+            The name of the transaction.
+
+        Returns
+        -------
+        float
+            The chance of it being sampled, from 0 to 1.
+        """
+        for pattern, rate in self.rates.items():
+            if fnmatchcase(name, pattern):
+                return rate
+        return self.default
+
+    def __call__(self, sampling_context: Mapping[str, Any]) -> float:
+        """Get the sample rate of a transaction, following its parent's decision if it has one.
+
+        Parameters
+        ----------
+        sampling_context : Mapping[str, Any]
+            What sentry knows about the transaction.
+
+        Returns
+        -------
+        float
+            The chance of it being sampled, from 0 to 1.
+        """
+        if (parent_sampled := sampling_context.get("parent_sampled")) is not None:
+            return float(parent_sampled)
+        return self.rate(sampling_context.get("transaction_context", {}).get("name") or "")
@@ -25,10 +25,23 @@ class CBot(commands.Bot):
     TIME: Callable[[], datetime.datetime]
     __init__: Callable[[tuple[Any, ...], bool, type["Tree"], dict[str, Any]], None]
     session: aiohttp.ClientSession
+    avatars: Any
+    scheduler: Any
+    renderer: Any
+    query_stats: Any
+    metrics: Any
+    watchdog: Any
+    error_stats: Any
     pool: asyncpg.Pool
+    xp_pool: asyncpg.Pool
     program_logs: Webhook
+    program_log_sink: Any
+    error_log_sink: Any
     setup_hook: Callable[[], Coroutine[None, None, None]]
     giveaway_user: Callable[[int], Coroutine[None, None, None | asyncpg.Record]]
+    user_stats: Callable[..., Coroutine[None, None, None | asyncpg.Record]]
+    invalidate_user_stats: Callable[..., None]
+    report_error: Callable[..., None]
     localize_loader: FluentResourceLoader
 
     async def give_game_points(self, member: Member | User, game: str, points: int, bonus: int = 0) -> int:
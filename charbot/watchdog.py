@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""Event loop lag, and what was blocking the loop when it stalled.
+
+A heartbeat on the loop measures how late it runs, which is how long the loop was kept from running anything else.
+A thread watches the heartbeat, and when it's later than the threshold, grabs the stack of the loop's thread while
+it's still stuck, so a stall is blamed on the code that caused it rather than whatever ran after it.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections.abc import Callable
+
+from . import stacks
+from .metrics import Histogram
+
+
+__all__ = ("Offender", "Watchdog")
+_LOGGER = logging.getLogger("charbot.watchdog")
+
+
+class Offender:
+    """A place the loop stalled at.
+
+    Attributes
+    ----------
+    location : str
+        The file, line and function of the bot's code that was running, like ``charbot/dice.py:50 in roll``.
+    stalls : int
+        How many times the loop stalled there.
+    total : float
+        The sum of how long the stalls were, in seconds.
+    worst : float
+        The longest stall, in seconds.
+    stack : traceback.StackSummary
+        The loop thread's stack during the longest stall.
+    """
+
+    __slots__ = ("location", "stalls", "total", "worst", "stack")
+
+    def __init__(self, location: str, stack: traceback.StackSummary):
+        self.location = location
+        self.stalls: int = 0
+        self.total: float = 0.0
+        self.worst: float = 0.0
+        self.stack = stack
+
+    def record(self, seconds: float, stack: traceback.StackSummary) -> None:
+        """Record a stall.
+
+        Parameters
+        ----------
+        seconds : float
+            How long the stall was.
+        stack : traceback.StackSummary
+            The stack during it.
+        """
+        self.stalls += 1
+        self.total += seconds
+        if seconds >= self.worst:
+            self.worst = seconds
+            self.stack = stack
+
+
+class Watchdog:
+    """Measures event loop lag, and blames stalls on what was running.
+
+    Parameters
+    ----------
+    threshold : float
+        How many seconds late the heartbeat has to be for it to be a stall.
+    interval : float
+        How many seconds apart the heartbeats are.
+    clock : Callable[[], float]
+        The clock to time with, in seconds.
+
+    Attributes
+    ----------
+    lag : Histogram
+        How late each heartbeat ran.
+    offenders : dict[str, Offender]
+        The places the loop stalled at, by location.
+    """
+
+    def __init__(self, threshold: float = 0.1, interval: float = 0.05, clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.interval = interval
+        self.lag = Histogram()
+        self.offenders: dict[str, Offender] = {}
+        self._clock = clock
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._handle: asyncio.TimerHandle | None = None
+        self._thread_id: int = 0
+        self._due: float = 0.0
+        self._captured: traceback.StackSummary | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Start watching the running loop, from the loop's thread."""
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._due = self._clock() + self.interval
+        self._handle = self._loop.call_later(self.interval, self._beat)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop watching the loop."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._stop.set()
+        self._thread = None
+        self._loop = None
+
+    def _beat(self) -> None:
+        now = self._clock()
+        self.observe(max(now - self._due, 0.0), self._captured)
+        self._due = now + self.interval
+        self._captured = None
+        assert self._loop is not None  # skipcq: BAN-B101
+        self._handle = self._loop.call_later(self.interval, self._beat)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            if self._captured is None and self._clock() - self._due > self.threshold:
+                if (frame := sys._current_frames().get(self._thread_id)) is not None:  # skipcq: PYL-W0212
+                    self._captured = traceback.extract_stack(frame)
+
+    def observe(self, lag: float, stack: traceback.StackSummary | None) -> None:
+        """Record how late a heartbeat was, and blame it if it was a stall.
+
+        Parameters
+        ----------
+        lag : float
+            How many seconds late it was.
+        stack : traceback.StackSummary | None
+            The loop thread's stack while it was stuck, None if it wasn't captured.
+        """
+        self.lag.observe(lag)
+        if lag <= self.threshold:
+            return
+        if not stack:
+            location = "unknown, over before it was caught"
+            stack = traceback.StackSummary()
+        else:
+            location = stacks.location(stacks.blame(stack))
+        if (offender := self.offenders.get(location)) is None:
+            offender = self.offenders[location] = Offender(location, stack)
+        offender.record(lag, stack)
+        _LOGGER.warning("Event loop stalled for %.0fms at %s", lag * 1000, location)
+
+    def top(self, limit: int = 5) -> list[Offender]:
+        """Get the places the loop spent the most time stalled at.
+
+        Parameters
+        ----------
+        limit : int
+            How many to get.
+
+        Returns
+        -------
+        list[Offender]
+            The offenders, most total stall time first.
+        """
+        return sorted(self.offenders.values(), key=lambda offender: offender.total, reverse=True)[:limit]
+
+    def format(self, limit: int = 5, depth: int = 3) -> str:
+        """Format the loop lag, and the worst offenders with the innermost frames of their worst stall.
+
+        Parameters
+        ----------
+        limit : int
+            How many offenders to show.
+        depth : int
+            How many frames of each stack to show.
+
+        Returns
+        -------
+        str
+            The report.
+        """
+        lines = [
+            f"lag p50 {self.lag.quantile(0.5) * 1000:.1f}ms, p99 {self.lag.quantile(0.99) * 1000:.1f}ms, "
+            f"max {self.lag.max * 1000:.1f}ms over {self.lag.count} beats"
+        ]
+        for offender in self.top(limit):
+            lines.append(
+                f"{offender.stalls:>5} stalls {offender.total * 1000:>8.0f}ms total {offender.worst * 1000:>7.0f}ms "
+                f"worst  {offender.location}"
+            )
+            lines.extend(f"    {frame.name} ({frame.filename}:{frame.lineno})" for frame in offender.stack[-depth:])
+        return "\n".join(lines)
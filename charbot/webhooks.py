@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+"""Background delivery of log messages to webhooks."""
+import asyncio
+import logging
+import time
+from collections.abc import Callable
+from typing import Any, Final
+
+import discord
+import orjson
+from discord.utils import MISSING
+
+from .cache import TTLCache
+
+
+__all__ = ("WebhookSink",)
+_LOGGER = logging.getLogger("charbot.webhooks")
+MAX_EMBEDS: Final[int] = 10
+MAX_CONTENT: Final[int] = 2000
+
+
+class _Entry:
+    __slots__ = ("content", "embed", "count", "first", "not_before")
+
+    def __init__(self, content: str | None, embed: discord.Embed | None, now: float, not_before: float):
+        self.content = content
+        self.embed = embed
+        self.count = 1
+        self.first = now
+        self.not_before = not_before
+
+    def render(self, now: float, held: bool) -> tuple[str | None, discord.Embed | None]:
+        """Get the entry's content and embed, saying how many times it happened if it was more than once."""
+        if self.count == 1 and not held:
+            return self.content, self.embed
+        repeats = f"×{self.count} in the last {max(now - self.first, 1):.0f}s"
+        if self.embed is None:
+            return f"{self.content} ({repeats})"[:MAX_CONTENT], None
+        embed = self.embed.copy()
+        footer = embed.footer
+        embed.set_footer(text=f"{footer.text} · {repeats}" if footer.text else repeats, icon_url=footer.icon_url)
+        return self.content, embed
+
+
+class WebhookSink:
+    """Sends log messages to a webhook from a background task, so logging never waits on discord.
+
+    Messages are queued and sent in batches, of up to 10 embeds and as many text messages as fit in one message. The
+    same message posted again before it's sent is counted rather than queued twice. Once sent, repeats of it are held
+    for ``window`` seconds and sent once, with how many times it happened, so an error storm costs a message a minute
+    rather than one per error.
+
+    Sends are one at a time, at least ``interval`` seconds apart, so a webhook stays well inside its rate limit bucket,
+    and a send that's rate limited or fails on discord's end is retried with a backoff.
+
+    Parameters
+    ----------
+    webhook : discord.Webhook
+        The webhook to send to.
+    username : str | None
+        The name to send as, None for the webhook's own.
+    avatar_url : str | None
+        The avatar to send with, None for the webhook's own.
+    allowed_mentions : discord.AllowedMentions | None
+        The mentions the messages can make, None for the bot's defaults.
+    window : float
+        How many seconds repeats of a sent message are held for.
+    interval : float
+        The least seconds between sends.
+    max_pending : int
+        The most different messages that can be waiting, more are dropped.
+    clock : Callable[[], float]
+        The clock to time with, in seconds.
+
+    Attributes
+    ----------
+    sent : int
+        How many messages have been sent to the webhook.
+    dropped : int
+        How many messages were dropped, because too many were waiting or sending them failed.
+    """
+
+    def __init__(
+        self,
+        webhook: discord.Webhook,
+        *,
+        username: str | None = None,
+        avatar_url: str | None = None,
+        allowed_mentions: discord.AllowedMentions | None = None,
+        window: float = 60.0,
+        interval: float = 1.0,
+        max_pending: int = 100,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.webhook = webhook
+        self.username = username
+        self.avatar_url = avatar_url
+        self.allowed_mentions = allowed_mentions
+        self.window = window
+        self.interval = interval
+        self.max_pending = max_pending
+        self.sent: int = 0
+        self.dropped: int = 0
+        self._clock = clock
+        self._pending: dict[bytes, _Entry] = {}
+        self._recent: TTLCache[bytes, float] = TTLCache(window, clock)
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def pending(self) -> int:
+        """The amount of different messages waiting to be sent."""
+        return len(self._pending)
+
+    def post(self, content: str | None = None, *, embed: discord.Embed | None = None) -> None:
+        """Queue a message to be sent.
+
+        Parameters
+        ----------
+        content : str | None
+            The text of the message.
+        embed : discord.Embed | None
+            The embed of the message.
+        """
+        key = orjson.dumps([content, embed.to_dict() if embed is not None else None], option=orjson.OPT_SORT_KEYS)
+        if (entry := self._pending.get(key)) is not None:
+            entry.count += 1
+            return
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        now = self._clock()
+        sent_at = self._recent.get(key)
+        self._pending[key] = _Entry(content, embed, now, now if sent_at is None else sent_at + self.window)
+        self._wakeup.set()
+
+    def start(self) -> None:
+        """Start sending queued messages."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="webhook-sink")
+
+    async def close(self) -> None:
+        """Stop the background task, then send everything still queued, held repeats included."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while batch := self._take(flush=True):
+            await self._send(*batch)
+
+    def _next_ready(self) -> float | None:
+        if not self._pending:
+            return None
+        return max(min(entry.not_before for entry in self._pending.values()) - self._clock(), 0.0)
+
+    def _take(self, flush: bool = False) -> tuple[list[str], list[discord.Embed]] | None:
+        now = self._clock()
+        self._recent.prune()  # most messages are never repeated, so their keys would otherwise be kept forever
+        contents: list[str] = []
+        embeds: list[discord.Embed] = []
+        length = 0
+        for key, entry in list(self._pending.items()):
+            if entry.not_before > now and not flush:
+                continue
+            content, embed = entry.render(now, held=entry.not_before > entry.first)
+            if embed is not None and len(embeds) >= MAX_EMBEDS:
+                continue
+            if content and contents and length + len(content) + 1 > MAX_CONTENT:
+                continue
+            if content:
+                contents.append(content[:MAX_CONTENT])
+                length += len(content) + 1
+            if embed is not None:
+                embeds.append(embed)
+            del self._pending[key]
+            self._recent[key] = now
+        return (contents, embeds) if contents or embeds else None
+
+    async def _run(self) -> None:
+        while True:
+            delay = self._next_ready()
+            if delay is None or delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if (batch := self._take()) is not None:
+                await self._send(*batch)
+                await asyncio.sleep(self.interval)
+
+    async def _send(self, contents: list[str], embeds: list[discord.Embed], attempts: int = 5) -> None:
+        kwargs: dict[str, Any] = {
+            "content": "\n".join(contents) if contents else MISSING,
+            "embeds": embeds or MISSING,
+            "username": self.username or MISSING,
+            "avatar_url": self.avatar_url or MISSING,
+            "allowed_mentions": self.allowed_mentions or MISSING,
+        }
+        for attempt in range(attempts):
+            try:
+                await self.webhook.send(**kwargs)
+            except discord.HTTPException as exc:
+                # discord.py already waits out rate limits it's told about, this is for the ones left over
+                if exc.status != 429 and exc.status < 500:
+                    break
+                await asyncio.sleep(min(2**attempt, 60))
+            except Exception:  # skipcq: PYL-W0703
+                break
+            else:
+                self.sent += len(contents) + len(embeds)
+                return
+        self.dropped += len(contents) + len(embeds)
+        _LOGGER.warning("Couldn't send %s log messages to webhook %s", len(contents) + len(embeds), self.webhook.id)
@@ -6,3 +6,7 @@ error = {$user}:
     Error invalid argument:
      Specified dice can only be d<int>, or if a constant modifier must be a perfect integer, positive or negative, connected with `+`, and no spaces.
 success = {$user} rolled `{$dice}` and got `{$result}`for a total of `{$total}`.
+summary = {$user} rolled `{$dice}` for a total of `{$total}`. That's {$count} dice, too many to list, the lowest roll was `{$lowest}` and the highest `{$highest}`.
+limit = {$user}:
+    Error, that's too many dice:
+     You can roll at most {$dice} dice at once, with at most {$sides} sides each.
@@ -8,3 +8,4 @@ no-pool-found = {$pool} pool not found. Please choose one from the autocomplete.
 mising-any-role = {$user}, you don't have any of the required role(s) to use {$command}.
 check-failed = {$user}, you can't use  {$command}.
 bad-code = {$user}, an error occurred while executing {$command}, Bluesy has been notified.
+render-busy = {$user}, the bot is drawing too many images right now, try {$command} again in a moment.
@@ -107,3 +107,36 @@ CREATE TABLE IF NOT EXISTS banners
     cooldown TIMESTAMP WITH TIME ZONE DEFAULT (CURRENT_TIMESTAMP + '7 days'::interval) NOT NULL,
     approved boolean                  DEFAULT FALSE                                    NOT NULL
 );
+
+CREATE TABLE IF NOT EXISTS mod_support_activity
+(
+    channel_id    BIGINT                   NOT NULL
+        CONSTRAINT mod_support_activity_pk
+            PRIMARY KEY,
+    last_activity TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS mod_support_last_activity_idx on mod_support_activity (last_activity);
+
+CREATE TABLE IF NOT EXISTS scheduled_jobs
+(
+    name     TEXT                     NOT NULL
+        CONSTRAINT scheduled_jobs_pk
+            PRIMARY KEY,
+    next_run TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_run TIMESTAMP WITH TIME ZONE
+);
+
+CREATE OR REPLACE VIEW user_stats AS
+SELECT users.id            AS id,
+       users.points        AS points,
+       COALESCE(b.bid, 0)  AS bid,
+       dp.last_claim       AS last_claim,
+       dp.last_particip_dt AS last_particip_dt,
+       COALESCE(dp.particip, 0) AS particip,
+       COALESCE(dp.won, 0) AS won,
+       COALESCE(w.wins, 0) AS wins
+FROM users
+         LEFT JOIN bids b ON users.id = b.id
+         LEFT JOIN daily_points dp ON users.id = dp.id
+         LEFT JOIN winners w ON users.id = w.id;
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+import asyncio
+import pathlib
+
+import aiohttp
+import discord
+import pytest
+from pytest_mock import MockerFixture
+
+from charbot.avatars import AvatarCache
+
+
+@pytest.fixture
+def avatar_bytes() -> bytes:
+    """The test avatar."""
+    return (pathlib.Path(__file__).parent / "media/test_avatar.png").read_bytes()
+
+
+def mock_session(mocker: MockerFixture, data: bytes):
+    """Mock aiohttp.ClientSession returning the given bytes for every get."""
+    response = mocker.AsyncMock(spec=aiohttp.ClientResponse)
+    response.read.return_value = data
+    response.raise_for_status = mocker.Mock()
+
+    class mock_get:
+        """Mock aiohttp.ClientSession.get()"""
+
+        async def __aenter__(self):
+            await asyncio.sleep(0)
+            return response
+
+        async def __aexit__(self, exc_type, exc_val, exc_tb):
+            pass
+
+    session = mocker.Mock(spec=aiohttp.ClientSession)
+    session.get = mocker.Mock(side_effect=lambda *args, **kwargs: mock_get())
+    return session
+
+
+def mock_asset(mocker: MockerFixture, key: str):
+    """Mock discord.Asset with the given key."""
+    asset = mocker.Mock(spec=discord.Asset)
+    asset.key = key
+    asset.replace.return_value.url = f"https://cdn.discordapp.com/avatars/1/{key}.png"
+    return asset
+
+
+@pytest.mark.asyncio
+async def test_avatar_cache_memory(mocker: MockerFixture, avatar_bytes: bytes):
+    """Test avatars are downloaded once, and resized."""
+    session = mock_session(mocker, avatar_bytes)
+    cache = AvatarCache(session)
+    asset = mock_asset(mocker, "abc")
+    first, second = await asyncio.gather(cache.get(asset, 100), cache.get(asset, 100))
+    assert first is second
+    assert first.size == (100, 100)
+    assert first.mode == "RGBA"
+    assert await cache.get(asset, 100) is first
+    assert session.get.call_count == 1
+    asset.replace.assert_called_with(size=128, format="png", static_format="png")
+    await cache.get(asset, 180)
+    assert session.get.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_avatar_cache_disk(mocker: MockerFixture, avatar_bytes: bytes, tmp_path: pathlib.Path):
+    """Test avatars are kept on disk across caches."""
+    session = mock_session(mocker, avatar_bytes)
+    asset = mock_asset(mocker, "abc")
+    await AvatarCache(session, disk_path=tmp_path).get(asset, 128)
+    assert (tmp_path / "abc_128.png").read_bytes() == avatar_bytes
+    img = await AvatarCache(session, disk_path=tmp_path).get(asset, 128)
+    assert img.size == (128, 128)
+    assert session.get.call_count == 1
+    assert AvatarCache(session, disk_path=tmp_path).prune_disk(max_age=-1) == 1
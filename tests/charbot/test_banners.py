@@ -8,7 +8,7 @@ from datetime import timedelta
 
 import discord
 import pytest
-from PIL import Image
+from PIL import Image, ImageDraw
 from discord.utils import utcnow
 from pytest_mock import MockerFixture
 
@@ -67,6 +67,24 @@ def test_prestige_positions(prestige: int):
         assert actual == expected, f"Got {actual} but expected {expected}"
 
 
+def test_gradient():
+    """Test the gradient matches drawing every diagonal as a line"""
+    expected = Image.new("RGBA", (200, 50), 0)
+    draw = ImageDraw.Draw(expected)
+    for i, color in enumerate(banner.interpolate(discord.Color.blue().to_rgb(), discord.Color.red().to_rgb(), 2000)):
+        draw.line([(i, 0), (0, i)], tuple(color), width=1)
+    assert banner.gradient(discord.Color.blue(), discord.Color.red(), (200, 50)) == expected
+
+
+def test_invalidate_banner():
+    """Test a user's cached banners are dropped"""
+    banner.BANNER_CACHE[(1, "quote", None, "avatar", "Name", 0)] = b"1"
+    banner.BANNER_CACHE[(2, "quote", None, "avatar", "Name", 0)] = b"2"
+    banner.invalidate_banner(1)
+    assert list(banner.BANNER_CACHE) == [(2, "quote", None, "avatar", "Name", 0)]
+    banner.BANNER_CACHE.clear()
+
+
 def test_static_color_banner():
     """Check the banner gets created properly with a solid color background"""
     with (
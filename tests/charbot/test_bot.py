@@ -8,6 +8,7 @@ import pytest
 from discord.utils import MISSING
 
 from charbot.bot import CBot, Holder
+from charbot.cache import TTLCache
 
 
 @pytest.fixture
@@ -48,3 +49,40 @@ def test_holder():
 def test_time(unused_patch_datetime_now):
     """Test the time classmethod"""
     assert CBot.TIME() == datetime.datetime(1, 1, 1, 9, 0, 0, 0, tzinfo=zoneinfo.ZoneInfo(key="America/Detroit"))
+
+
+@pytest.mark.asyncio
+async def test_user_stats_cache(mocker):
+    """Test user stats are cached, and invalidating or asking for uncached stats reads them again."""
+    bot = mocker.Mock(spec=CBot)
+    bot.user_stats_cache = TTLCache(10)
+    bot.pool = mocker.AsyncMock()
+    bot.pool.fetchrow.return_value = {"id": 1, "points": 50}
+    assert await CBot.user_stats(bot, 1) == {"id": 1, "points": 50}
+    assert await CBot.user_stats(bot, 1) == {"id": 1, "points": 50}
+    assert bot.pool.fetchrow.await_count == 1
+    await CBot.user_stats(bot, 1, cached=False)
+    assert bot.pool.fetchrow.await_count == 2
+    CBot.invalidate_user_stats(bot, 1)
+    CBot.invalidate_user_stats(bot, 2)
+    await CBot.user_stats(bot, 1)
+    assert bot.pool.fetchrow.await_count == 3
+    CBot.invalidate_user_stats(bot)
+    assert len(bot.user_stats_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_give_game_points_invalidates_after_write(mocker):
+    """Test the cached stats are dropped after the points are written, not before."""
+    bot = mocker.Mock(spec=CBot)
+    bot.TIME = CBot.TIME
+    bot.giveaway_user = mocker.AsyncMock(return_value=None)
+    calls: list[str] = []
+    conn = mocker.AsyncMock()
+    conn.execute.side_effect = lambda query, *args: calls.append(query.split()[0])
+    bot.pool = mocker.MagicMock()
+    bot.pool.acquire.return_value.__aenter__.return_value = conn
+    bot.invalidate_user_stats.side_effect = lambda user_id: calls.append("invalidate")
+    assert await CBot.give_game_points(bot, mocker.Mock(id=1), 2, 1) == 3
+    assert calls[-1] == "invalidate"
+    assert calls.count("invalidate") == 1
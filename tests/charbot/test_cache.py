@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+from charbot.cache import LRUCache, TTLCache
+
+
+def test_lru_cache():
+    """Test the LRU cache evicts the least recently used item."""
+    cache: LRUCache[str, int] = LRUCache(2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache.get("a") == 1
+    cache["c"] = 3
+    assert "b" not in cache
+    assert list(cache) == ["a", "c"]
+    assert cache.get("b", 0) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.pop("a") == 1
+    assert len(cache) == 1
+
+
+def test_ttl_cache():
+    """Test the TTL cache expires items."""
+    now = 0.0
+    cache: TTLCache[int, bool] = TTLCache(10, timer=lambda: now)
+    cache[1] = True
+    now = 5.0
+    cache[2] = True
+    assert 1 in cache
+    now = 10.0
+    assert 1 not in cache
+    assert cache.get(2) is True
+    cache[3] = True
+    now = 16.0
+    assert cache.prune() == 1
+    assert len(cache) == 1
+    assert cache.pop(3) is True
+    assert cache.pop(3) is None
@@ -26,3 +26,26 @@ def test_generate_card(current):
                 bg_image=BytesIO(f2.read()) if current == 0 else BytesIO(f3.read()) if current == 1 else MISSING,
             )
         )
+
+
+@pytest.mark.parametrize("status", ["online", "dnd", "invisible"])
+def test_generate_profile(status):
+    """Test the generate_profile function, with a decoded profile image like the avatar cache gives."""
+    profile = Image.new("RGBA", (180, 180), (0, 0, 255, 255))
+    image = Image.open(
+        card.generate_profile(
+            profile_image=profile,
+            level=3,
+            current_xp=100,
+            user_xp=150,
+            next_xp=300,
+            user_position=7,
+            user_name="Name#0001",
+            user_status=status,
+        )
+    )
+    assert image.size == (900, 238)
+    assert image.mode == "RGBA"
+    assert image.getpixel((119, 60)) == (0, 0, 255, 255)
+    assert image.getpixel((248 + 120, 195))[:3] == (252, 179, 63)
+    assert image.getpixel((248 + 400, 195))[:3] != (252, 179, 63)
@@ -77,7 +77,7 @@ async def test_valid_roll_async(mocker: MockerFixture):
     mock_ctx.bot = mock_bot
     mock_ctx.author.mention = "mock"
     cog = dice.Roll(mock_bot)
-    await cog.roll.__call__(mock_ctx, mock_ctx, dice="1d4+5")  # type: ignore  # skipcq: PYL-E1102
+    await cog.roll.__call__(cog, mock_ctx, dice="1d4+5")  # type: ignore  # skipcq: PYL-E1102
     mock_ctx.reply.assert_called_once_with("mock rolled `1d4+5` and got `1, 5`for a total of `6`.", mention_author=True)
 
 
@@ -90,7 +90,7 @@ async def test_invalid_roll_async(mocker: MockerFixture):
     mock_ctx.bot = mock_bot
     mock_ctx.author.mention = "mock"
     cog = dice.Roll(mock_bot)
-    await cog.roll.__call__(mock_ctx, mock_ctx, dice="1e4+5")  # type: ignore  # skipcq: PYL-E1102
+    await cog.roll.__call__(cog, mock_ctx, dice="1e4+5")  # type: ignore  # skipcq: PYL-E1102
     mock_ctx.reply.assert_called_once_with(
         "mock:\n"
         "Error invalid argument:\n"
@@ -147,3 +147,47 @@ async def test_cog_load(mocker: MockerFixture):
     mock_bot = mocker.Mock(spec=commands.Bot)
     await dice.setup(mock_bot)
     mock_bot.add_cog.assert_called_once()
+
+
+def test_parse():
+    """Test parsing dice expressions."""
+    assert dice.parse("2d6+d20+-3") == [dice.DiceTerm(2, 6), dice.DiceTerm(1, 20), dice.Constant(-3)]
+    with pytest.raises(ValueError):
+        dice.parse("d0")
+    with pytest.raises(ValueError):
+        dice.parse("xd6")
+    with pytest.raises(dice.DiceLimitError):
+        dice.parse("10000000d6")
+    with pytest.raises(dice.DiceLimitError):
+        dice.parse("5000d6+5001d6")
+    with pytest.raises(dice.DiceLimitError):
+        dice.parse("+".join(["1"] * 21))
+
+
+def test_limit_roll(user_localizer):
+    """Test a roll over the limits."""
+    assert dice.roll("100000000d6", *user_localizer) == (
+        "User:\n"
+        "Error, that's too many dice:\n"
+        " You can roll at most 10,000 dice at once, with at most 1,000,000 sides each."
+    )
+
+
+def test_huge_roll_summary(user_localizer):
+    """Test huge rolls are rolled in bulk and summarised."""
+    result = dice.evaluate(dice.parse("100000d6+5", dice.DiceLimits(max_dice=1_000_000)))
+    assert result.results is None
+    assert result.dice == 100000
+    assert 100005 <= result.total <= 600005
+    assert (result.lowest, result.highest) == (1, 6)
+    assert dice.roll("200d1+5", *user_localizer) == (
+        "User rolled `200d1+5` for a total of `205`. That's 200 dice, too many to list, the lowest"
+        " roll was `1` and the highest `1`."
+    )
+
+
+def test_limits_from_config(caplog):
+    """Test limits come from the config, with defaults for missing ones, and unknown keys are ignored."""
+    limits = dice.DiceLimits.from_config({"max_dice": 500, "max_dcie": 5})
+    assert limits == dice.DiceLimits(max_dice=500)
+    assert "max_dcie" in caplog.text
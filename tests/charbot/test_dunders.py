@@ -33,8 +33,12 @@ def test_config(monkeypatch, caplog):
     assert Config.get("calendar", "key") == "key"
     log = caplog.record_tuples[0]
     assert log[0] == "charbot.config"
-    assert log[1] == logging.INFO
+    assert log[1] == logging.DEBUG
     assert log[2] == "Got key calendar:key from config file."
+    caplog.clear()
+    assert "calendar" in Config
+    assert "metrics" not in Config
+    assert not [record for record in caplog.records if record.levelno >= logging.WARNING]
 
     with pytest.raises(KeyError):
         caplog.clear()
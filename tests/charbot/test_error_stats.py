@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+from discord import app_commands
+
+from charbot.error_stats import ErrorAggregator, fingerprint, unwrap
+
+
+class Clock:
+    """A clock that only moves when told to."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def fail(value: int) -> BaseException:
+    """Raise and catch an error, from the same line every time."""
+    try:
+        {}[value]
+    except KeyError as exc:
+        return exc
+    raise AssertionError  # pragma: no cover
+
+
+def fail_elsewhere() -> BaseException:
+    """Raise and catch the same type of error, from somewhere else."""
+    try:
+        [][0]
+    except IndexError as exc:
+        return exc
+    raise AssertionError  # pragma: no cover
+
+
+def test_fingerprint():
+    """Test errors from the same place share a fingerprint whatever their message, and wrapped errors are unwrapped."""
+    assert fingerprint(fail(1)) == fingerprint(fail(2))
+    assert fingerprint(fail(1)) != fingerprint(fail_elsewhere())
+    original = fail(1)
+    wrapped = app_commands.CommandInvokeError.__new__(app_commands.CommandInvokeError)
+    wrapped.original = original
+    assert unwrap(wrapped) is original
+
+
+def test_reports_first_and_rate_changes():
+    """Test only the first error of a group, doublings of its rate, and the first after a quiet window are reported."""
+    clock = Clock()
+    aggregator = ErrorAggregator(window=60, clock=clock)
+    reported = []
+    for i in range(10):
+        clock.now = i
+        reported.append(aggregator.record(fail(i), "command Admin.ping") is not None)
+    assert reported == [True, True, False, True, False, False, False, True, False, False]
+    clock.now = 200
+    group = aggregator.record(fail(0), "command Admin.ping")
+    assert group is not None
+    assert (group.count, len(group.recent)) == (11, 1)
+    assert group.location.endswith("in fail")
+    assert "11 so far, 1 in the last 60s" in group.summary(aggregator.window)
+
+
+def test_bounded_examples_and_groups():
+    """Test only the most recent examples and most recently seen groups are kept."""
+    aggregator = ErrorAggregator(examples=3, max_groups=1, clock=Clock())
+    for i in range(5):
+        aggregator.record(fail(i), f"job {i}")
+    assert [example.context for example in aggregator.examples] == ["job 2", "job 3", "job 4"]
+    aggregator.record(fail_elsewhere(), "job 5")
+    assert [group.error for group in aggregator.groups.values()] == ["IndexError: list index out of range"]
+    example = aggregator.example(next(iter(aggregator.groups))[:6])
+    assert example is not None
+    assert example.format().endswith("IndexError: list index out of range")
+    assert "in fail_elsewhere" in example.format()
+    assert aggregator.example("nope") is None
@@ -9,6 +9,8 @@ from discord.utils import utcnow
 from pytest_mock import MockerFixture
 
 from charbot import CBot, events
+from charbot.scheduler import Scheduler
+from charbot.webhooks import WebhookSink
 
 TILDE_SHORT = "~~:.|:;~~"
 TILDE_LONG = "tilde tilde colon dot vertical bar colon semicolon tilde tilde"
@@ -198,7 +200,7 @@ async def test_fail_everyone_ping(mocker: MockerFixture, monkeypatch):
     message.guild = mocker.AsyncMock(spec=discord.Guild)
     bot = mocker.AsyncMock(spec=CBot)
     cog = events.Events(bot)
-    cog.webhook = mocker.AsyncMock(spec=discord.Webhook)
+    cog.log_sink = mocker.Mock(spec=WebhookSink)
     fake_scan = mocker.AsyncMock()
     fake_scan.return_value = True
     monkeypatch.setattr(cog, "sensitive_scan", fake_scan)
@@ -234,14 +236,21 @@ async def test_parse_timeout(mocker: MockerFixture):
     member = mocker.AsyncMock(spec=discord.Member)
     member.id = 1
     member.timed_out_until = utcnow() + timedelta(seconds=694900)
-    cog = events.Events(mocker.AsyncMock(spec=CBot))
-    webhook = mocker.AsyncMock(spec=discord.Webhook)
-    cog.webhook = webhook
+    bot = mocker.AsyncMock(spec=CBot)
+    bot.scheduler = mocker.AsyncMock(spec=Scheduler)
+    cog = events.Events(bot)
+    sink = mocker.Mock(spec=WebhookSink)
+    cog.log_sink = sink
     await cog.parse_timeout(member)
     assert 1 in cog.timeouts
     assert cog.timeouts[1] == member.timed_out_until
-    webhook.send.assert_awaited_once()
-    embed = webhook.send.await_args.kwargs["embed"]
+    bot.scheduler.schedule_once.assert_called_once()
+    assert bot.scheduler.schedule_once.call_args.args[:2] == (
+        "untimeout:1",
+        member.timed_out_until + timedelta(seconds=1),
+    )
+    sink.post.assert_called_once()
+    embed = sink.post.call_args.kwargs["embed"]
     assert isinstance(embed, discord.Embed)
     assert embed.author.name is not None
     assert "[TIMEOUT]" in embed.author.name
@@ -254,6 +263,21 @@ async def test_parse_timeout(mocker: MockerFixture):
     assert "40 Second(s)" in dur
 
 
+@pytest.mark.asyncio
+async def test_untimeout_cancels_report(mocker: MockerFixture):
+    """Test a timeout being removed cancels its scheduled report, even if it isn't tracked."""
+    before = mocker.Mock(spec=discord.Member, timed_out_until=utcnow() + timedelta(hours=1))
+    after = mocker.Mock(spec=discord.Member, id=1, timed_out_until=None)
+    after.is_timed_out.return_value = False
+    bot = mocker.AsyncMock(spec=CBot)
+    bot.scheduler = mocker.Mock(spec=Scheduler)
+    cog = events.Events(bot)
+    cog.log_sink = mocker.Mock(spec=WebhookSink)
+    await cog.on_member_update(before, after)
+    bot.scheduler.cancel.assert_called_once_with("untimeout:1")
+    cog.log_sink.post.assert_called_once()
+
+
 @pytest.mark.asyncio
 async def test_on_member_join(mocker: MockerFixture):
     """Test members get properly added on join."""
@@ -12,6 +12,7 @@ from pytest_mock import MockerFixture
 # noinspection PyProtectedMember
 from charbot import CBot, _Config, gcal  # skipcq
 from charbot.bot import Holder
+from charbot.scheduler import Scheduler
 
 
 @pytest.fixture
@@ -33,16 +34,65 @@ def mock_config(monkeypatch):
 
 
 def test_get_params(mock_config):
-    """Test get_url."""
-    date_min = datetime.datetime(1, 1, 1, 0, 0, 0, 0)
-    date_max = datetime.datetime(10, 10, 10, 10, 10, 10, 10)
+    """Test get_params."""
+    assert {"key": "calenderkey"} == gcal.get_params()
+    assert {"key": "calenderkey", "syncToken": "sync"} == gcal.get_params("sync")
+    assert {"key": "calenderkey", "pageToken": "page"} == gcal.get_params("sync", "page")
 
-    assert {
-        "key": "calenderkey",
-        "singleEvents": "True",
-        "timeMin": "0001-01-01T00:00:00",
-        "timeMax": "0010-10-10T10:10:10.000010",
-    } == gcal.get_params(date_min, date_max)
+
+def test_expand_recurrence():
+    """Test expand_recurrence."""
+    start = datetime.datetime(2022, 3, 1, 12, tzinfo=ZoneInfo("America/Detroit"))  # a tuesday
+    rules = ["RRULE:FREQ=WEEKLY;BYDAY=TU,TH;COUNT=5", "EXDATE;TZID=America/Detroit:20220308T120000"]
+    occurrences = list(gcal.expand_recurrence(rules, start, start + datetime.timedelta(weeks=4)))
+    assert [occurrence.day for occurrence in occurrences] == [1, 3, 10, 15]
+    # stepping happens in wall clock time, so the DST change on 2022-03-13 doesn't move the stream
+    assert all(occurrence.hour == 12 for occurrence in occurrences)
+    until = list(gcal.expand_recurrence(["RRULE:FREQ=DAILY;UNTIL=20220303T170000Z"], start, start.replace(month=4)))
+    assert [occurrence.day for occurrence in until] == [1, 2, 3]
+    assert list(gcal.expand_recurrence([], start, start.replace(month=4))) == [start]
+
+
+def test_event_store():
+    """Test the event store applies incremental changes."""
+    now = datetime.datetime(2022, 3, 1, 10, tzinfo=datetime.timezone.utc)
+    master: gcal.CalEvent = {
+        "id": "series",
+        "status": "confirmed",
+        "created": "2022-03-01T00:00:00Z",
+        "updated": "2022-03-01T00:00:00Z",
+        "summary": "Stream",
+        "recurrence": ["RRULE:FREQ=DAILY"],
+        "start": {"dateTime": "2022-03-01T12:00:00Z", "timeZone": "UTC"},
+        "end": {"dateTime": "2022-03-01T16:00:00Z", "timeZone": "UTC"},
+    }
+    store = gcal.EventStore()
+    store.apply([master], now)
+    store.extend(now + datetime.timedelta(days=3), now)
+    assert len(store.fields(now, now + datetime.timedelta(days=7))) == 3
+    assert store.next_event(now) == datetime.datetime(2022, 3, 1, 12, tzinfo=datetime.timezone.utc)
+
+    cancelled: gcal.CalEvent = {
+        **master,  # type: ignore
+        "id": "series_20220301T120000Z",
+        "status": "cancelled",
+        "recurringEventId": "series",
+        "originalStartTime": master["start"],
+    }
+    del cancelled["recurrence"]  # type: ignore
+    store.apply([cancelled], now)
+    assert len(store.fields(now, now + datetime.timedelta(days=7))) == 2
+    assert store.next_event(now) == datetime.datetime(2022, 3, 2, 12, tzinfo=datetime.timezone.utc)
+
+    # the cancellation sticks when the series itself is changed afterwards
+    store.apply([{**master, "summary": "Renamed"}], now)  # type: ignore
+    fields = store.fields(now, now + datetime.timedelta(days=7))
+    assert len(fields) == 2
+    assert all(field.name == "Renamed" for field in fields.values())
+
+    store.apply([{**master, "status": "cancelled"}], now)  # type: ignore
+    assert store.fields(now, now + datetime.timedelta(days=7)) == {}
+    assert store.next_event(now) is None
 
 
 def test_half_hour_intervals():
@@ -65,7 +115,6 @@ def test_ceil_dt():
 
 def test_calendar_embed():
     """Test create_embed."""
-    test: dict[int, gcal.EmbedField] = {}
     fake_time = datetime.datetime(1970, 1, 1, 0, 0, 0, 0, tzinfo=datetime.timezone.utc)
     sample: gcal.CalEvent = {
         "summary": "test",
@@ -77,7 +126,7 @@ def test_calendar_embed():
         "status": "confirmed",
         "originalStartTime": {"dateTime": "2022-03-24T16:00:00-04:00", "timeZone": "America/Detroit"},
     }
-    gcal.default_field(test, fake_time, sample)
+    test = {0: gcal.event_field(fake_time, sample)}
     assert len(test) == 1
     assert isinstance(test[0], gcal.EmbedField)
     assert test[0].name == "test"
@@ -106,11 +155,10 @@ async def test_cog_init_load_unload(mocker: MockerFixture, event_loop, mock_conf
     fetch_webhook = mocker.AsyncMock(spec=discord.Webhook, return_value=fake_webhook)
     bot.fetch_webhook = fetch_webhook
     bot.loop = event_loop
+    bot.scheduler = mocker.AsyncMock(spec=Scheduler)
     await gcal.setup(bot)
     bot.add_cog.assert_called_once()
     cog: gcal.Calendar = bot.add_cog.call_args.args[0]
-    start_spy = mocker.spy(cog.calendar, "start")
-    cancel_spy = mocker.spy(cog.calendar, "cancel")
     await cog.cog_load()
     assert isinstance(cog, gcal.Calendar)
     assert cog.bot is bot
@@ -123,9 +171,10 @@ async def test_cog_init_load_unload(mocker: MockerFixture, event_loop, mock_conf
     # E       AssertionError: expected call not found.
     # E       Expected: fetch_webhook(1)
     # E       Actual: fetch_webhook(1)
-    assert start_spy.call_count == 1
+    bot.scheduler.register.assert_awaited_once()
+    assert bot.scheduler.register.await_args.args[:2] == ("calendar", cog.calendar)
     await cog.cog_unload()
-    assert cancel_spy.call_count == 1
+    bot.scheduler.cancel.assert_called_once_with("calendar")
     assert bot.holder.get("message") is discord.utils.MISSING
     assert bot.holder.get("webhook") is fake_webhook
 
@@ -136,6 +185,7 @@ async def test_caledar_task(mocker: MockerFixture, event_loop, mock_config, monk
     data = {
         "items": [
             {
+                "id": "event1",
                 "status": "cancelled",
                 "created": "2022-03-11T04:26:45.000Z",
                 "updated": "2022-04-30T17:02:48.118Z",
@@ -145,6 +195,7 @@ async def test_caledar_task(mocker: MockerFixture, event_loop, mock_config, monk
                 "end": {"dateTime": "2022-03-22T16:00:00-04:00", "timeZone": "America/Detroit"},
             },
             {
+                "id": "event2",
                 "status": "confirmed",
                 "created": "2022-03-11T04:27:18.000Z",
                 "updated": "2022-04-30T17:12:25.493Z",
@@ -159,6 +210,7 @@ async def test_caledar_task(mocker: MockerFixture, event_loop, mock_config, monk
                 "end": {"dateTime": "2022-03-24T16:00:00-04:00", "timeZone": "America/Detroit"},
             },
             {
+                "id": "event3",
                 "status": "confirmed",
                 "created": "2022-03-11T04:27:18.000Z",
                 "updated": "2022-04-30T17:12:25.493Z",
@@ -174,6 +226,7 @@ async def test_caledar_task(mocker: MockerFixture, event_loop, mock_config, monk
                 "end": {"dateTime": "2022-03-24T16:00:00-04:00", "timeZone": "America/Detroit"},
             },
             {
+                "id": "event4",
                 "status": "confirmed",
                 "created": "2022-03-11T04:26:45.000Z",
                 "updated": "2022-05-18T17:35:59.959Z",
@@ -188,6 +241,7 @@ async def test_caledar_task(mocker: MockerFixture, event_loop, mock_config, monk
                 "end": {"dateTime": "2022-06-14T16:00:00-04:00", "timeZone": "America/Detroit"},
             },
             {
+                "id": "event5",
                 "status": "confirmed",
                 "created": "2022-03-11T04:27:18.000Z",
                 "updated": "2022-05-18T17:36:10.247Z",
@@ -220,13 +274,13 @@ async def test_caledar_task(mocker: MockerFixture, event_loop, mock_config, monk
     fake_webhook.fetch_message.return_value = fake_message
     bot.fetch_webhook.retun_value = fake_webhook
     bot.loop = event_loop
+    bot.scheduler = mocker.AsyncMock(spec=Scheduler)
     async with aiohttp.ClientSession() as session:
         session.get = lambda *args, **kwargs: mock_get()  # type: ignore
         bot.session = session
         cog = gcal.Calendar(bot)
         await cog.cog_load()
-        await cog.calendar.__call__()  # skipcq: PYL-E1102
-    cog.calendar.cancel()
+        await cog.calendar()
     assert mock_response.json.call_count == 1
     assert mock_response.json.call_args.kwargs["loads"] is __import__("orjson").loads
     # fake_webhook.fetch_message.edit.assert_awaited_once()
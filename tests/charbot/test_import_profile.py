@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+from charbot import import_profile
+
+OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:        80 |        200 | io
+import time:      3000 |       3000 |       numpy.core
+import time:       500 |       3500 |     numpy
+import time:        40 |         40 |     json
+import time:       900 |        900 |     pytesseract
+import time:       100 |       4540 |   charbot.query
+Traceback (most recent call last):
+"""
+
+
+def test_parse_importtime():
+    """Test the header and other lines are skipped, and the depth comes from the indentation."""
+    times = import_profile.parse_importtime(OUTPUT)
+    assert [time.name for time in times] == [
+        "_io",
+        "io",
+        "numpy.core",
+        "numpy",
+        "json",
+        "pytesseract",
+        "charbot.query",
+    ]
+    assert times[0] == import_profile.ImportTime("_io", 1, 120, 120)
+    assert times[1].depth == 0
+    assert times[2].depth == 3
+
+
+def test_profile_module():
+    """Test only the direct imports of the module are ranked, and a module that wasn't imported costs nothing."""
+    times = import_profile.parse_importtime(OUTPUT)
+    profile = import_profile.profile_module("charbot.query", times, top=2)
+    assert profile.cumulative_us == 4540
+    assert [child.name for child in profile.heaviest] == ["numpy", "pytesseract"]
+    assert import_profile.profile_module("pandas", times) == import_profile.ModuleProfile("pandas", 0, [])
+
+
+def test_format_profile():
+    """Test the package comes first, then the modules slowest first, with failures shown."""
+    report = import_profile.format_profile(
+        [
+            import_profile.ModuleProfile("charbot", 1000, []),
+            import_profile.ModuleProfile("charbot.dice", 2000, []),
+            import_profile.ModuleProfile("charbot.query", 4000, [import_profile.ImportTime("numpy", 1, 500, 3500)]),
+            import_profile.ModuleProfile("charbot.programs", 0, [], "ModuleNotFoundError"),
+        ]
+    ).splitlines()
+    assert [line.split()[0] for line in report] == [
+        "module",
+        "charbot",
+        "charbot.query",
+        "charbot.dice",
+        "charbot.programs",
+        "total",
+    ]
+    assert report[2].endswith("numpy 4ms")
+    assert report[4].endswith("failed: ModuleNotFoundError")
+    assert report[5].split()[1] == "7ms"
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+import asyncio
+import contextvars
+import logging
+import sys
+import threading
+from io import StringIO
+
+import orjson
+import pytest
+
+from charbot import logs
+from charbot.sql_stats import QUERY_TAG
+
+
+def record(msg: str, *args, level: int = logging.ERROR) -> logging.LogRecord:
+    """Make a record from the test logger."""
+    return logging.LogRecord("charbot.test", level, __file__, 1, msg, args, None)
+
+
+def test_duplicate_filter():
+    """Test only a few of the same record pass per window, and the next to pass says how many were suppressed."""
+    now = 0.0
+    dup = logs.DuplicateFilter(window=10, limit=2, clock=lambda: now)
+    assert [dup.filter(record("failed %s", i)) for i in range(5)] == [True, True, False, False, False]
+    assert dup.filter(record("failed %s", 1, level=logging.WARNING))
+    assert dup.filter(record("other"))
+    now = 10.0
+    passed = record("failed %s", 6)
+    assert dup.filter(passed)
+    assert passed.suppressed == 3
+
+
+def test_json_formatter():
+    """Test records are formatted as a JSON line, with their context and traceback."""
+    try:
+        raise ValueError("bad")
+    except ValueError:
+        rec = logging.LogRecord("charbot.test", logging.ERROR, __file__, 1, "failed %s", ("job",), True)
+        rec.exc_info = sys.exc_info()
+
+    def tagged() -> None:
+        QUERY_TAG.set("command:Admin.ping")
+        logs.ContextFilter().filter(rec)
+
+    contextvars.copy_context().run(tagged)
+    line = logs.JsonFormatter().format(rec)
+    assert "\n" not in line
+    data = orjson.loads(line)
+    assert data["level"] == "ERROR"
+    assert data["message"] == "failed job"
+    assert data["tag"] == "command:Admin.ping"
+    assert "task" not in data
+    assert data["exc"].endswith("ValueError: bad")
+
+
+@pytest.mark.asyncio
+async def test_queued_logging():
+    """Test records are written by the listener thread, in the configured format, with the task that logged them."""
+    logger = logging.getLogger("charbot.test_logs")
+    logger.propagate = False
+    stream = StringIO()
+    handler = logging.StreamHandler(stream)
+    written_by: list[str] = []
+    handler.addFilter(lambda rec: written_by.append(threading.current_thread().name) or True)
+    logger.addHandler(handler)
+    pipeline = logs.QueuedLogging(limit=1)
+    pipeline.start([logger])
+    try:
+        assert logger.handlers == pipeline.handlers
+
+        async def log() -> None:
+            for i in range(3):
+                logger.warning("storm %s", i)
+
+        await asyncio.create_task(log(), name="handler")
+    finally:
+        pipeline.stop()
+        logger.handlers.clear()
+    lines = [orjson.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["message"] for line in lines] == ["storm 0"]
+    assert lines[0]["task"] == "handler"
+    assert threading.current_thread().name not in written_by
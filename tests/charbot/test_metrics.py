@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+import aiohttp
+import discord
+import pytest
+from pytest_mock import MockerFixture
+
+from charbot import metrics
+from charbot.cache import LRUCache
+
+
+def test_histogram():
+    """Test observations land in their buckets, and quantiles come from the bucket bounds."""
+    histogram = metrics.Histogram()
+    assert histogram.quantile(0.5) == 0.0
+    for seconds in (0.0005, 0.002, 0.002, 0.3, 20.0):
+        histogram.observe(seconds)
+    assert histogram.count == 5
+    assert histogram.counts[0] == 1
+    assert histogram.counts[1] == 2
+    assert histogram.counts[-1] == 1
+    assert histogram.quantile(0.5) == 0.0025
+    assert histogram.quantile(0.8) == 0.5
+    assert histogram.quantile(1) == 20.0
+    assert histogram.total == pytest.approx(20.3045)
+    merged = metrics.Histogram()
+    merged.observe(0.0005)
+    merged.merge(histogram)
+    assert merged.count == 6
+    assert merged.counts[0] == 2
+    assert merged.max == 20.0
+
+
+def test_exposition():
+    """Test metrics are formatted in the Prometheus text format, with cumulative buckets and escaped labels."""
+    registry = metrics.Registry()
+    registry.counter("requests_total", "Requests.", ("path",)).labels('a"b\\c').inc(3)
+    registry.histogram("latency_seconds", "Latency.").labels().observe(0.003)
+    with pytest.raises(ValueError):
+        registry.gauge("requests_total", "Again.")
+    with pytest.raises(ValueError):
+        registry.families["requests_total"].labels()
+    lines = registry.expose().splitlines()
+    assert lines[:3] == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{path="a\\"b\\\\c"} 3',
+    ]
+    assert lines[5:8] == [
+        'latency_seconds_bucket{le="0.001"} 0',
+        'latency_seconds_bucket{le="0.0025"} 0',
+        'latency_seconds_bucket{le="0.005"} 1',
+    ]
+    assert lines[-3:] == [
+        'latency_seconds_bucket{le="+Inf"} 1',
+        "latency_seconds_sum 0.003",
+        "latency_seconds_count 1",
+    ]
+
+
+def test_collectors():
+    """Test collected metrics are read on every scrape, and a failing collector doesn't hide the others."""
+    registry = metrics.BotMetrics()
+    cache: LRUCache[str, int] = LRUCache(4)
+    cache["a"] = 1
+    cache.get("a")
+    cache.get("b")
+    registry.caches["avatars"] = cache
+
+    def broken():
+        raise RuntimeError
+
+    registry.register(broken)
+    exposed = registry.expose()
+    assert 'charbot_cache_requests_total{cache="avatars",result="hit"} 1' in exposed
+    assert 'charbot_cache_requests_total{cache="avatars",result="miss"} 1' in exposed
+    assert 'charbot_cache_entries{cache="avatars"} 1' in exposed
+    cache.get("a")
+    assert 'charbot_cache_requests_total{cache="avatars",result="hit"} 2' in registry.expose()
+
+
+def test_timed_response(mocker: MockerFixture):
+    """Test only the first response to an interaction acknowledges it, whatever kind it is."""
+    on_ack = mocker.Mock()
+    response = metrics.TimedResponse(mocker.Mock(spec=discord.Interaction), on_ack)
+    assert not response.is_done()
+    response._response_type = discord.InteractionResponseType.deferred_channel_message
+    response._response_type = discord.InteractionResponseType.channel_message
+    on_ack.assert_called_once_with()
+    assert response.type is discord.InteractionResponseType.channel_message
+    interaction = mocker.Mock(spec=discord.Interaction)
+    interaction.command.qualified_name = "rank"
+    interaction.extras = {}
+    registry = metrics.BotMetrics()
+    registry.command_started(interaction)
+    interaction._cs_response._response_type = discord.InteractionResponseType.deferred_channel_message
+    registry.command_finished(interaction, "ok")
+    assert registry.acks.labels("rank").count == 1
+    assert registry.app_commands.labels("rank", "ok").count == 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_server():
+    """Test the metrics are served over HTTP."""
+    registry = metrics.Registry()
+    registry.gauge("up", "Whether the bot is up.").labels().set(1)
+    server = metrics.MetricsServer(registry, port=0)
+    await server.start()
+    try:
+        host, port = server._runner.addresses[0]  # type: ignore
+        async with aiohttp.ClientSession() as session, session.get(f"http://{host}:{port}/metrics") as response:
+            assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+            assert (await response.text()).splitlines()[-1] == "up 1"
+    finally:
+        await server.close()
@@ -9,6 +9,7 @@ from pytest_mock import MockerFixture
 
 from charbot import CBot, GuildComponentInteraction as Interaction
 from charbot.programs import minesweeper
+from charbot.render import RenderService
 from charbot_rust.minesweeper import Game, RevealResult, ChordResult  # pyright: ignore[reportGeneralTypeIssues]
 
 
@@ -21,6 +22,7 @@ def game() -> Game:
 def inter(mocker: MockerFixture):
     interaction = mocker.AsyncMock(spec=Interaction[CBot])
     interaction.client = mocker.AsyncMock(spec=CBot)
+    interaction.client.renderer = RenderService()
     interaction.response = mocker.AsyncMock(spec=discord.InteractionResponse)
     return interaction
 
@@ -36,9 +38,9 @@ async def test_minesweeper_init(game: Game):
 @pytest.mark.asyncio
 async def test_minesweeper_draw(game: Game):
     view = minesweeper.Minesweeper(game)
-    file = await view.draw("Minesweeper Board")
+    file = await view.draw(RenderService(), "Minesweeper Board")
     assert isinstance(file, discord.File), "File should be a discord.File"
-    assert file.filename == "minesweeper.png", "File should have the filename minesweeper.png"
+    assert file.filename == "minesweeper.webp", "File should have the filename minesweeper.webp"
     assert file.description == "Minesweeper Board", "File should have the description Minesweeper board"
     assert not file.spoiler, "File should not be marked as a spoiler"
 
@@ -51,7 +53,7 @@ async def test_handle_lose(game: Game, inter):
     inter.edit_original_response.assert_awaited_once()
     kwargs: dict[str, Any] = inter.edit_original_response.await_args.kwargs
     embed: discord.Embed = kwargs["embed"]
-    assert embed.image.url == "attachment://minesweeper.png", "Image should be a reference to the attachment"
+    assert embed.image.url == "attachment://minesweeper.webp", "Image should be a reference to the attachment"
     assert kwargs["view"] is None, "View should be None"
     assert view.is_finished(), "Game should be finished"
     assert "attachments" in kwargs, "Attachments should be in the kwargs"
@@ -67,7 +69,7 @@ async def test_handle_win(game: Game, inter):
     inter.edit_original_response.assert_awaited_once()
     kwargs: dict[str, Any] = inter.edit_original_response.await_args.kwargs
     embed: discord.Embed = kwargs["embed"]
-    assert embed.image.url == "attachment://minesweeper.png", "Image should be a reference to the attachment"
+    assert embed.image.url == "attachment://minesweeper.webp", "Image should be a reference to the attachment"
     assert kwargs["view"] is None, "View should be None"
     assert view.is_finished(), "Game should be finished"
     assert "attachments" in kwargs, "Attachments should be in the kwargs"
@@ -223,7 +225,7 @@ async def test_quit(game, inter):
     inter.response.edit_message.assert_awaited_once()
     kwargs: dict[str, Any] = inter.response.edit_message.await_args.kwargs
     embed: discord.Embed = kwargs["embed"]
-    assert embed.image.url == "attachment://minesweeper.png", "Image should be a reference to the attachment"
+    assert embed.image.url == "attachment://minesweeper.webp", "Image should be a reference to the attachment"
     assert kwargs["view"] is None, "View should be None"
     assert view.is_finished(), "Game should be finished"
     assert "attachments" in kwargs, "Attachments should be in the kwargs"
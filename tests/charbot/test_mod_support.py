@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+from datetime import timedelta
+
+import discord
+import orjson
+import pytest
+from asyncpg import Pool
+from discord.utils import utcnow
+from pytest_mock import MockerFixture
+
+from charbot import CBot, mod_support
+
+
+@pytest.mark.asyncio
+async def test_blacklist(tmp_path):
+    """Test the blacklist is held in memory and written through to disk."""
+    path = tmp_path / "mod_support_blacklist.json"
+    path.write_bytes(orjson.dumps({"blacklisted": [1, 2]}))
+    path.chmod(0o644)
+    blacklist = mod_support.Blacklist(path)
+    await blacklist.load()
+    assert 1 in blacklist
+    assert 3 not in blacklist
+    assert await blacklist.add(3) is True
+    assert await blacklist.add(3) is False
+    assert await blacklist.remove(1) is True
+    assert await blacklist.remove(1) is False
+    assert sorted(blacklist) == [2, 3]
+    assert orjson.loads(path.read_bytes()) == {"blacklisted": [2, 3]}
+    assert [file.name for file in tmp_path.iterdir()] == [path.name]  # no temporary files left behind
+    assert path.stat().st_mode & 0o777 == 0o644  # the replaced file keeps its permissions
+
+
+@pytest.mark.asyncio
+async def test_blacklist_failed_write(tmp_path, monkeypatch):
+    """Test a failed write leaves both the file and the in memory blacklist unchanged."""
+    path = tmp_path / "mod_support_blacklist.json"
+    path.write_bytes(orjson.dumps({"blacklisted": [1]}))
+    blacklist = mod_support.Blacklist(path)
+    await blacklist.load()
+
+    def fail(*_):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(mod_support.os, "replace", fail)
+    with pytest.raises(OSError):
+        await blacklist.add(2)
+    assert 2 not in blacklist
+    assert orjson.loads(path.read_bytes()) == {"blacklisted": [1]}
+    assert [file.name for file in tmp_path.iterdir()] == [path.name]
+
+
+@pytest.mark.asyncio
+async def test_stale_ticket_sweep(mocker: MockerFixture, database: Pool):
+    """Test the sweeper deletes tickets by their indexed activity, reading history only for unindexed ones."""
+    bot = mocker.AsyncMock(spec=CBot)
+    bot.pool = database
+    cog = mod_support.ModSupport(bot)
+    now = utcnow()
+
+    def ticket(channel_id: int, name: str = "general-user-mod-support"):
+        channel = mocker.AsyncMock(spec=discord.TextChannel)
+        channel.id = channel_id
+        channel.name = name
+        channel.created_at = now - timedelta(days=10)
+        channel.history = mocker.Mock(return_value=AsyncIter([]))
+        return channel
+
+    active, stale, unindexed, other = ticket(1), ticket(2), ticket(3), ticket(4, "general")
+    guild = mocker.Mock(spec=discord.Guild)
+    guild.text_channels = [active, stale, unindexed, other]
+    bot.get_guild.return_value = guild
+    await cog.record_activity(1, now - timedelta(hours=1))
+    await cog.record_activity(2, now - timedelta(days=4))
+    await cog.record_activity(5, now - timedelta(days=4))  # deleted while offline
+    await cog.check_mod_support_channels()
+    active.delete.assert_not_awaited()
+    active.history.assert_not_called()
+    stale.delete.assert_awaited_once()
+    stale.history.assert_not_called()
+    unindexed.history.assert_called_once()
+    unindexed.delete.assert_awaited_once()
+    other.delete.assert_not_awaited()
+    rows = await database.fetch("SELECT channel_id FROM mod_support_activity ORDER BY channel_id")
+    assert [row["channel_id"] for row in rows] == [1, 2, 3]
+    await database.execute("DELETE FROM mod_support_activity")
+
+
+class AsyncIter:
+    """An async iterator over a list, standing in for channel history."""
+
+    def __init__(self, items):
+        self.items = iter(items)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.items)
+        except StopIteration:
+            raise StopAsyncIteration
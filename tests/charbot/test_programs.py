@@ -3,6 +3,8 @@
 # SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
 #
 # SPDX-License-Identifier: MIT
+import functools
+
 import aiohttp
 import discord
 import pytest
@@ -12,6 +14,7 @@ from pytest_mock import MockerFixture
 
 from charbot import CBot
 from charbot import errors
+from charbot.cache import TTLCache
 from charbot.programs.cog import Reputation
 
 pytestmark = pytest.mark.asyncio
@@ -176,7 +179,7 @@ async def test_tictactoe_command(mock_bot, mocker: MockerFixture):
     mock_interaction.followup.send.assert_awaited_once()
     _, kwargs = mock_interaction.followup.send.await_args
     assert "embed" in kwargs, "Expected an embed to be sent."
-    assert kwargs["embed"].image.url == "attachment://tictactoe.png", "Expected an attachment reference to be sent."
+    assert kwargs["embed"].image.url == "attachment://tictactoe.webp", "Expected an attachment reference to be sent."
     assert "view" in kwargs, "Expected a view to be sent."
     assert "file" in kwargs, "Expected a file to be sent."
 
@@ -211,7 +214,7 @@ async def test_minesweeper_command(mock_bot, mocker: MockerFixture, difficulty:
     mock_interaction.followup.send.assert_awaited_once()
     _, kwargs = mock_interaction.followup.send.await_args
     assert "embed" in kwargs, "Expected an embed to be sent."
-    assert kwargs["embed"].image.url == "attachment://minesweeper.png", "Expected an attachment reference to be sent."
+    assert kwargs["embed"].image.url == "attachment://minesweeper.webp", "Expected an attachment reference to be sent."
     assert "view" in kwargs, "Expected a view to be sent."
     assert "file" in kwargs, "Expected a file to be sent."
 
@@ -220,6 +223,8 @@ async def test_reputation_command(mock_bot, mocker: MockerFixture, database: Poo
     """Test that the code for the reputation command functions as expected."""
     cog = Reputation(mock_bot)
     mock_bot.pool = database
+    mock_bot.user_stats_cache = TTLCache(10)
+    mock_bot.user_stats = functools.partial(CBot.user_stats, mock_bot)
     mock_interaction = mocker.AsyncMock(spec=discord.Interaction)
     mock_interaction.user = mocker.AsyncMock(spec=discord.Member)
     mock_interaction.user.id = 1
@@ -235,3 +240,33 @@ async def test_reputation_command(mock_bot, mocker: MockerFixture, database: Poo
         == "You have 50 reputation, you haven't claimed your daily bonus, and you haven't hit your daily program cap,"
         " and have 0/3 wins in the last month."
     ), "Expected the correct number of points to be sent."
+
+
+async def test_rollcall_command(mock_bot, mocker: MockerFixture, database: Pool):
+    """Test rollcall claims once a day, for new users and users without a daily_points row."""
+    cog = Reputation(mock_bot)
+    mock_bot.pool = database
+    mock_bot.TIME = CBot.TIME
+
+    async def rollcall(user_id: int) -> str:
+        mock_interaction = mocker.AsyncMock(spec=discord.Interaction)
+        mock_interaction.user = mocker.AsyncMock(spec=discord.Member)
+        mock_interaction.user.id = user_id
+        mock_interaction.response = mocker.AsyncMock(spec=discord.InteractionResponse)
+        mock_interaction.followup = mocker.AsyncMock(spec=discord.Webhook)
+        await cog.rollcall.callback(cog, mock_interaction)  # pyright: ignore[reportGeneralTypeIssues]
+        mock_interaction.response.defer.assert_awaited_once()
+        return mock_interaction.followup.send.await_args.args[0]
+
+    assert await rollcall(2) == "You got some Rep today, inmate"
+    assert await rollcall(2) == "No more Rep for you yet, get back to your cell"
+    assert await rollcall(1) == "You got some Rep today, inmate"
+    points = {row["id"]: row["points"] for row in await database.fetch("SELECT id, points FROM users")}
+    assert points[1] == 70
+    assert points[2] == 20
+    assert await database.fetchval("SELECT bid FROM bids WHERE id = 2") == 0
+    assert await database.fetchval("SELECT last_claim FROM daily_points WHERE id = 2") == CBot.TIME()
+    await database.execute("DELETE FROM users WHERE id = 2")
+    await database.execute("DELETE FROM daily_points WHERE id = 1")
+    await database.execute("DELETE FROM bids WHERE id = 1")
+    await database.execute("UPDATE users SET points = 50 WHERE id = 1")
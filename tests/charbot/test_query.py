@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 # SPDX-FileCopyrightText: 2021 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
 # SPDX-License-Identifier: MIT
+import asyncio
+
 import discord
 import pytest
 from discord.ext import commands
@@ -157,3 +159,89 @@ async def test_setup_function(mocker: MockerFixture):
     mock_bot = mocker.AsyncMock(spec=commands.Bot)
     await query.setup(mock_bot)
     mock_bot.add_cog.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_ocr_service_fairness_and_cache(monkeypatch):
+    """Test the OCR queue takes turns between users, dedupes in flight images and caches results."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    order: list[bytes] = []
+
+    def fake_read(data: bytes) -> str:
+        order.append(data)
+        return data.decode()
+
+    monkeypatch.setattr(query, "_prepare_job", lambda data: [data])
+    monkeypatch.setattr(query, "_read_strip", fake_read)
+    monkeypatch.setattr(query.OCRService, "_new_executor", lambda self: ThreadPoolExecutor(self.workers))
+    service = query.OCRService(workers=1, max_pending=4, max_pending_per_user=3)
+    reads = [
+        service.read(1, b"a1"),
+        service.read(1, b"a2"),
+        service.read(1, b"a3"),
+        service.read(2, b"b1"),
+        service.read(2, b"a1"),  # same image as user 1's first, only read once
+    ]
+    tasks = [asyncio.create_task(read) for read in reads]
+    await asyncio.sleep(0)
+    assert service.pending == 4
+    with pytest.raises(query.OCRQueueFull) as exc:
+        await service.read(3, b"c1")
+    assert exc.value.per_user is False
+    service.start()
+    assert await asyncio.gather(*tasks) == ["a1", "a2", "a3", "b1", "a1"]
+    assert order == [b"a1", b"b1", b"a2", b"a3"]
+    assert await service.read(3, b"b1") == "b1"
+    assert len(order) == 4
+    with pytest.raises(query.OCRQueueFull) as exc:
+        await asyncio.gather(*(service.read(4, bytes([i])) for i in range(4)))
+    assert exc.value.per_user is True
+    await service.close()
+
+
+@pytest.mark.asyncio
+async def test_ocr_service_close_cancels_in_flight(monkeypatch):
+    """Test closing the service while an image is being read cancels its read, rather than leaving it waiting."""
+    from concurrent.futures import ThreadPoolExecutor
+    import threading
+
+    release = threading.Event()
+    monkeypatch.setattr(query, "_prepare_job", lambda data: release.wait(5) and [])
+    monkeypatch.setattr(query.OCRService, "_new_executor", lambda self: ThreadPoolExecutor(self.workers))
+    service = query.OCRService(workers=1)
+    service.start()
+    read = asyncio.create_task(service.read(1, b"a1"))
+    await asyncio.sleep(0.05)
+    await service.close()
+    release.set()
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(read, 1)
+
+
+def test_preprocess():
+    """Test the OCR preprocessing crops, inverts, binarises and splits images."""
+    from PIL import Image, ImageDraw
+
+    img = Image.new("RGB", (4000, 8000), "black")
+    ImageDraw.Draw(img).rectangle((1000, 1000, 3000, 7000), fill="white")
+    ImageDraw.Draw(img).rectangle((1500, 1500, 2500, 6500), fill="black")
+    strips = query.preprocess(img)
+    assert all(abs(strip.width - (1000 + 2 * query.OCR_MARGIN)) <= 2 for strip in strips)  # downscaled by half
+    assert sum(strip.height for strip in strips) > 3000 + 2 * query.OCR_MARGIN
+    assert all(strip.height <= query.OCR_STRIP_HEIGHT for strip in strips)
+    assert len(strips) == 2
+    assert set(strips[0].getdata()) == {0, 255}
+    assert strips[0].getpixel((0, 0)) == 255  # inverted to dark on light
+
+    small = Image.new("L", (100, 50), "white")
+    ImageDraw.Draw(small).rectangle((20, 20, 80, 30), fill="black")
+    (strip,) = query.preprocess(small, binarise=False)
+    assert abs(strip.width - (180 + 2 * query.OCR_MARGIN)) <= 5  # upscaled threefold, with some blur
+
+
+def test_join_strips():
+    """Test the lines read twice in the strip overlap are dropped."""
+    assert query.join_strips(["a\nb\nc\n", "c\nd\n", "e"]) == "a\nb\nc\nd\ne"
+    assert query.join_strips(["a\nb", "b \nc"]) == "a\nb\nc"
+    assert query.join_strips(["a", "b"]) == "a\nb"
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+import asyncio
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import discord
+import pytest
+from PIL import Image
+
+from charbot import card, render
+
+
+CARD = render.CardJob(level=2, base_rep=10, current_rep=40, completed_rep=110, pool_name="Pool", reward="Reward")
+
+
+def test_jobs_draw_the_same_images():
+    """Test the jobs draw what calling the renderers directly does, and survive being sent to a worker."""
+    assert CARD.draw().tobytes() == Image.open(card.generate_card(**CARD._asdict())).tobytes()
+    profile = render.ProfileJob(Image.new("RGBA", (180, 180), "red"), 3, 100, 150, 200, 4, "Name#0001", "idle")
+    expected = Image.open(card.generate_profile(**profile._asdict())).tobytes()
+    assert pickle.loads(pickle.dumps(profile)).draw().tobytes() == expected
+    banner = render.BannerJob(discord.Color.blue(), "Name", Image.new("RGBA", (128, 128), "red"), "Quote", 1)
+    assert pickle.loads(pickle.dumps(banner)).draw().size == (1000, 250)
+    assert render.TicTacToeJob((((0, 0), "X"), ((10, 10), "O"))).draw().mode == "RGBA"
+    board = render.MinesweeperJob(b"\x00\xff\x00" * 4, (2, 2)).draw()
+    assert board.size == (2, 2)
+    assert board.getpixel((1, 1)) == (0, 255, 0)
+
+
+@pytest.mark.parametrize("encoding", list(render.ENCODINGS.values()), ids=list(render.ENCODINGS))
+def test_encodings_are_lossless(encoding: render.Encoding):
+    """Test every encoding gives back the same pixels, whether or not the image fits in a palette."""
+    few_colors = render.TicTacToeJob((((0, 0), "X"), ((351, 351), "O"))).draw()
+    many_colors = CARD.draw()
+    for image in (few_colors, many_colors):
+        encoded = Image.open(BytesIO(render.encode(image, encoding)))
+        assert encoded.format == encoding.format
+        assert encoded.convert("RGBA").tobytes() == image.tobytes()
+    if encoding.palette:
+        assert Image.open(BytesIO(render.encode(few_colors, encoding))).mode == "P"
+    assert render.filename(render.CardJob, "pool") == "pool.webp"
+
+
+def test_benchmark():
+    """Test the benchmark tries every encoding on every image, and marks the ones in use."""
+    results = render.benchmark({"tictactoe": render.TicTacToeJob(())}, repeat=1)
+    assert [result.encoding for result in results] == list(render.ENCODINGS)
+    assert [result.encoding for result in results if result.chosen] == ["webp"]
+    report = render.format_benchmark(results).splitlines()
+    assert len(report) == len(render.ENCODINGS) + 1
+    assert report[5].split()[1] == "webp*"
+
+
+@pytest.mark.asyncio
+async def test_render_service_back_pressure(monkeypatch):
+    """Test only one job per worker renders at once, and jobs past the limit are refused rather than queued."""
+    monkeypatch.setattr(render.RenderService, "_new_executor", lambda self: ThreadPoolExecutor(self.workers))
+    release = threading.Event()
+    running = 0
+    most_running = 0
+
+    class SlowJob:
+        encoding = render.PNG
+
+        def draw(self) -> Image.Image:
+            nonlocal running, most_running
+            running += 1
+            most_running = max(most_running, running)
+            release.wait(1)
+            running -= 1
+            return Image.new("L", (1, 1))
+
+    service = render.RenderService(workers=2, max_pending=3)
+    await service.start()
+    tasks = [asyncio.create_task(service.render(SlowJob())) for _ in range(3)]
+    await asyncio.sleep(0.05)
+    assert service.pending == 3
+    with pytest.raises(render.RenderQueueFull):
+        await service.render(SlowJob())
+    release.set()
+    expected = render.encode(Image.new("L", (1, 1)), render.PNG)
+    assert [result.getvalue() for result in await asyncio.gather(*tasks)] == [expected] * 3
+    assert most_running == 2
+    assert service.pending == 0
+    assert service.timings["SlowJob"].count == 3
+    await service.close()
+
+
+@pytest.mark.asyncio
+async def test_render_service_workers():
+    """Test jobs render the same in the worker processes."""
+    service = render.RenderService(workers=1)
+    await service.start()
+    try:
+        assert (await service.render(CARD)).getvalue() == render.render_job(CARD)
+    finally:
+        await service.close()
+
+
+@pytest.mark.asyncio
+async def test_render_service_replaces_broken_pool_once(monkeypatch):
+    """Test a broken pool is shut down and replaced once, however many renders saw it break."""
+    from concurrent.futures.process import BrokenProcessPool
+
+    both_running = threading.Barrier(2, timeout=1)
+
+    def die() -> None:
+        both_running.wait()
+        raise BrokenProcessPool("worker died")
+
+    class BrokenExecutor(ThreadPoolExecutor):
+        def submit(self, fn, /, *args, **kwargs):
+            return super().submit(die)
+
+    made: list[ThreadPoolExecutor] = []
+
+    def new_executor(self) -> ThreadPoolExecutor:
+        made.append(BrokenExecutor(self.workers) if not made else ThreadPoolExecutor(self.workers))
+        return made[-1]
+
+    monkeypatch.setattr(render.RenderService, "_new_executor", new_executor)
+    service = render.RenderService(workers=2, max_pending=2)
+    service._executor = new_executor(service)
+    results = await asyncio.gather(*(service.render(CARD) for _ in range(2)), return_exceptions=True)
+    assert all(isinstance(result, BrokenProcessPool) for result in results)
+    assert len(made) == 2
+    assert made[0]._shutdown
+    await service.close()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+from datetime import timedelta
+
+import discord
+import pytest
+from asyncpg import Pool
+from discord.utils import utcnow
+from pytest_mock import MockerFixture
+
+from charbot import CBot, reputation_admin
+from charbot.scheduler import Scheduler
+
+
+@pytest.mark.asyncio
+async def test_deal_expiry_scheduling(mocker: MockerFixture):
+    """Test the expiry job is only moved when a role is given that expires before it's due."""
+    bot = mocker.AsyncMock(spec=CBot)
+    bot.tree = mocker.Mock()
+    bot.scheduler = Scheduler(mocker.AsyncMock())
+    cog = reputation_admin.ReputationAdmin(bot)
+    week, fortnight, now = utcnow() + timedelta(days=7), utcnow() + timedelta(days=14), utcnow()
+    cog._schedule_deal_expiry(week)
+    cog._schedule_deal_expiry(fortnight)
+    assert bot.scheduler.jobs["deal_role_expiry"].next_run == week
+    cog._schedule_deal_expiry(now)
+    assert bot.scheduler.jobs["deal_role_expiry"].next_run == now
+    assert len(bot.scheduler.jobs) == 1
+
+
+@pytest.mark.asyncio
+async def test_expire_deal_roles_retries(mocker: MockerFixture):
+    """Test the expiry job is scheduled again to retry when expiring the roles fails."""
+    bot = mocker.AsyncMock(spec=CBot)
+    bot.tree = mocker.Mock()
+    bot.pool = mocker.Mock()
+    bot.pool.acquire.side_effect = OSError("connection refused")
+    bot.scheduler = Scheduler(mocker.AsyncMock())
+    cog = reputation_admin.ReputationAdmin(bot)
+    before = utcnow()
+    await cog._expire_deal_roles()
+    next_run = bot.scheduler.jobs["deal_role_expiry"].next_run
+    assert before + timedelta(minutes=1) <= next_run <= utcnow() + timedelta(minutes=1)
+
+
+@pytest.mark.asyncio
+async def test_expire_deal_roles(mocker: MockerFixture, database: Pool):
+    """Test every due deal role is deleted in one batch, and the job is scheduled for the next one."""
+    bot = mocker.AsyncMock(spec=CBot)
+    bot.tree = mocker.Mock()
+    bot.pool = database
+    bot.scheduler = Scheduler(database)
+    cog = reputation_admin.ReputationAdmin(bot)
+    now = utcnow()
+    await database.executemany(
+        "INSERT INTO deal_no_deal (user_id, role_id, until) VALUES ($1, $2, $3)",
+        [(1, 11, now - timedelta(minutes=1)), (2, 12, now - timedelta(seconds=1)), (3, 13, now + timedelta(days=1))],
+    )
+    await cog.cog_load()
+    assert bot.scheduler.jobs["deal_role_expiry"].next_run == now - timedelta(minutes=1)
+    roles = {role_id: mocker.AsyncMock(spec=discord.Role) for role_id in (11, 12, 13)}
+    roles[11].delete.side_effect = discord.HTTPException(mocker.Mock(status=500, reason="Internal Server Error"), "")
+    guild = mocker.Mock(spec=discord.Guild)
+    guild.get_role.side_effect = roles.get
+    bot.get_guild = mocker.Mock(return_value=guild)
+    await cog._expire_deal_roles()
+    roles[11].delete.assert_awaited_once()
+    roles[12].delete.assert_awaited_once()
+    roles[13].delete.assert_not_awaited()
+    assert bot.scheduler.jobs["deal_role_expiry"].next_run == now + timedelta(days=1)
+    assert await database.fetchval("SELECT array_agg(role_id) FROM deal_no_deal") == [13]
+    await database.execute("DELETE FROM deal_no_deal")
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+import asyncio
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+from asyncpg import Pool
+from discord.utils import utcnow
+from pytest_mock import MockerFixture
+
+from charbot import scheduler
+
+
+def test_every():
+    """Test interval runs stay anchored to the schedule, and skip to the next run after missing some."""
+    every = scheduler.Every(timedelta(minutes=10))
+    start = datetime(2022, 10, 1, tzinfo=timezone.utc)
+    assert every.first(start) == start
+    assert every.next(start, start + timedelta(seconds=3)) == start + timedelta(minutes=10)
+    assert every.next(start, start + timedelta(minutes=35)) == start + timedelta(minutes=40)
+    assert every.next(start, start - timedelta(seconds=1)) == start + timedelta(minutes=10)
+
+
+def test_daily():
+    """Test daily runs are the next of the times, in their own timezone."""
+    daily = scheduler.Daily((time(9, tzinfo=ZoneInfo("America/Detroit")), time(20)))
+    now = datetime(2022, 10, 1, 12, tzinfo=timezone.utc)  # 8am in Detroit
+    assert daily.first(now) == datetime(2022, 10, 1, 13, tzinfo=timezone.utc)
+    assert daily.next(daily.first(now), now) == datetime(2022, 10, 1, 20, tzinfo=timezone.utc)
+    assert daily.next(now, datetime(2022, 10, 1, 21, tzinfo=timezone.utc)) == datetime(
+        2022, 10, 2, 13, tzinfo=timezone.utc
+    )
+
+
+@pytest.mark.asyncio
+async def test_one_off_jobs(mocker: MockerFixture):
+    """Test one-off jobs run in order of when they're due, and cancelled or replaced ones don't run."""
+    sched = scheduler.Scheduler(mocker.AsyncMock())
+    ran: list[str] = []
+    done = asyncio.Event()
+
+    def job(name: str):
+        async def callback():
+            ran.append(name)
+            if name == "last":
+                done.set()
+
+        return callback
+
+    now = utcnow()
+    sched.schedule_once("last", now + timedelta(milliseconds=50), job("last"))
+    sched.schedule_once("second", now + timedelta(milliseconds=20), job("second"))
+    sched.schedule_once("first", now - timedelta(seconds=1), job("first"))
+    sched.schedule_once("cancelled", now, job("cancelled"))
+    sched.schedule_once("replaced", now + timedelta(days=1), job("stale"))
+    sched.schedule_once("replaced", now + timedelta(milliseconds=30), job("replaced"))
+    assert sched.cancel("cancelled") is True
+    assert sched.cancel("cancelled") is False
+    sched.start()
+    await asyncio.wait_for(done.wait(), 1)
+    await sched.close()
+    assert ran == ["first", "second", "replaced", "last"]
+    assert not sched.jobs
+
+
+@pytest.mark.asyncio
+async def test_job_failures_are_recorded(mocker: MockerFixture):
+    """Test a failing job is logged and counted, and doesn't stop the scheduler."""
+    sched = scheduler.Scheduler(mocker.AsyncMock())
+    done = asyncio.Event()
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def succeed():
+        done.set()
+
+    failing = sched.schedule_once("fail", utcnow(), fail)
+    sched.schedule_once("succeed", utcnow() + timedelta(milliseconds=10), succeed)
+    sched.start()
+    await asyncio.wait_for(done.wait(), 1)
+    await sched.close()
+    assert failing.stats.runs == 1
+    assert failing.stats.failures == 1
+    assert failing.stats.last_lateness >= 0
+
+
+@pytest.mark.asyncio
+async def test_recurring_jobs(database: Pool):
+    """Test recurring jobs keep their schedule in the database, are claimed once, and skip old missed runs."""
+    sched = scheduler.Scheduler(database)
+    runs = 0
+    ran = asyncio.Event()
+
+    async def callback():
+        nonlocal runs
+        runs += 1
+        ran.set()
+
+    job = await sched.register("test_job", callback, scheduler.Every(timedelta(hours=1)))
+    sched.start()
+    await asyncio.wait_for(ran.wait(), 1)
+    stored = await database.fetchrow("SELECT next_run, last_run FROM scheduled_jobs WHERE name = 'test_job'")
+    assert stored["next_run"] == job.next_run
+    assert stored["last_run"] is not None
+    # a second instance registering the same job keeps the stored schedule, rather than running it again now
+    other = scheduler.Scheduler(database)
+    assert (await other.register("test_job", callback, scheduler.Every(timedelta(hours=1)))).next_run == job.next_run
+    await sched.close()
+
+    await database.execute(
+        "UPDATE scheduled_jobs SET next_run = $1 WHERE name = 'test_job'", utcnow() - timedelta(days=1)
+    )
+    missed = await other.register(
+        "test_job", callback, scheduler.Every(timedelta(hours=1)), misfire_grace=timedelta(minutes=5)
+    )
+    other.start()
+    for _ in range(100):
+        if missed.stats.misfires:
+            break
+        await asyncio.sleep(0.01)
+    await other.close()
+    assert runs == 1
+    assert missed.stats.misfires == 1
+    assert missed.next_run > utcnow()
+    await database.execute("DELETE FROM scheduled_jobs")
+
+
+def test_daily_needs_times():
+    """Test a daily trigger without any times is refused."""
+    with pytest.raises(ValueError):
+        scheduler.Daily(())
+
+
+@pytest.mark.asyncio
+async def test_schedule_read_failure_retries(mocker: MockerFixture):
+    """Test failing to read the stored schedule of a run claimed elsewhere retries the job, not kill the runner."""
+    pool = mocker.AsyncMock()
+    pool.fetchval.side_effect = [None, OSError("connection lost")]
+    sched = scheduler.Scheduler(pool)
+    now = utcnow()
+    job = sched._add(scheduler.Job("every", mocker.AsyncMock(), scheduler.Every(timedelta(hours=1)), now, None))
+    sched._heap.clear()
+    await sched._dispatch(job, now)
+    assert job.stats.skipped == 1
+    assert job.next_run >= now + scheduler.RETRY_AFTER
+    assert sched._heap[0][2] is job
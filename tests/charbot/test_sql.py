@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+import pytest
+from asyncpg import Pool
+from pytest_mock import MockerFixture
+
+from charbot import _Config, sql  # skipcq
+
+
+def test_statement_registry():
+    """Test registering a statement gives it back, and a name can't be reused for a different statement."""
+    assert sql.statement("xp_user", sql.XP_USER) is sql.XP_USER
+    with pytest.raises(ValueError):
+        sql.statement("xp_user", "SELECT 1")
+    assert sql.STATEMENTS["xp_user"] == sql.XP_USER
+
+
+def test_create_pool(mocker: MockerFixture, monkeypatch):
+    """Test each lane gets its own pool size, with a statement cache big enough to keep its statements prepared."""
+    monkeypatch.setattr(
+        _Config, "__getitem__", lambda self, key: {"host": "", "user": "", "password": "", "database": ""}
+    )
+    create_pool = mocker.patch("asyncpg.create_pool")
+    sql.create_pool(sql.XP)
+    kwargs = create_pool.call_args.kwargs
+    assert (kwargs["min_size"], kwargs["max_size"]) == (sql.XP.min_size, sql.XP.max_size)
+    assert kwargs["statement_cache_size"] >= len(sql.STATEMENTS)
+    assert sql.GENERAL.max_size + sql.XP.max_size <= 100
+
+
+@pytest.mark.asyncio
+async def test_pool_prepares_statements(mocker: MockerFixture, monkeypatch):
+    """Test each new connection has every registered statement prepared into its cache, then the lane's own setup."""
+    monkeypatch.setattr(
+        _Config, "__getitem__", lambda self, key: {"host": "", "user": "", "password": "", "database": ""}
+    )
+    create_pool = mocker.patch("asyncpg.create_pool")
+    init = mocker.AsyncMock()
+    sql.create_pool(sql.XP, init=init)
+    conn = mocker.AsyncMock()
+    await create_pool.call_args.kwargs["init"](conn)
+    assert [call.args[0] for call in conn._prepare.await_args_list] == list(sql.STATEMENTS.values())
+    assert all(call.kwargs["use_cache"] for call in conn._prepare.await_args_list)
+    init.assert_awaited_once_with(conn)
+
+
+@pytest.mark.asyncio
+async def test_statements_prepare(database: Pool):
+    """Test every registered statement is valid against the schema."""
+    async with database.acquire() as conn:
+        await sql.prepare_statements(conn)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+import asyncio
+import contextvars
+import logging
+
+import pytest
+from asyncpg import Pool
+from asyncpg.connection import LoggedQuery
+
+from charbot import sql_stats
+
+
+def logged(query: str, elapsed: float, exception: BaseException | None = None) -> LoggedQuery:
+    """Make the record asyncpg gives query loggers."""
+    return LoggedQuery(query, (), None, elapsed, exception, None, None)
+
+
+def test_record_tags():
+    """Test statements are recorded by lane, what ran them and their text, whitespace aside."""
+    stats = sql_stats.QueryStats()
+    stats.record("general", logged("SELECT  *\n FROM users", 0.01))
+
+    def in_command() -> None:
+        sql_stats.QUERY_TAG.set("command:Levels.rank")
+        stats.record("xp", logged("SELECT * FROM users", 0.02))
+
+    contextvars.copy_context().run(in_command)
+    stats.record("general", logged("SELECT * FROM users", 0.03))
+    assert {key: histogram.count for key, histogram in stats.histograms.items()} == {
+        sql_stats.StatementKey("general", "other", "SELECT * FROM users"): 2,
+        sql_stats.StatementKey("xp", "command:Levels.rank", "SELECT * FROM users"): 1,
+    }
+    assert stats.top(1)[0][0].lane == "general"
+    report = stats.format().splitlines()
+    assert len(report) == 5
+    assert report[1].split()[:2] == ["2", "40ms"]
+
+
+@pytest.mark.asyncio
+async def test_explain_sampling(mocker):
+    """Test only sampled, slow, successful data statements are explained, each once."""
+    stats = sql_stats.QueryStats(slow=0.1, sample_rate=0.5, rand=iter([0.9, 0.1, 0.1]).__next__)
+    explain = mocker.patch.object(stats, "_explain", mocker.AsyncMock())
+    stats.record("general", logged("SELECT 1", 1.0))
+    explain.assert_not_called()
+    stats.explain_pool = mocker.Mock()
+    stats.record("general", logged("SELECT 1", 0.01))
+    stats.record("general", logged("SELECT 1", 1.0, ValueError()))
+    stats.record("general", logged("BEGIN;", 1.0))
+    stats.record("general", logged("SELECT 1", 1.0))
+    explain.assert_not_called()
+    stats.record("general", logged("SELECT 1", 1.0))
+    await asyncio.sleep(0)
+    explain.assert_awaited_once()
+    stats.record("general", logged("SELECT 1", 1.0))
+    explain.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_installed_stats(database: Pool, caplog):
+    """Test the installed logger times statements on a connection, and a slow one's plan is logged."""
+    stats = sql_stats.QueryStats(slow=0, sample_rate=1)
+    stats.explain_pool = database
+    async with database.acquire() as conn:
+        await stats.installer("general")(conn)
+        with caplog.at_level(logging.WARNING, "charbot.sql.explain"):
+            await conn.fetchval("SELECT $1::int", 1)
+            await asyncio.sleep(0)
+            assert stats._explaining is not None
+            await stats._explaining
+    assert [key.query for key in stats.histograms] == ["SELECT $1::int"]
+    assert "Result" in caplog.text
+
+
+def test_only_plain_selects_are_analyzed():
+    """Test statements that change or lock rows are only explained, never run again."""
+    assert sql_stats._analyzable("SELECT * FROM users WHERE id = $1")
+    assert not sql_stats._analyzable("SELECT * FROM users WHERE id = $1 FOR UPDATE")
+    assert not sql_stats._analyzable("UPDATE users SET points = points + 1 WHERE id = $1")
+    assert not sql_stats._analyzable("WITH x AS (INSERT INTO users VALUES ($1) RETURNING id) SELECT * FROM x")
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+import itertools
+
+import pytest
+
+from charbot.startup import StartupReport
+
+
+def test_startup_report():
+    """Test phases and extensions are timed, even if they fail, and ready is only marked once."""
+    clock = itertools.count().__next__
+    report = StartupReport(clock)  # started at 0
+    with report.phase("webhooks"):  # 1 to 2
+        pass
+    with pytest.raises(RuntimeError), report.extension("charbot.query"):  # 3 to 4
+        raise RuntimeError
+    with report.extension("charbot.gcal"):  # 5 to 7
+        clock()
+    assert report.phases == {"webhooks": 1}
+    assert report.extensions == {"charbot.query": 1, "charbot.gcal": 2}
+    assert report.ready() is True  # 8
+    assert report.ready() is False
+    assert report.ready_after == 8
+    lines = report.format().splitlines()
+    assert lines[0] == "Startup report:"
+    assert [line.split()[0] for line in lines[4:6]] == ["charbot.gcal", "charbot.query"]
+    assert lines[-1].split() == ["Ready", "after", "8000ms"]
@@ -6,6 +6,7 @@ import pytest
 from pytest_mock import MockerFixture
 
 from charbot.programs import tictactoe
+from charbot.render import RenderService
 from charbot.types.bot import CBot
 
 from charbot_rust.tictactoe import Difficulty, Game  # pyright: ignore[reportGeneralTypeIssues]
@@ -34,6 +35,7 @@ async def test_view_move_method(mocker: MockerFixture):
     """Test TicTacToe view move method."""
     view = tictactoe.TicTacToe(Difficulty.EASY)
     mock_interaction = mocker.AsyncMock(spec=discord.Interaction)
+    mock_interaction.client.renderer = RenderService()
     mock_interaction.user = mocker.AsyncMock(spec=discord.Member)
     mock_interaction.response = mocker.AsyncMock(spec=discord.InteractionResponse)
     await view.move(mock_interaction, view._buttons[0], 0)
@@ -49,9 +51,10 @@ async def test_view_player_win(mocker: MockerFixture):
     view.game = mocker.Mock(spec=Game)
     view.game.play = lambda position: None
     view.game.points = lambda: (1, 1)
-    view.display = lambda: None  # pyright: ignore[reportGeneralTypeIssues]
+    view.display = mocker.AsyncMock(return_value=None)
     mock_interaction = mocker.AsyncMock(spec=discord.Interaction)
     mock_interaction.client = mocker.AsyncMock(spec=CBot)
+    mock_interaction.client.renderer = RenderService()
     mock_interaction.user = mocker.AsyncMock(spec=discord.Member)
     mock_interaction.response = mocker.AsyncMock(spec=discord.InteractionResponse)
     await view.move(mock_interaction, view._buttons[0], 0)
@@ -70,12 +73,13 @@ async def test_view_bot_win(mocker: MockerFixture):
     view.game.has_player_lost = lambda: True
     view.game.has_player_won = lambda: False
     view.game.points = lambda: (1, 1)
-    view.display = lambda: None  # pyright: ignore[reportGeneralTypeIssues]
+    view.display = mocker.AsyncMock(return_value=None)
     view.top_left.disabled = True
     view.mid_left.disabled = True
     view.mid_mid.disabled = True
     mock_interaction = mocker.AsyncMock(spec=discord.Interaction)
     mock_interaction.client = mocker.AsyncMock(spec=CBot)
+    mock_interaction.client.renderer = RenderService()
     mock_interaction.user = mocker.AsyncMock(spec=discord.Member)
     mock_interaction.response = mocker.AsyncMock(spec=discord.InteractionResponse)
     await view.move(mock_interaction, view._buttons[7], 7)
@@ -97,12 +101,13 @@ async def test_view_tie(mocker: MockerFixture):
     view.game.has_player_won = lambda: False
     view.game.is_draw = lambda: True
     view.game.points = lambda: (1, 1)
-    view.display = lambda: None  # pyright: ignore[reportGeneralTypeIssues]
+    view.display = mocker.AsyncMock(return_value=None)
     for button in view._buttons:
         button.disabled = True
     view.top_mid.disabled = False
     mock_interaction = mocker.AsyncMock(spec=discord.Interaction)
     mock_interaction.client = mocker.AsyncMock(spec=CBot)
+    mock_interaction.client.renderer = RenderService()
     mock_interaction.user = mocker.AsyncMock(spec=discord.Member)
     mock_interaction.response = mocker.AsyncMock(spec=discord.InteractionResponse)
     await view.move(mock_interaction, view._buttons[1], 1)
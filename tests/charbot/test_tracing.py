@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+from charbot.tracing import DEFAULT_RATE, TraceSampler
+
+
+def context(name: str, parent_sampled: bool | None = None) -> dict:
+    """Make the sampling context sentry passes the sampler."""
+    return {"transaction_context": {"name": name, "op": "event"}, "parent_sampled": parent_sampled}
+
+
+def test_sampler_rates():
+    """Test hot handlers are sampled sparsely, rare work fully, and the rest at the default rate."""
+    sampler = TraceSampler()
+    assert sampler(context("event:message")) == 0.01
+    assert sampler(context("command:Admin.sensitive add")) == 1.0
+    assert sampler(context("job:giveaway_end")) == 1.0
+    assert sampler(context("command:Leveling.rank")) == DEFAULT_RATE
+    assert sampler({"transaction_context": {}}) == DEFAULT_RATE
+
+
+def test_sampler_follows_parent():
+    """Test a transaction continuing a trace keeps the trace's decision."""
+    sampler = TraceSampler()
+    assert sampler(context("event:message", parent_sampled=True)) == 1.0
+    assert sampler(context("job:giveaway_end", parent_sampled=False)) == 0.0
+
+
+def test_sampler_from_config():
+    """Test configured rates are checked before the built in ones, which still apply otherwise."""
+    sampler = TraceSampler.from_config(
+        {"default": 0.5, "rates": {"event:message": 0.001, "command:Leveling.*": 0.2, "event:*": 0.3}}
+    )
+    assert sampler.rate("event:message") == 0.001
+    assert sampler.rate("command:Leveling.rank") == 0.2
+    assert sampler.rate("event:typing") == 0.3
+    assert sampler.rate("job:giveaway_end") == 1.0
+    assert sampler.rate("command:Roll.roll") == 0.5
+    assert TraceSampler.from_config({}).rate("command:Roll.roll") == DEFAULT_RATE
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+import asyncio
+import pathlib
+import time
+import traceback
+
+import pytest
+
+from charbot import watchdog
+
+PACKAGE = pathlib.Path(watchdog.__file__).parent
+
+
+def stack(*frames: tuple[str, int, str]) -> traceback.StackSummary:
+    """Make a stack, outermost frame first."""
+    return traceback.StackSummary.from_list([(filename, lineno, name, None) for filename, lineno, name in frames])
+
+
+def test_observe_blames_the_bots_code():
+    """Test a stall is blamed on the innermost frame of the bot's code, and short lags aren't stalls."""
+    dog = watchdog.Watchdog(threshold=0.1)
+    blocked = stack(
+        ("/usr/lib/python3.11/asyncio/events.py", 80, "_run"),
+        (str(PACKAGE / "dice.py"), 50, "roll"),
+        ("/usr/lib/python3.11/random.py", 10, "randint"),
+    )
+    dog.observe(0.01, None)
+    dog.observe(0.3, blocked)
+    dog.observe(0.5, blocked)
+    dog.observe(0.2, None)
+    assert dog.lag.count == 4
+    assert list(dog.offenders) == ["charbot/dice.py:50 in roll", "unknown, over before it was caught"]
+    offender = dog.top(1)[0]
+    assert (offender.stalls, offender.worst) == (2, 0.5)
+    assert offender.total == pytest.approx(0.8)
+    report = dog.format(depth=2).splitlines()
+    assert report[1].endswith("charbot/dice.py:50 in roll")
+    assert report[2].strip().startswith("roll")
+    assert len(report) == 5
+
+
+@pytest.mark.asyncio
+async def test_watchdog_catches_blocking_call():
+    """Test blocking the loop is caught while it's happening, and blamed on the blocking coroutine."""
+    dog = watchdog.Watchdog(threshold=0.05, interval=0.01)
+    dog.start()
+
+    async def blocking() -> None:
+        time.sleep(0.3)
+
+    try:
+        await asyncio.sleep(0.05)
+        await blocking()
+        await asyncio.sleep(0.05)
+    finally:
+        dog.stop()
+    assert [offender.location.rsplit(" in ", 1)[1] for offender in dog.offenders.values()] == ["blocking"]
+    assert dog.top()[0].worst >= 0.25
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# SPDX-FileCopyrightText: 2022 Bluesy1 <68259537+Bluesy1@users.noreply.github.com>
+# SPDX-License-Identifier: MIT
+import asyncio
+
+import discord
+import pytest
+from pytest_mock import MockerFixture
+
+from charbot.webhooks import WebhookSink
+
+
+class Clock:
+    """A clock that only moves when told to."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_repeats_are_coalesced(mocker: MockerFixture):
+    """Test repeats of a queued message are counted, and repeats of a sent one are held for the window."""
+    webhook = mocker.AsyncMock(spec=discord.Webhook)
+    clock = Clock()
+    sink = WebhookSink(webhook, window=60, clock=clock)
+    sink.post("boom")
+    sink.post("boom")
+    sink.post("other")
+    assert sink.pending == 2
+    await sink._send(*sink._take())
+    assert webhook.send.await_args.kwargs["content"] == "boom (×2 in the last 1s)\nother"
+    for _ in range(37):
+        clock.now += 1
+        sink.post("boom")
+    assert sink._take() is None  # held until a minute after it was last sent
+    clock.now = 60
+    await sink._send(*sink._take())
+    assert webhook.send.await_args.kwargs["content"] == "boom (×37 in the last 59s)"
+    assert (sink.sent, sink.dropped) == (3, 0)
+    clock.now = 200
+    sink.post("new")
+    await sink._send(*sink._take())
+    assert len(sink._recent) == 1  # the keys of messages sent over a window ago are dropped
+
+
+@pytest.mark.asyncio
+async def test_embeds_are_batched(mocker: MockerFixture):
+    """Test at most 10 embeds go in a send, and the rest wait for the next one."""
+    webhook = mocker.AsyncMock(spec=discord.Webhook)
+    sink = WebhookSink(webhook, username="CharB0T", clock=Clock())
+    for i in range(12):
+        sink.post(embed=discord.Embed(title=str(i)))
+    await sink.close()
+    assert webhook.send.await_count == 2
+    first, second = (call.kwargs for call in webhook.send.await_args_list)
+    assert [embed.title for embed in first["embeds"]] == [str(i) for i in range(10)]
+    assert len(second["embeds"]) == 2
+    assert first["username"] == "CharB0T"
+
+
+@pytest.mark.asyncio
+async def test_failed_sends_are_retried_then_dropped(mocker: MockerFixture):
+    """Test a send failing on discord's end is retried, and one discord rejects is dropped."""
+    mocker.patch("asyncio.sleep", mocker.AsyncMock())
+    response = mocker.Mock(status=503, reason="Service Unavailable")
+    webhook = mocker.AsyncMock(spec=discord.Webhook)
+    webhook.send.side_effect = [discord.HTTPException(response, "unavailable"), None]
+    sink = WebhookSink(webhook, clock=Clock())
+    sink.post("boom")
+    await sink.close()
+    assert webhook.send.await_count == 2
+    assert sink.sent == 1
+    response.status = 400
+    webhook.send.side_effect = discord.HTTPException(response, "bad request")
+    sink.post("bad")
+    await sink.close()
+    assert webhook.send.await_count == 3
+    assert sink.dropped == 1
+
+
+@pytest.mark.asyncio
+async def test_background_task_sends(mocker: MockerFixture):
+    """Test posting wakes the background task, which sends without the poster waiting on it."""
+    webhook = mocker.AsyncMock(spec=discord.Webhook)
+    sink = WebhookSink(webhook, interval=0)
+    sink.start()
+    sink.post("hello")
+    webhook.send.assert_not_awaited()
+    for _ in range(10):
+        await asyncio.sleep(0)
+    webhook.send.assert_awaited_once()
+    await sink.close()